@@ -0,0 +1,317 @@
+"""
+Benchmarks for rrcf.
+
+Measures throughput, per-operation latency percentiles and peak memory
+(tracemalloc) of tree construction, streaming updates, scoring, serialization
+and shingling. Each parameter (tree size, dimension, duplicate rate and number
+of trees) is swept in turn around a default configuration, on synthetic data
+and on the bundled NYC taxi data set.
+
+Usage:
+------
+# Run all benchmarks and write results to a JSON file
+$ python benchmarks/run.py --output results.json
+
+# Compare against a stored baseline, failing if any benchmark regressed
+$ python benchmarks/run.py --baseline benchmarks/baseline.json --fail
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import rrcf
+
+TAXI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'resources', 'nyc_taxi.csv')
+
+# Default configuration, and values swept one parameter at a time
+DEFAULTS = {'tree_size': 1024, 'ndim': 3, 'duplicates': 0.0, 'num_trees': 10}
+SWEEPS = {'tree_size': [256, 1024, 4096], 'ndim': [1, 3, 10],
+          'duplicates': [0.0, 0.5], 'num_trees': [1, 10, 50]}
+QUICK_SWEEPS = {'tree_size': [256, 1024], 'ndim': [3], 'duplicates': [0.0, 0.5],
+                'num_trees': [10]}
+# Fewest operations timed per round of a benchmark, so that percentiles are
+# meaningful, and number of rounds, to measure run-to-run noise
+MIN_SAMPLES = 30
+ROUNDS = 3
+# Added to peak memory before comparing, so that changes of a few KiB in small
+# peaks are not counted
+MEMORY_SLACK_KIB = 64
+
+
+def synthetic(n, ndim, duplicates, seed=0):
+    """
+    Returns n standard normal points, of which a fraction are copies of others.
+    """
+    rng = np.random.RandomState(seed)
+    X = rng.randn(n, ndim)
+    num_duplicates = int(duplicates * n)
+    if num_duplicates:
+        rows = rng.choice(n, size=num_duplicates, replace=False)
+        X[rows] = X[rng.randint(n - num_duplicates, size=num_duplicates)]
+    return X
+
+
+def taxi(shingle_size=48):
+    """
+    Returns the NYC taxi series, shingled.
+    """
+    values = np.genfromtxt(TAXI, delimiter=',', skip_header=1, usecols=1)
+    return rrcf.shingle_array(values, shingle_size)
+
+
+def measure(name, params, setup, op, repeat):
+    """
+    Times op(state, k) for k in range(repeat) on the state returned by setup,
+    in ROUNDS rounds with a fresh state each, then repeats a round under
+    tracemalloc to find peak memory. At least MIN_SAMPLES operations are timed
+    per round.
+
+    The median latency (p50) is the median over rounds, so that a round
+    slowed down by the machine does not shift it. Its noise is the larger of
+    the relative half-width of a 95% confidence interval from the order
+    statistics of all samples, and half the relative spread of the rounds.
+    As in timeit, garbage collection is disabled while timing, so that the
+    garbage left by other benchmarks does not add to the latency.
+    """
+    repeat = max(repeat, MIN_SAMPLES)
+    latencies = np.empty((ROUNDS, repeat))
+    seconds = 0.
+    for r in range(ROUNDS):
+        state = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for k in range(repeat):
+                t = time.perf_counter()
+                op(state, k)
+                latencies[r, k] = time.perf_counter() - t
+            seconds += time.perf_counter() - start
+        finally:
+            gc.enable()
+    state = setup()
+    tracemalloc.start()
+    for k in range(repeat):
+        op(state, k)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rounds = np.median(latencies, axis=1)
+    p50 = np.median(rounds)
+    latencies = latencies.ravel()
+    latency_us = np.percentile(latencies, [90, 99]) * 1e6
+    # Ranks bounding the median with 95% confidence
+    ordered = np.sort(latencies)
+    size = ordered.size
+    half = 1.96 * np.sqrt(size) / 2
+    low = ordered[max(int(np.floor(size / 2 - half)), 0)]
+    high = ordered[min(int(np.ceil(size / 2 + half)), size - 1)]
+    noise = max((high - low) / 2, (rounds.max() - rounds.min()) / 2) / p50
+    return {'name': name, 'params': params, 'ops': size, 'seconds': seconds,
+            'throughput': size / seconds,
+            'latency_us': {'p50': p50 * 1e6, 'p90': latency_us[0],
+                           'p99': latency_us[1], 'max': latencies.max() * 1e6},
+            'noise': noise, 'peak_kib': peak / 1024}
+
+
+def tree_benchmarks(X, params, repeat):
+    """
+    Benchmarks operations on a single tree built from X.
+    """
+    n = X.shape[0] // 2
+    build, stream = X[:n], X[n:]
+    repeat = min(repeat, stream.shape[0])
+    results = []
+
+    def construct(state, k):
+        rrcf.RCTree(build)
+
+    results.append(measure('construct', params, lambda: None, construct,
+                           repeat // 100))
+
+    def insert(tree, k):
+        tree.insert_point(stream[k], index=n + k)
+
+    results.append(measure('insert_point', params,
+                           lambda: rrcf.RCTree(build, random_state=0),
+                           insert, repeat))
+
+    def forget(tree, k):
+        tree.forget_point(k)
+
+    results.append(measure('forget_point', params,
+                           lambda: rrcf.RCTree(build, random_state=0),
+                           forget, repeat))
+    tree = rrcf.RCTree(build, random_state=0)
+
+    def codisp(tree, k):
+        tree.codisp(k)
+
+    results.append(measure('codisp', params, lambda: tree, codisp, repeat))
+
+    def codisp_with_cut_dimension(tree, k):
+        tree.codisp_with_cut_dimension(k)
+
+    results.append(measure('codisp_with_cut_dimension', params, lambda: tree,
+                           codisp_with_cut_dimension, repeat))
+    obj = tree.to_dict()
+
+    def to_dict(tree, k):
+        tree.to_dict()
+
+    def from_dict(tree, k):
+        rrcf.RCTree.from_dict(obj)
+
+    results.append(measure('to_dict', params, lambda: tree, to_dict,
+                           repeat // 100))
+    results.append(measure('from_dict', params, lambda: tree, from_dict,
+                           repeat // 100))
+    return results
+
+
+def forest_benchmarks(X, params, repeat):
+    """
+    Benchmarks streaming updates of a forest on X.
+    """
+    repeat = min(repeat, X.shape[0])
+    num_trees = params['num_trees']
+
+    def setup():
+        forest = rrcf.RCForest(num_trees=num_trees,
+                               tree_size=params['tree_size'], random_state=0)
+        for index in range(params['tree_size']):
+            forest.update(X[index % X.shape[0]], -index - 1)
+        return forest
+
+    def update(forest, k):
+        forest.update(X[k], k)
+
+    return [measure('forest_update', params, setup, update, repeat)]
+
+
+def shingle_benchmarks(repeat):
+    """
+    Benchmarks shingling of the taxi series.
+    """
+    values = np.genfromtxt(TAXI, delimiter=',', skip_header=1, usecols=1)
+    params = {'data': 'taxi', 'n': values.size, 'shingle_size': 48}
+
+    def shingle(state, k):
+        for _ in rrcf.shingle(values, 48):
+            pass
+
+    def shingle_list(state, k):
+        for _ in rrcf.shingle(values.tolist(), 48):
+            pass
+
+    return [measure('shingle', params, lambda: None, shingle, repeat),
+            measure('shingle_list', params, lambda: None, shingle_list,
+                    repeat)]
+
+
+def run(quick=False, repeat=1000):
+    """
+    Runs all benchmarks and returns a list of results.
+    """
+    sweeps = QUICK_SWEEPS if quick else SWEEPS
+    results = []
+    configs = []
+    for param, values in sweeps.items():
+        for value in values:
+            config = dict(DEFAULTS, **{param: value})
+            if config not in configs:
+                configs.append(config)
+    for config in configs:
+        X = synthetic(2 * config['tree_size'], config['ndim'],
+                      config['duplicates'])
+        params = dict(config, data='synthetic')
+        print('{}'.format(params), file=sys.stderr)
+        if config['num_trees'] == DEFAULTS['num_trees']:
+            results.extend(tree_benchmarks(X, params, repeat))
+        results.extend(forest_benchmarks(X, params, repeat // 10))
+    X = taxi()
+    params = dict(DEFAULTS, ndim=X.shape[1], data='taxi')
+    print('{}'.format(params), file=sys.stderr)
+    results.extend(tree_benchmarks(X, params, repeat))
+    results.extend(forest_benchmarks(X, params, repeat // 10))
+    results.extend(shingle_benchmarks(repeat // 100))
+    return results
+
+
+def key(result):
+    return json.dumps([result['name'], result['params']], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of each result from the baseline, and returns the
+    results whose median latency, or peak memory, grew by more than threshold.
+    A change in latency within the combined noise of both runs is not counted.
+    """
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        latency = result['latency_us']['p50'] / old['latency_us']['p50'] - 1
+        noise = result['noise'] + old.get('noise', 0.)
+        memory = ((result['peak_kib'] + MEMORY_SLACK_KIB)
+                  / (old['peak_kib'] + MEMORY_SLACK_KIB) - 1)
+        regressed = ((latency > threshold and latency > noise)
+                     or memory > threshold)
+        print('{:<28} {:>+7.1%} p50 (noise {:>5.1%}) {:>+7.1%} memory {} {}'
+              .format(result['name'], latency, noise, memory,
+                      json.dumps(result['params'], sort_keys=True),
+                      'REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--output', help='file to write JSON results to')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change counted as a regression')
+    parser.add_argument('--fail', action='store_true',
+                        help='exit with status 1 if any benchmark regressed')
+    parser.add_argument('--quick', action='store_true',
+                        help='run a reduced sweep')
+    parser.add_argument('--repeat', type=int, default=1000,
+                        help='number of operations timed per benchmark')
+    args = parser.parse_args(argv)
+    results = run(quick=args.quick, repeat=args.repeat)
+    report = {'meta': {'python': platform.python_version(),
+                       'numpy': np.__version__, 'rrcf': rrcf.__version__,
+                       'platform': platform.platform(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=1)
+    else:
+        for result in results:
+            print('{:<28} {:>12.1f} ops/s  p50 {:>9.1f} us (+/- {:>5.1%})  '
+                  'p99 {:>9.1f} us  {:>9.1f} KiB {}'.format(
+                      result['name'], result['throughput'],
+                      result['latency_us']['p50'], result['noise'],
+                      result['latency_us']['p99'], result['peak_kib'],
+                      json.dumps(result['params'], sort_keys=True)))
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
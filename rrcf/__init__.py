@@ -1,5 +1,14 @@
 from rrcf.rrcf import *
-from rrcf.shingle import shingle
+from rrcf.shingle import shingle, shingle_array, shingle_chunks, Shingler
+from rrcf.arraytree import ArrayRCTree
+from rrcf.forest import RCForest
+from rrcf.mapped import MappedRCTree
+from rrcf.parallel import ParallelRCForest
+from rrcf.detector import StreamingDetector
+from rrcf.journal import Journal
+from rrcf.stats import Stats
+from rrcf.store import PointStore
+from rrcf.aio import AsyncDetector
 import pkg_resources
 
 __version__ = pkg_resources.get_distribution('rrcf').version
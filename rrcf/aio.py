@@ -0,0 +1,198 @@
+import asyncio
+import concurrent.futures
+import numpy as np
+from rrcf.parallel import ParallelRCForest
+
+
+class AsyncDetector:
+    """
+    asyncio front-end that inserts and scores points in a forest without
+    blocking the event loop.
+
+    Batches of points are put on a bounded queue, so that producers wait once
+    the forest falls behind (backpressure). A background task takes every batch
+    waiting in the queue, up to max_batch points, and inserts them together on
+    an executor, so that the event loop only waits for the result. Each submit
+    returns a future that resolves to the anomaly scores of its batch.
+
+    Updates are applied one micro-batch at a time, in the order batches were
+    submitted. The default executor is a single thread, which keeps other
+    coroutines running between the bytecodes of an update. To spread the work
+    over several processes, pass a ParallelRCForest, which receives each
+    micro-batch in a single call.
+
+    Parameters:
+    -----------
+    forest: RCForest or ParallelRCForest
+            Forest to update (see RCForest.update).
+    max_queue: int (optional) (default=64)
+               Maximum number of batches waiting in the queue.
+    max_batch: int (optional) (default=256)
+               Maximum number of points combined into one micro-batch. A
+               larger batch is never split.
+    executor: concurrent.futures.Executor (optional) (default=None)
+              Executor to run updates on. Defaults to a new single thread
+              executor, which is shut down by close.
+    tolerance: float (optional) (default=None)
+               Tolerance for determining duplicate points.
+
+    Attributes:
+    -----------
+    forest: RCForest or ParallelRCForest
+            Forest being updated.
+    index: int
+           Index that will be assigned to the next point submitted without
+           an index.
+
+    Example:
+    --------
+    # Score batches from an async consumer
+    >>> async def consume(messages):
+            forest = rrcf.RCForest(num_trees=40, tree_size=256)
+            async with AsyncDetector(forest) as detector:
+                async for batch in messages:
+                    future = await detector.submit(batch)
+                    ...
+                    scores = await future
+    """
+
+    def __init__(self, forest, max_queue=64, max_batch=256, executor=None,
+                 tolerance=None):
+        self.forest = forest
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.tolerance = tolerance
+        self.index = 0
+        self._executor = executor
+        self._own_executor = executor is None
+        self._queue = None
+        self._task = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def submit(self, points, indexes=None):
+        """
+        Queues a batch of points for insertion, waiting while the queue is
+        full, and returns a future for their anomaly scores.
+
+        Parameters:
+        -----------
+        points: np.ndarray (k x d)
+                Points to insert (a 1-D array is treated as one point).
+        indexes: sequence of length k (optional) (default=None)
+                 Identifiers for new points in forest. Defaults to successive
+                 integers starting from self.index.
+
+        Returns:
+        --------
+        future: asyncio.Future
+                Resolves to the scores of the points (np.ndarray (k)), or to
+                the exception raised by the update. Points inserted before an
+                exception remain in the forest.
+        """
+        if self._closed:
+            raise RuntimeError('Detector has been closed.')
+        points = np.array(points, dtype=float)
+        if points.ndim == 1:
+            points = points.reshape(1, -1)
+        if indexes is None:
+            indexes = list(range(self.index, self.index + points.shape[0]))
+            self.index += points.shape[0]
+        else:
+            indexes = list(indexes)
+            if len(indexes) != points.shape[0]:
+                raise ValueError('Number of indexes must match number of '
+                                 'points.')
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.ensure_future(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((points, indexes, future))
+        return future
+
+    async def update(self, points, indexes=None):
+        """
+        Inserts a batch of points and returns their anomaly scores (see submit).
+        """
+        return await (await self.submit(points, indexes))
+
+    async def close(self):
+        """
+        Waits for queued batches to be processed, then stops the background
+        task and shuts down the default executor.
+        """
+        self._closed = True
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def _run(self):
+        """
+        Takes micro-batches from the queue and applies them on the executor.
+        """
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+        while True:
+            batch = [await self._queue.get()]
+            size = batch[0][0].shape[0]
+            while size < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                batch.append(item)
+                size += item[0].shape[0]
+            try:
+                results = await loop.run_in_executor(self._executor,
+                                                     self._process, batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            for (_, _, future), (ok, result) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _process(self, batch):
+        """
+        Updates the forest with a micro-batch, returning (True, scores) or
+        (False, exception) for each batch in it.
+        """
+        if isinstance(self.forest, ParallelRCForest):
+            points = np.concatenate([item[0] for item in batch])
+            indexes = [index for item in batch for index in item[1]]
+            try:
+                scores = self.forest.update(points, indexes,
+                                            tolerance=self.tolerance)
+            except Exception as e:
+                return [(False, e)] * len(batch)
+            splits = np.cumsum([item[0].shape[0] for item in batch])[:-1]
+            return [(True, part) for part in np.split(scores, splits)]
+        results = []
+        for points, indexes, _ in batch:
+            try:
+                scores = np.fromiter(
+                    (self.forest.update(point, index, tolerance=self.tolerance)
+                     for point, index in zip(points, indexes)),
+                    dtype=float, count=len(indexes))
+            except Exception as e:
+                results.append((False, e))
+            else:
+                results.append((True, scores))
+        return results
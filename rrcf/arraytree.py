@@ -0,0 +1,594 @@
+import numpy as np
+from rrcf.rrcf import RCTree
+
+
+class ArrayRCTree:
+    """
+    Robust random cut tree stored as a struct of arrays.
+
+    Instead of one Branch or Leaf object per node, every node is a row in a set
+    of preallocated arrays (parent, left and right child, leaf count, cut
+    dimension, cut value and a contiguous bounding box table). Leaves are rows
+    with no children, and store their point as a degenerate bounding box.
+    Storage grows by doubling when full, and rows of deleted nodes are reused.
+
+    Parameters:
+    -----------
+    X: np.ndarray (n x d) (optional)
+       Array containing n data points, each with dimension d.
+       If no data provided, an empty tree is created.
+    index_labels: sequence of length n (optional) (default=None)
+                  Labels for data points provided in X.
+                  Defaults to [0, 1, ... n-1].
+    precision: float (optional) (default=9)
+               Floating-point precision for distinguishing duplicate points.
+    random_state: int, RandomState instance or None (optional) (default=None)
+        If int, random_state is the seed used by the random number generator;
+        If RandomState instance, random_state is the random number generator;
+        If None, the random number generator is the RandomState instance used by np.random.
+    capacity: int (optional) (default=256)
+              Number of leaves to preallocate storage for.
+
+    Attributes:
+    -----------
+    root: int
+          Row of root node (-1 if tree is empty).
+    leaves: dict
+            Dict mapping each index to the row of its leaf.
+    ndim: int
+          dimension of points in the tree
+    parent, left, right: np.ndarray (int)
+                         Row of parent and children of each node (-1 if none).
+    count: np.ndarray (int)
+           Number of points under each node.
+    cut_dim: np.ndarray (int)
+             Dimension of cut of each branch.
+    cut_value: np.ndarray (float)
+               Value of cut of each branch.
+    bbox: np.ndarray (capacity x 2 x d)
+          Bounding box of points under each node.
+
+    Example:
+    --------
+    # Create ArrayRCTree
+    >>> X = np.random.randn(100,2)
+    >>> tree = ArrayRCTree(X)
+
+    # Insert a point
+    >>> x = np.random.randn(2)
+    >>> tree.insert_point(x, index=100)
+
+    # Compute collusive displacement of new point (anomaly score)
+    >>> tree.codisp(100)
+
+    # Remove point
+    >>> tree.forget_point(100)
+    """
+
+    def __init__(self, X=None, index_labels=None, precision=9,
+                 random_state=None, capacity=256):
+        # Random number generation with provided seed
+        if isinstance(random_state, int):
+            self.rng = np.random.RandomState(random_state)
+        elif isinstance(random_state, np.random.RandomState):
+            self.rng = random_state
+        else:
+            self.rng = np.random
+        self.leaves = {}
+        self.root = -1
+        self.ndim = None
+        self._buffers = None
+        if X is not None:
+            # Round data to avoid sorting errors
+            X = np.around(X, decimals=precision)
+            if index_labels is None:
+                index_labels = np.arange(X.shape[0], dtype=int)
+            self.index_labels = index_labels
+            # Check for duplicates
+            U, I, N = np.unique(X, return_inverse=True, return_counts=True,
+                                axis=0)
+            capacity = max(capacity, U.shape[0])
+            self._allocate(capacity, X.shape[1])
+            if N.max() > 1:
+                X = U
+                I = I.ravel()
+            else:
+                N = np.ones(X.shape[0], dtype=int)
+                I = None
+            self._mktree(X, N, I)
+        else:
+            self._allocate(capacity, None)
+
+    def __repr__(self):
+        treestr = ""
+        if self.root < 0:
+            return treestr
+        # Stack holds strings still to be written and (node, depth) pairs
+        # still to be drawn, so the tree is drawn in preorder
+        stack = [(self.root, "")]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                treestr += item
+                continue
+            node, depth = item
+            if self.left[node] < 0:
+                treestr += '({})\n'.format(self.label[node])
+            else:
+                treestr += '{0}{1}\n'.format(chr(9472), '+')
+                stack.append((self.right[node], depth + '    '))
+                stack.append('{0} {1}{2}{2}'.format(depth, chr(9492), chr(9472)))
+                stack.append((self.left[node], depth + ' {}  '.format(chr(9474))))
+                stack.append('{0} {1}{2}{2}'.format(depth, chr(9500), chr(9472)))
+        return treestr
+
+    # Cut generation is shared with RCTree
+    _insert_point_cut = RCTree._insert_point_cut
+    _scratch = RCTree._scratch
+
+    def _allocate(self, capacity, ndim):
+        """
+        Allocates node storage for a tree holding up to capacity leaves.
+        """
+        size = 2 * capacity
+        self.parent = np.full(size, -1, dtype=np.int64)
+        self.left = np.full(size, -1, dtype=np.int64)
+        self.right = np.full(size, -1, dtype=np.int64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.cut_dim = np.zeros(size, dtype=np.int64)
+        self.cut_value = np.zeros(size, dtype=float)
+        self.label = [None] * size
+        self.ndim = ndim
+        if ndim is None:
+            self.bbox = None
+        else:
+            self.bbox = np.zeros((size, 2, ndim), dtype=float)
+        # Stack of free rows, lowest row on top
+        self._free = list(range(size - 1, -1, -1))
+
+    def _grow(self):
+        """
+        Doubles the node storage of the tree.
+        """
+        size = self.parent.size
+        pad = np.full(size, -1, dtype=np.int64)
+        self.parent = np.concatenate([self.parent, pad])
+        self.left = np.concatenate([self.left, pad])
+        self.right = np.concatenate([self.right, pad])
+        self.count = np.concatenate([self.count, np.zeros_like(self.count)])
+        self.cut_dim = np.concatenate([self.cut_dim,
+                                       np.zeros_like(self.cut_dim)])
+        self.cut_value = np.concatenate([self.cut_value,
+                                         np.zeros_like(self.cut_value)])
+        self.bbox = np.concatenate([self.bbox, np.zeros_like(self.bbox)])
+        self.label.extend([None] * size)
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def _new_node(self):
+        """
+        Returns an unused row, growing storage if necessary.
+        """
+        if not self._free:
+            self._grow()
+        return self._free.pop()
+
+    def _free_node(self, node):
+        """
+        Returns a row to the pool of unused rows.
+        """
+        self.parent[node] = -1
+        self.left[node] = -1
+        self.right[node] = -1
+        self.label[node] = None
+        self._free.append(node)
+
+    def _new_leaf(self, point, index, n=1):
+        """
+        Creates a leaf row holding point.
+        """
+        leaf = self._new_node()
+        self.bbox[leaf, 0] = point
+        self.bbox[leaf, 1] = point
+        self.count[leaf] = n
+        self.label[leaf] = index
+        return leaf
+
+    def _mktree(self, X, N, I):
+        """
+        Constructs tree from unique points X with multiplicities N.
+        """
+        n = X.shape[0]
+        if I is None:
+            groups = None
+        else:
+            # Group index labels by the unique point they belong to
+            order = np.argsort(I, kind='stable')
+            groups = np.split(np.asarray(self.index_labels)[order],
+                              np.cumsum(N)[:-1])
+        # Each task is a range of the permutation, its parent and side
+        perm = np.arange(n)
+        stack = [(0, n, -1, 'l')]
+        while stack:
+            lo, hi, parent, side = stack.pop()
+            if hi - lo == 1:
+                i = perm[lo]
+                if groups is None:
+                    labels = (self.index_labels[i],)
+                else:
+                    labels = groups[i]
+                node = self._new_leaf(X[i], labels[0], n=N[i])
+                for label in labels:
+                    self.leaves[label] = node
+            else:
+                S = perm[lo:hi].copy()
+                Xs = X[S]
+                xmin = Xs.min(axis=0)
+                xmax = Xs.max(axis=0)
+                l = xmax - xmin
+                l /= l.sum()
+                q = self.rng.choice(self.ndim, p=l)
+                p = self.rng.uniform(xmin[q], xmax[q])
+                # Partition range in place, left points first
+                mask = Xs[:, q] <= p
+                k = lo + mask.sum()
+                perm[lo:k] = S[mask]
+                perm[k:hi] = S[~mask]
+                node = self._new_node()
+                self.cut_dim[node] = q
+                self.cut_value[node] = p
+                self.bbox[node, 0] = xmin
+                self.bbox[node, 1] = xmax
+                self.count[node] = N[S].sum()
+                # Build left subtree before right subtree
+                stack.append((k, hi, node, 'r'))
+                stack.append((lo, k, node, 'l'))
+            self.parent[node] = parent
+            if parent < 0:
+                self.root = node
+            elif side == 'l':
+                self.left[parent] = node
+            else:
+                self.right[parent] = node
+
+    def _sibling(self, node):
+        """
+        Returns the sibling of a non-root node.
+        """
+        parent = self.parent[node]
+        if self.left[parent] == node:
+            return self.right[parent]
+        return self.left[parent]
+
+    def _ancestors(self, node):
+        """
+        Returns the rows of node and all nodes above it.
+        """
+        path = []
+        while node >= 0:
+            path.append(node)
+            node = self.parent[node]
+        return path
+
+    def _get_leaf(self, index):
+        try:
+            return self.leaves[index]
+        except KeyError:
+            raise KeyError('leaf must be a key to self.leaves')
+
+    def depth(self, node):
+        """
+        Compute depth of a node (the root has depth 0).
+        """
+        return len(self._ancestors(node)) - 1
+
+    def get_point(self, node):
+        """
+        Returns the point held by a leaf row.
+        """
+        return self.bbox[node, 0].copy()
+
+    def insert_point(self, point, index, tolerance=None):
+        """
+        Inserts a point into the tree, creating a new leaf
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new leaf in tree
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        leaf: int
+              Row of new leaf in tree
+
+        Example:
+        --------
+        # Create ArrayRCTree
+        >>> tree = ArrayRCTree()
+
+        # Insert a point
+        >>> x = np.random.randn(2)
+        >>> tree.insert_point(x, index=0)
+
+        0
+        """
+        point = np.asarray(point, dtype=float).ravel()
+        if self.root < 0:
+            if point.size != self.ndim:
+                self._allocate(self.parent.size // 2, point.size)
+            leaf = self._new_leaf(point, index)
+            self.root = leaf
+            self.leaves[index] = leaf
+            return leaf
+        if point.size != self.ndim:
+            raise ValueError(
+                "Point must be same dimension as existing points in tree.")
+        if index in self.leaves:
+            raise KeyError("Index already exists in leaves dict.")
+        duplicate = self.find_duplicate(point, tolerance=tolerance)
+        if duplicate is not None:
+            self.count[self._ancestors(duplicate)] += 1
+            self.leaves[index] = duplicate
+            return duplicate
+        node = self.root
+        path = []
+        scratch = self._scratch(self.ndim)
+        while True:
+            bbox = self.bbox[node]
+            cut_dimension, cut = self._insert_point_cut(point, bbox,
+                                                        scratch=scratch)
+            if cut <= bbox[0, cut_dimension]:
+                leaf = self._new_leaf(point, index)
+                left, right = leaf, node
+                break
+            elif cut >= bbox[-1, cut_dimension]:
+                leaf = self._new_leaf(point, index)
+                left, right = node, leaf
+                break
+            path.append(node)
+            if point[self.cut_dim[node]] <= self.cut_value[node]:
+                node = self.left[node]
+            else:
+                node = self.right[node]
+        # Create branch above node and new leaf
+        branch = self._new_node()
+        parent = self.parent[node]
+        self.cut_dim[branch] = cut_dimension
+        self.cut_value[branch] = cut
+        self.left[branch] = left
+        self.right[branch] = right
+        self.parent[branch] = parent
+        self.parent[left] = branch
+        self.parent[right] = branch
+        self.count[branch] = self.count[node] + 1
+        np.minimum(self.bbox[node, 0], point, out=self.bbox[branch, 0])
+        np.maximum(self.bbox[node, 1], point, out=self.bbox[branch, 1])
+        if parent < 0:
+            self.root = branch
+        elif self.left[parent] == node:
+            self.left[parent] = branch
+        else:
+            self.right[parent] = branch
+        # Update counts and bounding boxes of all nodes on the descent path
+        if path:
+            self.count[path] += 1
+            bboxes = self.bbox[path]
+            np.minimum(bboxes[:, 0], point, out=bboxes[:, 0])
+            np.maximum(bboxes[:, 1], point, out=bboxes[:, 1])
+            self.bbox[path] = bboxes
+        self.leaves[index] = leaf
+        return leaf
+
+    def forget_point(self, index):
+        """
+        Delete leaf from tree
+
+        Parameters:
+        -----------
+        index: (Hashable type)
+               Index of leaf in tree
+
+        Returns:
+        --------
+        point: np.ndarray (1 x d)
+               Point held by the deleted index
+
+        Example:
+        --------
+        # Create ArrayRCTree
+        >>> tree = ArrayRCTree()
+
+        # Insert a point
+        >>> x = np.random.randn(2)
+        >>> tree.insert_point(x, index=0)
+
+        # Forget point
+        >>> tree.forget_point(0)
+        """
+        leaf = self._get_leaf(index)
+        point = self.get_point(leaf)
+        # If duplicate points exist, decrement counts above leaf
+        if self.count[leaf] > 1:
+            self.count[self._ancestors(leaf)] -= 1
+            del self.leaves[index]
+            return point
+        del self.leaves[index]
+        if leaf == self.root:
+            self._free_node(leaf)
+            self.root = -1
+            return point
+        parent = self.parent[leaf]
+        sibling = self._sibling(leaf)
+        grandparent = self.parent[parent]
+        self.parent[sibling] = grandparent
+        if grandparent < 0:
+            self.root = sibling
+        elif self.left[grandparent] == parent:
+            self.left[grandparent] = sibling
+        else:
+            self.right[grandparent] = sibling
+        self._free_node(parent)
+        self._free_node(leaf)
+        if grandparent >= 0:
+            path = self._ancestors(grandparent)
+            self.count[path] -= 1
+            self._relax_bbox_upwards(path, point)
+        return point
+
+    def _relax_bbox_upwards(self, path, point):
+        """
+        Contracts bboxes of nodes in path (ordered bottom-up) while the deleted
+        point lies on their boundary.
+        """
+        for node in path:
+            b = self.bbox[node]
+            if not ((b[0] == point) | (b[1] == point)).any():
+                break
+            l = self.bbox[self.left[node]]
+            r = self.bbox[self.right[node]]
+            np.minimum(l[0], r[0], out=b[0])
+            np.maximum(l[1], r[1], out=b[1])
+
+    def query(self, point, node=None):
+        """
+        Search for leaf nearest to point
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+               Point to search for
+        node: int
+              Row of node to begin search from. Defaults to root node.
+
+        Returns:
+        --------
+        nearest: int
+                 Row of leaf nearest to queried point in the tree
+        """
+        point = np.asarray(point).ravel()
+        if node is None:
+            node = self.root
+        left = self.left
+        while left[node] >= 0:
+            if point[self.cut_dim[node]] <= self.cut_value[node]:
+                node = left[node]
+            else:
+                node = self.right[node]
+        return node
+
+    def find_duplicate(self, point, tolerance=None):
+        """
+        If point is a duplicate of existing point in the tree, return the row
+        of the leaf containing the point, else return None.
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+               Point to query in the tree.
+        tolerance: float
+                   Tolerance for determining whether or not point is a duplicate.
+
+        Returns:
+        --------
+        duplicate: int or None
+        """
+        nearest = self.query(point)
+        x = self.bbox[nearest, 0]
+        if tolerance is None:
+            if (x == point).all():
+                return nearest
+        else:
+            if np.isclose(x, point, rtol=tolerance).all():
+                return nearest
+        return None
+
+    def disp(self, leaf):
+        """
+        Compute displacement at leaf
+
+        Parameters:
+        -----------
+        leaf: index of leaf
+
+        Returns:
+        --------
+        displacement: int
+                      Displacement if leaf is removed
+        """
+        leaf = self._get_leaf(leaf)
+        if leaf == self.root:
+            return 0
+        return self.count[self._sibling(leaf)]
+
+    def codisp(self, leaf):
+        """
+        Compute collusive displacement at leaf
+
+        Parameters:
+        -----------
+        leaf: index of leaf
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement if leaf is removed.
+        """
+        node = self._get_leaf(leaf)
+        if node == self.root:
+            return 0
+        results, _ = self._codisp_path(node)
+        return results.max()
+
+    def codisp_with_cut_dimension(self, leaf):
+        """
+        Compute collusive displacement at leaf and the dimension of the cut.
+
+        Parameters:
+        -----------
+        leaf: index of leaf
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement if leaf is removed.
+        cut_dimension: int
+                    Dimension of the cut
+        """
+        node = self._get_leaf(leaf)
+        if node == self.root:
+            return 0
+        results, parents = self._codisp_path(node)
+        argmax = np.argmax(results)
+        return results[argmax], self.cut_dim[parents[argmax]]
+
+    def _codisp_path(self, node):
+        """
+        Computes displacement ratios at every node from node up to the root.
+        Returns the ratios and the parents at which they were computed.
+        """
+        nodes = np.asarray(self._ancestors(node)[:-1])
+        parents = self.parent[nodes]
+        siblings = np.where(self.left[parents] == nodes,
+                            self.right[parents], self.left[parents])
+        results = self.count[siblings] / self.count[nodes]
+        return results, parents
+
+    def get_bbox(self, node=None):
+        """
+        Returns bounding box of all points underneath a given node.
+
+        Parameters:
+        -----------
+        node: int
+              Row of starting node. Defaults to root of tree.
+
+        Returns:
+        --------
+        bbox: np.ndarray (2 x d)
+        """
+        if node is None:
+            node = self.root
+        return self.bbox[node].copy()
@@ -0,0 +1,112 @@
+import numpy as np
+from rrcf.forest import RCForest
+from rrcf.shingle import Shingler
+
+
+class StreamingDetector:
+    """
+    Streaming anomaly detector that shingles raw values, keeps a sliding window
+    of the most recent shingles in a forest, and scores each new shingle.
+
+    Values can be passed one chunk at a time. The last shingle_size - 1 values
+    of each chunk are carried over to the next, so shingles span chunk
+    boundaries. Live indices are held in a fixed-capacity ring buffer, which
+    gives O(1) eviction of the oldest shingle. Memory use is bounded: scores are
+    returned per chunk rather than accumulated.
+
+    Parameters:
+    -----------
+    num_trees: int (optional) (default=40)
+               Number of trees in the forest.
+    tree_size: int (optional) (default=256)
+               Number of most recent shingles held by each tree.
+    shingle_size: int (optional) (default=4)
+                  Number of consecutive values in each shingle.
+    random_state: int, RandomState instance or None (optional) (default=None)
+                  See RCForest.
+
+    Attributes:
+    -----------
+    forest: RCForest
+            Forest holding the most recent shingles.
+    index: int
+           Index that will be assigned to the next shingle (equal to the
+           number of shingles seen so far).
+
+    Example:
+    --------
+    # Create detector
+    >>> detector = StreamingDetector(num_trees=40, tree_size=256,
+                                     shingle_size=4)
+
+    # Score a stream in chunks of 100 values
+    >>> sin = 50 * np.sin(np.arange(1000) * 2 * np.pi / 100)
+    >>> scores = np.concatenate([detector.update(chunk)
+                                 for chunk in np.split(sin, 10)])
+    """
+
+    def __init__(self, num_trees=40, tree_size=256, shingle_size=4,
+                 random_state=None):
+        self.forest = RCForest(num_trees=num_trees, random_state=random_state)
+        self.tree_size = tree_size
+        self.shingle_size = shingle_size
+        self.index = 0
+        self._shingler = Shingler(shingle_size)
+        # Ring buffer of live indices, oldest at self._head
+        self._ring = np.zeros(tree_size, dtype=np.int64)
+        self._head = 0
+        self._count = 0
+
+    def update(self, values):
+        """
+        Inserts all shingles completed by a chunk of values and returns their
+        anomaly scores
+
+        Parameters:
+        -----------
+        values: np.ndarray (k) or (k x d)
+                Next values in the stream (a scalar is treated as one value).
+                Chunks of a multivariate stream must always be 2-D.
+
+        Returns:
+        --------
+        scores: np.ndarray
+                Anomaly score of each shingle completed by the chunk. Fewer than
+                k scores are returned until shingle_size values have been seen.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 0:
+            values = values.reshape(1)
+        shingles = self._shingler.update(values)
+        scores = np.empty(shingles.shape[0])
+        for j, point in enumerate(shingles):
+            scores[j] = self._update_point(point)
+        return scores
+
+    def process(self, chunks):
+        """
+        Generator that yields the scores of each chunk from an iterable of
+        chunks (see update).
+        """
+        for chunk in chunks:
+            yield self.update(chunk)
+
+    def _update_point(self, point):
+        """
+        Inserts a shingle, evicting the oldest one if the window is full, and
+        returns its anomaly score.
+        """
+        capacity = self.tree_size
+        index = self.index
+        if self._count == capacity:
+            # The new shingle takes the slot of the oldest
+            score = self.forest.replace(int(self._ring[self._head]), point,
+                                        index)
+            self._ring[self._head] = index
+            self._head = (self._head + 1) % capacity
+        else:
+            score = self.forest.insert_and_score(point, index)
+            self._ring[self._count] = index
+            self._count += 1
+        self.index += 1
+        return score
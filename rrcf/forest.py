@@ -0,0 +1,1357 @@
+import heapq
+import os
+from collections import deque
+import numpy as np
+from rrcf.rrcf import RCTree, ARRAY_FORMAT_VERSION, _label_array
+from rrcf.mapped import MappedRCTree
+from rrcf.stats import Stats, instrumented
+from rrcf.store import PointStore
+from rrcf.lock import RWLock, reading, synchronized, writing
+
+
+class RCForest:
+    """
+    Robust random cut forest: a collection of RCTrees that are updated and
+    scored together.
+
+    Points are validated, flattened and checked for duplicates once per
+    forest operation, rather than once per tree.
+
+    Parameters:
+    -----------
+    num_trees: int (optional) (default=100)
+               Number of trees in the forest.
+    tree_size: int (optional) (default=None)
+               Maximum number of points held by each tree. If provided, `update`
+               keeps each tree at no more than tree_size points (see sampling).
+    random_state: int, RandomState instance or None (optional) (default=None)
+        If int, random_state is the seed used to draw a seed for each tree;
+        If RandomState instance, random_state is used to draw a seed for each tree;
+        If None, every tree uses the RandomState instance used by np.random.
+    sampling: str (optional) (default='fifo')
+              Policy used by `update` to choose the points held by each tree.
+              If 'fifo', every point is inserted into every tree, after the
+              oldest points are dropped until no tree is full.
+              If 'reservoir', each tree holds a weighted random sample of the
+              points seen so far (see decay). Each point is given a random
+              priority in each tree, and is only inserted into the trees where
+              its priority is higher than that of the lowest point held, which
+              is then dropped from that tree. Requires tree_size.
+    decay: float (optional) (default=0.)
+           Time decay rate of reservoir sampling. With decay=0., each tree
+           holds a uniform sample of all points seen. Otherwise, the weight of
+           the t-th point seen is exp(decay * t), so that recent points are
+           favored and a point remains in a tree for about 1 / decay updates
+           once the tree is full.
+
+    Attributes:
+    -----------
+    trees: list
+           List of RCTree instances in the forest.
+    num_trees: int
+               Number of trees in the forest.
+    tree_size: int or None
+               Maximum number of points held by each tree.
+    sampling: str
+              Policy used by update ('fifo' or 'reservoir').
+    decay: float
+           Time decay rate of reservoir sampling.
+    rng: RandomState instance
+         Random number generator used to seed trees and draw samples.
+    ndim: int
+          dimension of points in the forest
+    store: PointStore or None
+           Points held by the trees of the forest. Leaves of every tree
+           holding a point share a single view of its row.
+    stats: Stats or None
+           Collector of statistics about operations (see enable_stats).
+    lock: RWLock or None
+          Lock held by reads and writes of the forest (see enable_locking).
+
+    Methods:
+    --------
+    from_batch: constructs a forest from random samples of a point set.
+    insert: inserts a new point into every tree.
+    insert_points: inserts a batch of points into every tree.
+    insert_and_score: inserts a new point and returns its anomaly score.
+    replace: deletes a point and inserts a new point in one step.
+    forget: removes a point from every tree.
+    forget_points: removes a batch of points from every tree.
+    codisp: compute collusive displacement of a point in every tree.
+    score: compute average collusive displacement of a point (anomaly score).
+    score_all: compute anomaly scores of many points in one pass over each tree.
+    score_point: compute anomaly score of a point without inserting it.
+    score_points: compute anomaly scores of many points without inserting them.
+    update: inserts a new point, dropping the oldest one if the forest is full
+            (or sampling it into each tree), and returns its anomaly score.
+    to_arrays / from_arrays: serialize forest to and from flat arrays.
+    save / load: write forest to and read forest from a binary .npz file.
+    enable_stats / disable_stats: start and stop collecting statistics.
+    enable_locking / disable_locking: start and stop locking the forest for use
+                                      by one writer and many reader threads.
+
+    Example:
+    --------
+    # Create RCForest
+    >>> forest = RCForest(num_trees=40, tree_size=256)
+
+    # Insert points and compute anomaly scores
+    >>> for index, point in enumerate(np.random.randn(1000, 2)):
+            score = forest.update(point, index)
+    """
+
+    def __init__(self, num_trees=100, tree_size=None, random_state=None,
+                 sampling='fifo', decay=0.):
+        if sampling not in ('fifo', 'reservoir'):
+            raise ValueError("sampling must be 'fifo' or 'reservoir'.")
+        if sampling == 'reservoir' and tree_size is None:
+            raise ValueError('tree_size is required for reservoir sampling.')
+        if decay < 0:
+            raise ValueError('decay must be non-negative.')
+        # Random number generation with provided seed
+        if isinstance(random_state, int):
+            rng = np.random.RandomState(random_state)
+        elif isinstance(random_state, np.random.RandomState):
+            rng = random_state
+        else:
+            rng = None
+        # Give each tree its own random number generator
+        if rng is None:
+            self.rng = np.random
+            self.trees = [RCTree() for _ in range(num_trees)]
+        else:
+            self.rng = rng
+            seeds = rng.randint(np.iinfo(np.int32).max, size=num_trees)
+            self.trees = [RCTree(random_state=np.random.RandomState(seed))
+                          for seed in seeds]
+        self.num_trees = num_trees
+        self.tree_size = tree_size
+        self.sampling = sampling
+        self.decay = decay
+        self.ndim = None
+        self.stats = None
+        self.lock = None
+        self.store = None
+        # Number of leaves referencing each row of the store
+        self._refs = {}
+        # Map each index in the forest to the bytes of its point
+        self._keys = {}
+        # Map the bytes of each point to all indices holding that point
+        self._duplicates = {}
+        # Order in which indices were inserted (for FIFO eviction)
+        self._fifo = deque()
+        # Number of trees holding each index
+        self._holders = {}
+        # Number of points seen by update, and for reservoir sampling, a heap
+        # of (priority, time, index) of the points held by each tree
+        self._time = 0
+        self._heaps = [[] for _ in range(num_trees)]
+
+    @classmethod
+    def from_batch(cls, X, num_trees=100, tree_size=256, index_labels=None,
+                   precision=9, random_state=None, sampling='fifo', decay=0.):
+        """
+        Constructs a forest in which each tree is built from a random sample of
+        tree_size points from X, drawn without replacement. With reservoir
+        sampling, each tree keeps the tree_size points of X with the highest
+        priority, as if they had been added by update in order.
+
+        Rounding and duplicate detection are done once for the whole point set,
+        and every tree is built from the same matrix of unique points.
+
+        Parameters:
+        -----------
+        X: np.ndarray (n x d)
+           Array containing n data points, each with dimension d.
+        num_trees: int (optional) (default=100)
+                   Number of trees in the forest.
+        tree_size: int (optional) (default=256)
+                   Number of points sampled for each tree.
+        index_labels: sequence of length n (optional) (default=None)
+                      Labels for data points provided in X.
+                      Defaults to [0, 1, ... n-1].
+        precision: float (optional) (default=9)
+                   Floating-point precision for distinguishing duplicate points.
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      See RCForest.
+        sampling: str (optional) (default='fifo')
+                  See RCForest.
+        decay: float (optional) (default=0.)
+               See RCForest.
+
+        Returns:
+        --------
+        forest: rrcf.RCForest
+
+        Example:
+        --------
+        # Construct forest
+        >>> X = np.random.randn(2000, 3)
+        >>> forest = RCForest.from_batch(X, num_trees=100, tree_size=256)
+
+        # Compute anomaly score of first point
+        >>> forest.score(0)
+        """
+        forest = cls(num_trees=num_trees, tree_size=tree_size,
+                     random_state=random_state, sampling=sampling, decay=decay)
+        # Round data to avoid sorting errors
+        X = np.around(np.asarray(X, dtype=float), decimals=precision)
+        # Treat -0.0 and 0.0 as the same point
+        X += 0.0
+        n, d = X.shape
+        if index_labels is None:
+            index_labels = np.arange(n, dtype=int)
+        index_labels = np.asarray(index_labels)
+        # Find unique points once for all trees
+        U, I, _ = np.unique(X, return_inverse=True, return_counts=True,
+                            axis=0)
+        I = I.ravel()
+        size = min(tree_size, n)
+        sampled = np.zeros(n, dtype=bool)
+        # Leaves of every tree share the views of each unique point
+        forest.store = PointStore(d, capacity=0)
+        store_rows = forest.store.add_block(U)
+        views = [(forest.store.get(row), forest.store.get_bbox(row))
+                 for row in store_rows]
+        refs = np.zeros(U.shape[0], dtype=int)
+        for k, tree in enumerate(forest.trees):
+            if sampling == 'reservoir':
+                sample, forest._heaps[k] = forest._top_priorities(
+                    index_labels, size)
+            else:
+                sample = forest.rng.choice(n, size=size, replace=False)
+            sampled[sample] = True
+            # Count duplicates and group labels by unique point within sample
+            order = np.argsort(I[sample], kind='stable')
+            rows, counts = np.unique(I[sample], return_counts=True)
+            N = np.zeros(U.shape[0], dtype=int)
+            N[rows] = counts
+            groups = np.split(index_labels[sample][order],
+                              np.cumsum(counts)[:-1])
+            tree.ndim = d
+            refs[rows] += 1
+            tree._build(U, rows, N, dict(zip(rows, groups)), views=views)
+        for row, count in zip(store_rows.tolist(), refs.tolist()):
+            if count:
+                forest._refs[row] = count
+            else:
+                forest.store.remove(row)
+        # Record every sampled point in the forest
+        forest.ndim = d
+        for i in np.flatnonzero(sampled):
+            index = index_labels[i]
+            key = U[I[i]].tobytes()
+            forest._duplicates.setdefault(key, []).append(index)
+            forest._keys[index] = key
+            if sampling == 'fifo':
+                forest._fifo.append(index)
+        if sampling == 'reservoir':
+            forest._time = n
+        for tree in forest.trees:
+            for index in tree.leaves:
+                forest._holders[index] = forest._holders.get(index, 0) + 1
+        return forest
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, index):
+        return index in self._keys
+
+    def __iter__(self):
+        return iter(self.trees)
+
+    def __repr__(self):
+        return "RCForest(num_trees={}, points={})".format(self.num_trees,
+                                                          len(self))
+
+    @synchronized('write')
+    @instrumented('insert')
+    def insert(self, point, index, tolerance=None):
+        """
+        Inserts a point into every tree in the forest. With reservoir sampling,
+        the point is given a priority in each tree, and trees holding more than
+        tree_size points forget their lowest priority point (see update).
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new point in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Example:
+        --------
+        # Create RCForest
+        >>> forest = RCForest(num_trees=10)
+
+        # Insert a point
+        >>> x = np.random.randn(2)
+        >>> forest.insert(x, index=0)
+        """
+        point = self._validate_point(point)
+        if index in self._keys:
+            raise KeyError("Index already exists in forest.")
+        self._insert_trees(point, index, self.trees, tolerance)
+        if self.sampling == 'reservoir':
+            self._sample_inserted([index])
+
+    @synchronized('write')
+    @instrumented('insert_and_score')
+    def insert_and_score(self, point, index, tolerance=None):
+        """
+        Inserts a point into every tree in the forest and returns its anomaly
+        score, computed while inserting (see RCTree.insert_and_score)
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new point in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        score: float
+               Average collusive displacement of the new point.
+
+        Example:
+        --------
+        # Create RCForest
+        >>> forest = RCForest(num_trees=10)
+        >>> for index, point in enumerate(np.random.randn(100, 2)):
+                forest.insert(point, index)
+
+        # Insert a point and compute its anomaly score
+        >>> forest.insert_and_score(np.array([4, 4]), index=100)
+
+        28.6
+        """
+        point = self._validate_point(point)
+        if index in self._keys:
+            raise KeyError("Index already exists in forest.")
+        total = self._insert_trees(point, index, self.trees, tolerance)
+        if self.sampling == 'reservoir':
+            self._sample_inserted([index])
+        return total / self.num_trees if self.num_trees else np.nan
+
+    @synchronized('write')
+    @instrumented('replace')
+    def replace(self, old_index, point, index, tolerance=None):
+        """
+        Deletes a point from every tree and inserts a new point, and returns
+        the anomaly score of the new point. Gives the same forest as forget
+        followed by insert, reusing the branches freed in each tree (see
+        RCTree.replace_point).
+
+        Parameters:
+        -----------
+        old_index: (Hashable type)
+                   Index of point to delete
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new point in forest (may be old_index)
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        score: float
+               Average collusive displacement of the new point.
+
+        Example:
+        --------
+        # Slide a window of 256 points over a stream
+        >>> forest = RCForest(num_trees=40)
+        >>> X = np.random.randn(1000, 2)
+        >>> for index, point in enumerate(X[:256]):
+                forest.insert(point, index)
+        >>> for index, point in enumerate(X[256:], 256):
+                score = forest.replace(index - 256, point, index)
+        """
+        point = self._validate_point(point)
+        if old_index not in self._keys:
+            raise KeyError('Index must be a point in the forest')
+        if index != old_index and index in self._keys:
+            raise KeyError("Index already exists in forest.")
+        total = self._insert_trees(point, index, self.trees, tolerance,
+                                   old_index=old_index)
+        if self.sampling == 'reservoir':
+            # Drop the priorities of the old point, as index may reuse it
+            for heap in self._heaps:
+                heap[:] = [entry for entry in heap if entry[2] != old_index]
+                heapq.heapify(heap)
+            self._sample_inserted([index])
+        return total / self.num_trees if self.num_trees else np.nan
+
+    @synchronized('write')
+    @instrumented('insert_points')
+    def insert_points(self, X, indexes, tolerance=None):
+        """
+        Inserts a batch of points into every tree in the forest (see
+        RCTree.insert_points)
+
+        The batch is validated, copied into the point store and checked for
+        exact duplicates once, and then inserted into each tree in turn. If
+        the forest has a random_state, this gives the same forest as calling
+        insert on each point in turn. With reservoir sampling, trees then
+        forget their lowest priority points down to tree_size (see insert).
+
+        Parameters:
+        -----------
+        X: np.ndarray (k x d)
+           Points to insert.
+        indexes: sequence of length k
+                 Identifiers for new points in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Example:
+        --------
+        # Create RCForest
+        >>> forest = RCForest(num_trees=10, random_state=0)
+
+        # Insert a batch of points
+        >>> forest.insert_points(np.random.randn(100, 2), indexes=range(100))
+        """
+        X = np.array(X, dtype=float)
+        X = X.reshape(X.shape[0], -1)
+        # Treat -0.0 and 0.0 as the same point
+        X += 0.0
+        indexes = list(indexes)
+        if len(indexes) != X.shape[0]:
+            raise ValueError('Number of indexes must match number of points.')
+        if self.ndim is not None and X.shape[1] != self.ndim:
+            raise ValueError(
+                "Point must be same dimension as existing points in forest.")
+        if not np.isfinite(X).all():
+            raise ValueError('Points must be finite.')
+        if len(set(indexes)) != len(indexes) or any(
+                index in self._keys for index in indexes):
+            raise KeyError("Index already exists in forest.")
+        if not indexes:
+            return
+        # Indices holding each point, in the forest or earlier in the batch
+        keys = [point.tobytes() for point in X]
+        sames = []
+        batch = {}
+        for key, index in zip(keys, indexes):
+            earlier = batch.setdefault(key, [])
+            sames.append(self._duplicates.get(key, []) + earlier)
+            earlier.append(index)
+        # Store points once for all trees
+        if self.store is None:
+            self.store = PointStore(X.shape[1],
+                                    capacity=self.tree_size or 1024)
+        rows = [self.store.add(point) for point in X]
+        views = [(self.store.get(row), self.store.get_bbox(row))
+                 for row in rows]
+        refs = np.zeros(len(rows), dtype=int)
+        for tree in self.trees:
+            if tolerance is None:
+                def find_duplicate(j, tree=tree):
+                    return self._find_duplicate(tree, sames[j])
+            else:
+                find_duplicate = None
+            with writing(tree):
+                leaves = tree._insert_many(X, indexes, tolerance=tolerance,
+                                           views=views,
+                                           find_duplicate=find_duplicate)
+            for j, leaf in enumerate(leaves):
+                if leaf.x is views[j][0]:
+                    refs[j] += 1
+        for row, count in zip(rows, refs.tolist()):
+            if count:
+                self._refs[row] = count
+            else:
+                self.store.remove(row)
+        if self.ndim is None:
+            self.ndim = X.shape[1]
+        for key, index in zip(keys, indexes):
+            self._duplicates.setdefault(key, []).append(index)
+            self._keys[index] = key
+            self._holders[index] = self.num_trees
+            if self.sampling == 'fifo':
+                self._fifo.append(index)
+        if self.sampling == 'reservoir':
+            self._sample_inserted(indexes)
+
+    @synchronized('write')
+    @instrumented('forget')
+    def forget(self, index):
+        """
+        Deletes a point from every tree in the forest that contains it
+
+        Parameters:
+        -----------
+        index: (Hashable type)
+               Index of point in forest
+
+        Example:
+        --------
+        # Create RCForest and insert a point
+        >>> forest = RCForest(num_trees=10)
+        >>> forest.insert(np.random.randn(2), index=0)
+
+        # Forget point
+        >>> forest.forget(0)
+        """
+        if index not in self._keys:
+            raise KeyError('Index must be a point in the forest')
+        for tree in self.trees:
+            if index in tree.leaves:
+                self._forget_tree(tree, index)
+        if index in self._keys:
+            self._drop(index)
+
+    @synchronized('write')
+    @instrumented('forget_points')
+    def forget_points(self, indexes):
+        """
+        Deletes a batch of points from every tree in the forest that contains
+        them (see RCTree.forget_points)
+
+        Parameters:
+        -----------
+        indexes: sequence
+                 Indices of points in forest
+
+        Example:
+        --------
+        # Create RCForest and insert points
+        >>> forest = RCForest(num_trees=10)
+        >>> forest.insert_points(np.random.randn(100, 2), indexes=range(100))
+
+        # Forget the oldest half
+        >>> forest.forget_points(range(50))
+        """
+        indexes = list(indexes)
+        if len(set(indexes)) != len(indexes) or any(
+                index not in self._keys for index in indexes):
+            raise KeyError('Indexes must be points in the forest')
+        for tree in self.trees:
+            with writing(tree):
+                present = [index for index in indexes if index in tree.leaves]
+                if not present:
+                    continue
+                # Count the indices removed from each leaf, as leaves holding
+                # duplicates outlive some of their indices
+                removals = {}
+                for index in present:
+                    leaf = tree.leaves[index]
+                    removals[leaf] = removals.get(leaf, 0) + 1
+                removed = [leaf for leaf, count in removals.items()
+                           if count == leaf.n]
+                tree.forget_points(present)
+            # Free the row of each point once no leaf references it
+            if self.store is not None:
+                for leaf in removed:
+                    self._release(leaf.x)
+        for index in indexes:
+            self._drop(index)
+
+    @synchronized('read')
+    def codisp(self, index):
+        """
+        Compute collusive displacement of a point in every tree containing it
+
+        Parameters:
+        -----------
+        index: (Hashable type)
+               Index of point in forest
+
+        Returns:
+        --------
+        codisplacement: np.ndarray
+                        Collusive displacement of the point in each tree.
+        """
+        if index not in self._keys:
+            raise KeyError('Index must be a point in the forest')
+        codisp = []
+        for tree in self.trees:
+            with reading(tree):
+                if index in tree.leaves:
+                    codisp.append(tree.codisp(index))
+        return np.asarray(codisp, dtype=float)
+
+    def score(self, index):
+        """
+        Compute average collusive displacement of a point over the forest
+        (anomaly score)
+
+        Parameters:
+        -----------
+        index: (Hashable type)
+               Index of point in forest
+
+        Returns:
+        --------
+        score: float
+               Collusive displacement averaged over all trees containing point.
+
+        Example:
+        --------
+        # Create RCForest
+        >>> X = np.random.randn(100, 2)
+        >>> forest = RCForest(num_trees=10)
+        >>> for index, point in enumerate(X):
+                forest.insert(point, index)
+
+        # Compute anomaly score
+        >>> forest.insert(np.array([4, 4]), index=100)
+        >>> forest.score(100)
+
+        28.6
+        """
+        return self.codisp(index).mean()
+
+    @synchronized('read')
+    def score_all(self, indexes=None):
+        """
+        Compute anomaly scores of many points, using a single pass over each
+        tree (see RCTree.codisp_all)
+
+        Parameters:
+        -----------
+        indexes: sequence (optional) (default=None)
+                 Indices of points in forest. Defaults to all points.
+
+        Returns:
+        --------
+        scores: np.ndarray
+                Collusive displacement of each point averaged over all trees
+                containing it, in the order of indexes.
+
+        Example:
+        --------
+        # Construct forest and score every point
+        >>> X = np.random.randn(2000, 3)
+        >>> forest = RCForest.from_batch(X, num_trees=100, tree_size=256)
+        >>> scores = forest.score_all()
+        """
+        if indexes is None:
+            indexes = list(self._keys)
+        else:
+            indexes = list(indexes)
+        for index in indexes:
+            if index not in self._keys:
+                raise KeyError('Index must be a point in the forest')
+        total = np.zeros(len(indexes))
+        count = np.zeros(len(indexes))
+        for tree in self.trees:
+            with reading(tree):
+                present = np.fromiter((index in tree.leaves
+                                       for index in indexes),
+                                      dtype=bool, count=len(indexes))
+                if present.all():
+                    total += tree.codisp_all(indexes)
+                    count += 1
+                elif present.any():
+                    total[present] += tree.codisp_all(
+                        [index for index, p in zip(indexes, present) if p])
+                    count[present] += 1
+        return total / count
+
+    @synchronized('read')
+    def score_point(self, point, tolerance=None, random_state=None):
+        """
+        Compute the anomaly score a point would have if it were inserted, without
+        modifying any tree (see RCTree.score_point)
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+               Point to score.
+        tolerance: float
+                   Tolerance for determining duplicate points
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Random number generator used to draw simulated cuts.
+                      Defaults to the scoring generator of each tree (see
+                      RCTree.score_point).
+
+        Returns:
+        --------
+        score: float
+               Collusive displacement the point would have, averaged over trees.
+        """
+        return self.score_points([point], tolerance=tolerance,
+                                 random_state=random_state)[0]
+
+    @synchronized('read')
+    def score_points(self, X, tolerance=None, random_state=None):
+        """
+        Compute the anomaly scores a batch of points would have if each were
+        inserted on its own, without modifying any tree
+
+        Parameters:
+        -----------
+        X: np.ndarray (k x d)
+           Points to score.
+        tolerance: float
+                   Tolerance for determining duplicate points
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Random number generator used to draw simulated cuts.
+                      Defaults to the scoring generator of each tree (see
+                      RCTree.score_point).
+
+        Returns:
+        --------
+        scores: np.ndarray (k)
+
+        Example:
+        --------
+        # Create RCForest
+        >>> forest = RCForest(num_trees=10)
+        >>> for index, point in enumerate(np.random.randn(100, 2)):
+                forest.insert(point, index)
+
+        # Score candidate points
+        >>> forest.score_points([[0, 0], [4, 4]])
+
+        array([ 1.62, 27.3 ])
+        """
+        if isinstance(random_state, int):
+            random_state = np.random.RandomState(random_state)
+        X = np.asarray(X, dtype=float)
+        X = X.reshape(X.shape[0], -1)
+        scores = np.zeros(X.shape[0])
+        for k, point in enumerate(X):
+            point = self._validate_point(point)
+            same = self._duplicates.get(point.tobytes())
+            total = 0.
+            for tree in self.trees:
+                with reading(tree):
+                    if tree.root is None:
+                        continue
+                    if tolerance is None:
+                        duplicate = self._find_duplicate(tree, same)
+                    else:
+                        duplicate = tree.find_duplicate(point,
+                                                        tolerance=tolerance)
+                    total += tree._score_point(point, duplicate,
+                                               rng=random_state)
+            scores[k] = total / self.num_trees
+        return scores
+
+    @synchronized('write')
+    @instrumented('update')
+    def update(self, point, index, tolerance=None):
+        """
+        Inserts a point into the forest and returns its anomaly score. If the
+        forest is full, the oldest points are forgotten first.
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new point in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        score: float
+               Average collusive displacement of the new point. With reservoir
+               sampling, the displacement the point would have is computed in
+               trees that do not sample it (see score_point), so that scores
+               are averaged over every tree.
+
+        Example:
+        --------
+        # Keep a time-decayed sample of the stream in each tree
+        >>> forest = RCForest(num_trees=40, tree_size=256, sampling='reservoir',
+                              decay=1 / 2560)
+        >>> for index, point in enumerate(np.random.randn(10000, 2)):
+                score = forest.update(point, index)
+        """
+        if self.sampling == 'reservoir':
+            return self._update_reservoir(point, index, tolerance)
+        point = self._validate_point(point)
+        if index in self._keys:
+            raise KeyError("Index already exists in forest.")
+        if self.tree_size is not None:
+            while self._is_full():
+                oldest = self._fifo.popleft()
+                # Skip points that have already been forgotten
+                if oldest not in self._keys:
+                    continue
+                # Replace the last point to be forgotten with the new point
+                if not any(len(tree.leaves) - (oldest in tree.leaves)
+                           >= self.tree_size for tree in self.trees):
+                    return self.replace(oldest, point, index,
+                                        tolerance=tolerance)
+                self.forget(oldest)
+        return self.insert_and_score(point, index, tolerance=tolerance)
+
+    @synchronized('read')
+    def to_arrays(self):
+        """
+        Serializes RCForest to a dict of flat arrays (see RCTree.to_arrays).
+
+        The arrays of all trees are concatenated, and the rows belonging to each
+        tree are given by offset arrays. Node positions and rows are relative to
+        the start of each tree.
+
+        Returns:
+        --------
+        arrays: dict
+                Arrays of every tree, concatenated, along with:
+                version: format version
+                num_trees, tree_size: parameters of the forest (-1 if no
+                                      tree_size)
+                node_offsets, leaf_offsets, branch_offsets, label_offsets:
+                    np.ndarray (num_trees + 1) start of each tree in the
+                    node, leaf (x, i), branch (b) and label arrays.
+                indexes: all indices in the forest
+                points: np.ndarray (len(indexes) x d) point of each index
+                fifo: indices in order of insertion (for FIFO eviction)
+                sampling, decay, time: sampling policy, its decay rate and the
+                                       number of points seen by update
+                heap_priority, heap_time, heap_index, heap_offsets: entries of
+                    the reservoir heap of each tree, with offsets of each tree
+                forest_rng_keys, forest_rng_pos, forest_rng_has_gauss,
+                forest_rng_gauss: state of self.rng, used to draw samples (no
+                    keys if self.rng is np.random)
+
+        Example:
+        --------
+        # Write forest to arrays
+        >>> forest = RCForest.from_batch(np.random.randn(1000, 3), num_trees=10)
+        >>> arrays = forest.to_arrays()
+        """
+        d = self.ndim or 0
+        trees = [tree.to_arrays() for tree in self.trees]
+        arrays = {'version': np.array(ARRAY_FORMAT_VERSION),
+                  'num_trees': np.array(self.num_trees),
+                  'tree_size': np.array(-1 if self.tree_size is None
+                                        else self.tree_size)}
+        for name in ('left', 'right', 'q', 'p', 'n', 'row', 'label_row'):
+            arrays[name] = np.concatenate([t[name] for t in trees])
+        arrays['x'] = np.concatenate([t['x'].reshape(len(t['x']), d)
+                                      for t in trees])
+        arrays['b'] = np.concatenate([t['b'].reshape(len(t['b']), 2, d)
+                                      for t in trees])
+        for name in ('i', 'labels'):
+            arrays[name] = _label_array([label for t in trees
+                                         for label in t[name].tolist()])
+        for offsets, name in (('node_offsets', 'n'), ('leaf_offsets', 'x'),
+                              ('branch_offsets', 'b'),
+                              ('label_offsets', 'labels')):
+            arrays[offsets] = np.cumsum([0] + [len(t[name]) for t in trees])
+        indexes = list(self._keys)
+        arrays['indexes'] = _label_array(indexes)
+        points = np.empty((len(indexes), d), dtype=float)
+        for k, index in enumerate(indexes):
+            points[k] = np.frombuffer(self._keys[index], dtype=float)
+        arrays['points'] = points
+        arrays['fifo'] = _label_array([index for index in self._fifo
+                                       if index in self._keys])
+        # Reservoir sampling state
+        arrays['sampling'] = np.array(self.sampling)
+        arrays['decay'] = np.array(float(self.decay))
+        arrays['time'] = np.array(self._time)
+        entries = [entry for heap in self._heaps for entry in heap]
+        arrays['heap_priority'] = np.array([entry[0] for entry in entries],
+                                           dtype=float)
+        arrays['heap_time'] = np.array([entry[1] for entry in entries],
+                                       dtype=np.int64)
+        arrays['heap_index'] = _label_array([entry[2] for entry in entries])
+        arrays['heap_offsets'] = np.cumsum([0] + [len(heap)
+                                                  for heap in self._heaps])
+        if isinstance(self.rng, np.random.RandomState):
+            state = self.rng.get_state()
+            arrays['forest_rng_keys'] = np.asarray(state[1], dtype=np.uint32)
+            arrays['forest_rng_pos'] = np.array(state[2])
+            arrays['forest_rng_has_gauss'] = np.array(state[3])
+            arrays['forest_rng_gauss'] = np.array(state[4])
+        else:
+            arrays['forest_rng_keys'] = np.empty(0, dtype=np.uint32)
+            arrays['forest_rng_pos'] = np.array(0)
+            arrays['forest_rng_has_gauss'] = np.array(0)
+            arrays['forest_rng_gauss'] = np.array(0.)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, random_state=None, lazy=False):
+        """
+        Deserializes a dict of flat arrays representing an RCForest (see
+        to_arrays) and creates a new RCForest instance from the loaded data.
+
+        Parameters:
+        -----------
+        arrays: dict or np.lib.npyio.NpzFile
+                Flat arrays representing all trees in the RCForest.
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Used to seed the trees of the new forest (see RCForest).
+                      The generator used to draw samples is restored from
+                      arrays if it was saved.
+        lazy: bool (optional) (default=False)
+              If True, each tree is a MappedRCTree that reads from slices of
+              arrays, and is only built when first modified.
+
+        Returns:
+        --------
+        forest: rrcf.RCForest
+        """
+        version = int(arrays['version'])
+        if version > ARRAY_FORMAT_VERSION:
+            raise ValueError('Unsupported array format version {}'.format(version))
+        tree_size = int(arrays['tree_size'])
+        # Arrays written before sampling policies were added describe a FIFO
+        # forest
+        if 'sampling' in arrays:
+            sampling = str(arrays['sampling'])
+            decay = float(arrays['decay'])
+        else:
+            sampling, decay = 'fifo', 0.
+        forest = cls(num_trees=int(arrays['num_trees']),
+                     tree_size=None if tree_size < 0 else tree_size,
+                     random_state=random_state, sampling=sampling, decay=decay)
+        # Read each array from the container once
+        arrays = {name: arrays[name] for name in
+                  _FOREST_ARRAYS + _SAMPLING_ARRAYS if name in arrays}
+        for k, tree in enumerate(forest.trees):
+            tree_arrays = _tree_arrays(arrays, k)
+            if lazy:
+                forest.trees[k] = MappedRCTree(tree_arrays, tree=tree)
+            else:
+                tree.load_arrays(tree_arrays)
+        # Rebuild duplicate map and insertion order
+        points = arrays['points']
+        for index, point in zip(arrays['indexes'].tolist(), points):
+            key = point.tobytes()
+            forest._duplicates.setdefault(key, []).append(index)
+            forest._keys[index] = key
+        forest._fifo.extend(arrays['fifo'].tolist())
+        # Each tree holds a label once, so counting labels over all trees gives
+        # the number of trees holding each index, without building leaves
+        labels = arrays['labels']
+        if labels.dtype.kind == 'O':
+            for index in labels.tolist():
+                forest._holders[index] = forest._holders.get(index, 0) + 1
+        else:
+            labels, counts = np.unique(labels, return_counts=True)
+            forest._holders = dict(zip(labels.tolist(), counts.tolist()))
+        if 'sampling' in arrays:
+            forest._time = int(arrays['time'])
+            entries = list(zip(arrays['heap_priority'].tolist(),
+                               arrays['heap_time'].tolist(),
+                               arrays['heap_index'].tolist()))
+            offsets = arrays['heap_offsets'].tolist()
+            # Heaps were written in heap order
+            forest._heaps = [entries[start:stop] for start, stop
+                             in zip(offsets[:-1], offsets[1:])]
+            if arrays['forest_rng_keys'].size:
+                forest.rng = np.random.RandomState()
+                forest.rng.set_state(
+                    ('MT19937', np.array(arrays['forest_rng_keys']),
+                     int(arrays['forest_rng_pos']),
+                     int(arrays['forest_rng_has_gauss']),
+                     float(arrays['forest_rng_gauss'])))
+        if forest._keys:
+            forest.ndim = points.shape[1]
+        return forest
+
+    def save(self, file, mmap=False):
+        """
+        Writes RCForest to a binary .npz file (see to_arrays).
+
+        Parameters:
+        -----------
+        file: str, pathlib.Path or file-like object
+              File to write to.
+        mmap: bool (optional) (default=False)
+              If True, file is a directory, and each array is written to its
+              own .npy file so that it can be memory-mapped by load.
+
+        Example:
+        --------
+        # Write forest to file and read it back
+        >>> forest = RCForest.from_batch(np.random.randn(1000, 3), num_trees=10)
+        >>> forest.save('forest.npz')
+        >>> forest = RCForest.load('forest.npz')
+
+        # Write forest to a directory and memory-map it
+        >>> forest.save('forest', mmap=True)
+        >>> forest = RCForest.load('forest', mmap=True)
+        """
+        arrays = self.to_arrays()
+        if not mmap:
+            np.savez(file, **arrays)
+            return
+        os.makedirs(file, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(file, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, file, allow_pickle=False, random_state=None, mmap=False):
+        """
+        Reads an RCForest from a binary .npz file written by save.
+
+        With mmap=True, the arrays written to a directory by save are
+        memory-mapped rather than read, so that load time does not depend on
+        the size of the trees, and processes loading the same snapshot share
+        its pages. Each tree is a MappedRCTree, which scores points straight
+        from the mapped arrays and is only built when first modified.
+
+        Parameters:
+        -----------
+        file: str, pathlib.Path or file-like object
+              File (or directory, if mmap is True) to read from.
+        allow_pickle: bool (optional) (default=False)
+                      Must be True to load index labels that are not all
+                      integers, floats or strings. Only enable for trusted
+                      files. Such labels are read rather than mapped.
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Used to seed the trees of the new forest (see RCForest).
+        mmap: bool (optional) (default=False)
+              If True, memory-map the arrays in directory file.
+
+        Returns:
+        --------
+        forest: rrcf.RCForest
+        """
+        if not mmap:
+            with np.load(file, allow_pickle=allow_pickle) as arrays:
+                return cls.from_arrays(arrays, random_state=random_state)
+        arrays = {}
+        for filename in os.listdir(file):
+            name, ext = os.path.splitext(filename)
+            if ext != '.npy':
+                continue
+            path = os.path.join(file, filename)
+            try:
+                arrays[name] = np.load(path, mmap_mode='r')
+            except ValueError:
+                # Arrays of objects cannot be memory-mapped
+                arrays[name] = np.load(path, allow_pickle=allow_pickle)
+        return cls.from_arrays(arrays, random_state=random_state, lazy=True)
+
+    def enable_stats(self, callback=None):
+        """
+        Starts collecting statistics about insert, forget and update, summed
+        over all trees (see Stats).
+
+        Parameters:
+        -----------
+        callback: callable (optional) (default=None)
+                  Called with a dict describing each operation (see Stats).
+
+        Returns:
+        --------
+        stats: rrcf.Stats
+               Collector of statistics (also stored as self.stats).
+
+        Example:
+        --------
+        # Find the slowest update
+        >>> forest = RCForest(num_trees=40, tree_size=256)
+        >>> stats = forest.enable_stats()
+        >>> for index, point in enumerate(np.random.randn(1000, 2)):
+                score = forest.update(point, index)
+        >>> stats.snapshot()['update']['max_seconds']
+        """
+        self.stats = Stats(callback=callback)
+        for tree in self.trees:
+            tree.stats = self.stats
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stops collecting statistics.
+        """
+        self.stats = None
+        for tree in self.trees:
+            tree.stats = None
+
+    def enable_locking(self):
+        """
+        Makes the forest safe to use from a single writer thread and many
+        reader threads, by locking the forest and each tree (see
+        RCTree.enable_locking).
+
+        Writes hold the lock of the forest for their whole duration, since
+        they change the indices held by the forest as well as its trees, while
+        reads only wait for the write in progress and run alongside each
+        other. Each read sees the forest between two writes.
+
+        Example:
+        --------
+        # Score points on demand while another thread updates the forest
+        >>> forest = RCForest(num_trees=40, tree_size=256)
+        >>> forest.enable_locking()
+        >>> def consume(stream):
+                for index, point in enumerate(stream):
+                    forest.update(point, index)
+        >>> threading.Thread(target=consume, args=(stream,)).start()
+        >>> forest.score_points(np.random.randn(10, 2))
+        """
+        self.lock = RWLock()
+        for tree in self.trees:
+            tree.enable_locking()
+
+    def disable_locking(self):
+        """
+        Stops locking the forest and its trees.
+        """
+        self.lock = None
+        for tree in self.trees:
+            tree.disable_locking()
+
+    def _release(self, x):
+        """
+        Removes a reference to the row of the store viewed by x, freeing the
+        row if it is no longer referenced.
+        """
+        row = self.store.row_of(x)
+        if row is None:
+            return
+        self._refs[row] -= 1
+        if not self._refs[row]:
+            del self._refs[row]
+            self.store.remove(row)
+
+    def _insert_trees(self, point, index, trees, tolerance=None,
+                      old_index=None):
+        """
+        Inserts a validated point into each tree in trees, records it in the
+        forest, and returns the sum of its collusive displacement over trees
+        (see RCTree.insert_and_score). If old_index is provided, it is first
+        deleted from each tree holding it, and the branch freed is reused.
+        """
+        spares = [None] * len(trees)
+        if old_index is not None:
+            self._drop(old_index)
+            # Free the row of the old point before storing the new one
+            for k, tree in enumerate(trees):
+                with writing(tree):
+                    if old_index in tree.leaves:
+                        # Leaves holding duplicates outlive the index
+                        removed = tree.leaves[old_index].n == 1
+                        leaf, spares[k] = tree._forget(old_index)
+                        if removed and self.store is not None:
+                            self._release(leaf.x)
+        key = point.tobytes()
+        same = self._duplicates.get(key)
+        # Store point once for all trees
+        if self.store is None:
+            self.store = PointStore(point.size,
+                                    capacity=self.tree_size or 1024)
+        row = self.store.add(point)
+        x, b = self.store.get(row), self.store.get_bbox(row)
+        refs = 0
+        total = 0.
+        for tree, spare in zip(trees, spares):
+            with writing(tree):
+                if tree.root is None:
+                    tree._insert_root(x, index, b=b)
+                    refs += 1
+                    continue
+                if tolerance is None:
+                    duplicate = self._find_duplicate(tree, same)
+                else:
+                    duplicate = tree.find_duplicate(point, tolerance=tolerance)
+                if duplicate is None:
+                    _, codisp = tree._insert_leaf(x, index, b=b, score=True,
+                                                  spare=spare)
+                    refs += 1
+                else:
+                    _, codisp = tree._insert_duplicate(duplicate, index,
+                                                       score=True)
+                total += codisp
+        if refs:
+            self._refs[row] = refs
+        else:
+            self.store.remove(row)
+        if self.ndim is None:
+            self.ndim = point.size
+        self._duplicates.setdefault(key, []).append(index)
+        self._keys[index] = key
+        self._holders[index] = len(trees)
+        if self.sampling == 'fifo':
+            self._fifo.append(index)
+        return total
+
+    def _forget_tree(self, tree, index):
+        """
+        Deletes a point from one tree, and from the forest once no tree holds it.
+        """
+        with writing(tree):
+            # Leaves holding duplicates outlive the index
+            removed = tree.leaves[index].n == 1
+            leaf = tree.forget_point(index)
+        # Free the row of the point once no leaf references it
+        if removed and self.store is not None:
+            self._release(leaf.x)
+        self._holders[index] -= 1
+        if not self._holders[index]:
+            self._drop(index)
+
+    def _drop(self, index):
+        """
+        Removes an index held by no tree from the forest.
+        """
+        key = self._keys.pop(index)
+        self._holders.pop(index, None)
+        same = self._duplicates[key]
+        same.remove(index)
+        if not same:
+            del self._duplicates[key]
+        if not self._keys:
+            self.ndim = None
+
+    def _update_reservoir(self, point, index, tolerance=None):
+        """
+        Inserts a point into the trees that sample it, dropping the point with
+        the lowest priority from each, and returns its anomaly score.
+        """
+        point = self._validate_point(point)
+        if index in self._keys:
+            raise KeyError("Index already exists in forest.")
+        time = self._time
+        self._time += 1
+        # Keeping the points with the largest decay * t - log(-log(u)), for u
+        # uniform on (0, 1), samples points with weight exp(decay * t)
+        u = self.rng.random_sample(self.num_trees)
+        with np.errstate(divide='ignore'):
+            priorities = self.decay * time - np.log(-np.log(u))
+        accepted = []
+        for k, tree in enumerate(self.trees):
+            heap = self._heaps[k]
+            if len(tree.leaves) >= self.tree_size:
+                # Skip points that have already been forgotten
+                while heap and heap[0][2] not in tree.leaves:
+                    heapq.heappop(heap)
+                if not heap or priorities[k] <= heap[0][0]:
+                    continue
+                lowest = heapq.heappop(heap)[2]
+                self._forget_tree(tree, lowest)
+            heapq.heappush(heap, (priorities[k], time, index))
+            accepted.append(tree)
+        # Score point in trees that do not sample it without modifying them
+        total = 0.
+        if len(accepted) < self.num_trees:
+            same = self._duplicates.get(point.tobytes())
+            chosen = set(map(id, accepted))
+            for tree in self.trees:
+                if id(tree) in chosen or tree.root is None:
+                    continue
+                with reading(tree):
+                    if tolerance is None:
+                        duplicate = self._find_duplicate(tree, same)
+                    else:
+                        duplicate = tree.find_duplicate(point,
+                                                        tolerance=tolerance)
+                    # Cuts are part of the update, so they are replayed
+                    total += tree._score_point(point, duplicate, rng=tree.rng)
+        if accepted:
+            total += self._insert_trees(point, index, accepted, tolerance)
+        return total / self.num_trees
+
+    def _sample_inserted(self, indexes):
+        """
+        Gives points just inserted into every tree a priority in each tree (see
+        _update_reservoir), and forgets the lowest priority points from trees
+        holding more than tree_size points.
+        """
+        times = np.arange(self._time, self._time + len(indexes))
+        self._time += len(indexes)
+        u = self.rng.random_sample((len(indexes), self.num_trees))
+        with np.errstate(divide='ignore'):
+            priorities = self.decay * times[:, None] - np.log(-np.log(u))
+        times = times.tolist()
+        for k, tree in enumerate(self.trees):
+            heap = self._heaps[k]
+            for j, index in enumerate(indexes):
+                heapq.heappush(heap, (priorities[j, k], times[j], index))
+            while len(tree.leaves) > self.tree_size:
+                lowest = heapq.heappop(heap)[2]
+                # Skip points that have already been forgotten
+                if lowest in tree.leaves:
+                    self._forget_tree(tree, lowest)
+
+    def _top_priorities(self, index_labels, size):
+        """
+        Draws priorities for points added in the order of index_labels (see
+        _update_reservoir), and returns the positions of the size points with
+        the highest priorities, and a heap of their entries.
+        """
+        n = len(index_labels)
+        u = self.rng.random_sample(n)
+        with np.errstate(divide='ignore'):
+            priorities = self.decay * np.arange(n) - np.log(-np.log(u))
+        sample = np.argpartition(-priorities, size - 1)[:size]
+        heap = list(zip(priorities[sample].tolist(), sample.tolist(),
+                        index_labels[sample].tolist()))
+        heapq.heapify(heap)
+        return sample, heap
+
+    def _make_room(self):
+        """
+        Forgets the oldest points until no tree is full.
+        """
+        if self.tree_size is not None:
+            while self._is_full():
+                oldest = self._fifo.popleft()
+                # Skip points that have already been forgotten
+                if oldest in self._keys:
+                    self.forget(oldest)
+
+    def _is_full(self):
+        """
+        Returns True if any tree holds tree_size points.
+        """
+        return any(len(tree.leaves) >= self.tree_size for tree in self.trees)
+
+    def _validate_point(self, point):
+        """
+        Returns a flattened float copy of point, checking its dimension.
+        """
+        point = np.array(point, dtype=float).ravel()
+        # Treat -0.0 and 0.0 as the same point
+        point += 0.0
+        if self.ndim is not None and point.size != self.ndim:
+            raise ValueError(
+                "Point must be same dimension as existing points in forest.")
+        return point
+
+    def _find_duplicate(self, tree, same):
+        """
+        Returns the leaf of tree holding any of the indices in same, or None.
+        """
+        if same:
+            for j in same:
+                leaf = tree.leaves.get(j)
+                if leaf is not None:
+                    return leaf
+        return None
+
+
+# Names of the arrays written by RCForest.to_arrays
+_FOREST_ARRAYS = ('version', 'num_trees', 'tree_size', 'left', 'right', 'q',
+                  'p', 'n', 'row', 'x', 'i', 'b', 'labels', 'label_row',
+                  'node_offsets', 'leaf_offsets', 'branch_offsets',
+                  'label_offsets', 'indexes', 'points', 'fifo')
+# Names of the arrays describing the sampling policy (optional)
+_SAMPLING_ARRAYS = ('sampling', 'decay', 'time', 'heap_priority', 'heap_time',
+                    'heap_index', 'heap_offsets', 'forest_rng_keys',
+                    'forest_rng_pos', 'forest_rng_has_gauss',
+                    'forest_rng_gauss')
+
+
+def _tree_arrays(arrays, k):
+    """
+    Returns the slices of the arrays of a forest belonging to tree k.
+    """
+    tree_arrays = {'version': arrays['version']}
+    for offsets, names in (('node_offsets', ('left', 'right', 'q', 'p', 'n',
+                                             'row')),
+                           ('leaf_offsets', ('x', 'i')),
+                           ('branch_offsets', ('b',)),
+                           ('label_offsets', ('labels', 'label_row'))):
+        start, stop = int(arrays[offsets][k]), int(arrays[offsets][k + 1])
+        for name in names:
+            tree_arrays[name] = arrays[name][start:stop]
+    return tree_arrays
@@ -0,0 +1,276 @@
+import os
+import pickle
+import numpy as np
+from rrcf.rrcf import RCTree
+from rrcf.forest import RCForest
+
+
+class Journal:
+    """
+    Append-only journal of the operations applied to an RCTree or RCForest,
+    with periodic snapshots for fast crash recovery.
+
+    Every operation that modifies the target (insert, forget, update and their
+    batch and replace variants) is appended to a journal file before it
+    returns. Operations applied to the target directly are not journaled.
+    A checkpoint writes a binary snapshot of the tree or forest (see save),
+    including the state of the random number generator of every tree, and then
+    truncates the journal. Recovery loads the last snapshot and replays the
+    operations journaled since, which draws exactly the same cuts.
+
+    Cuts and samples drawn from the shared np.random generator cannot be
+    replayed, so every tree (and forest) that uses np.random is given its own
+    generator, seeded from np.random, when the journal is created.
+
+    Parameters:
+    -----------
+    directory: str or pathlib.Path
+               Directory holding the snapshot and the journal.
+    target: RCTree or RCForest
+            Tree or forest to journal. A snapshot is written immediately.
+    checkpoint_every: int (optional) (default=None)
+                      If provided, a checkpoint is made after this many
+                      operations.
+    sync: bool (optional) (default=False)
+          If True, the journal is flushed to disk (fsync) after every
+          operation, so that no acknowledged operation is lost if the machine
+          crashes. Otherwise operations survive a crash of the process.
+
+    Attributes:
+    -----------
+    target: RCTree or RCForest
+            Tree or forest being journaled.
+    seq: int
+         Number of operations applied since the journal was first created.
+
+    Example:
+    --------
+    # Journal a forest, checkpointing every 1000 operations
+    >>> forest = rrcf.RCForest(num_trees=40, tree_size=256, random_state=0)
+    >>> journal = Journal('state', forest, checkpoint_every=1000)
+    >>> for index, point in enumerate(np.random.randn(5000, 2)):
+            score = journal.update(point, index)
+
+    # After a crash, recover the forest from the snapshot and the journal
+    >>> journal = Journal.recover('state')
+    >>> forest = journal.target
+    """
+
+    def __init__(self, directory, target, checkpoint_every=None, sync=False):
+        self.directory = str(directory)
+        self.target = target
+        self.checkpoint_every = checkpoint_every
+        self.sync = sync
+        self.seq = 0
+        self._file = None
+        self._since_checkpoint = 0
+        for tree in _trees(target):
+            if tree.rng is np.random:
+                tree.rng = np.random.RandomState(
+                    np.random.randint(np.iinfo(np.int32).max))
+        # The forest draws reservoir samples, which must also be replayed
+        if isinstance(target, RCForest) and target.rng is np.random:
+            target.rng = np.random.RandomState(
+                np.random.randint(np.iinfo(np.int32).max))
+        os.makedirs(self.directory, exist_ok=True)
+        self.checkpoint()
+
+    @classmethod
+    def recover(cls, directory, checkpoint_every=None, sync=False):
+        """
+        Restores a tree or forest from the last snapshot in directory, and
+        replays the operations journaled since.
+
+        Parameters:
+        -----------
+        directory: str or pathlib.Path
+                   Directory holding the snapshot and the journal.
+        checkpoint_every: int (optional) (default=None)
+                          See Journal.
+        sync: bool (optional) (default=False)
+              See Journal.
+
+        Returns:
+        --------
+        journal: rrcf.Journal
+                 Journal of the recovered tree or forest (see target), which
+                 continues to append to the same directory.
+        """
+        self = cls.__new__(cls)
+        self.directory = str(directory)
+        self.checkpoint_every = checkpoint_every
+        self.sync = sync
+        self._file = None
+        self._since_checkpoint = 0
+        with np.load(self._path('snapshot.npz'), allow_pickle=True) as arrays:
+            arrays = dict(arrays)
+        self.seq = int(arrays.pop('seq'))
+        keys = arrays.pop('rng_keys')
+        pos = arrays.pop('rng_pos')
+        has_gauss = arrays.pop('rng_has_gauss')
+        gauss = arrays.pop('rng_gauss')
+        if str(arrays.pop('kind')) == 'forest':
+            self.target = RCForest.from_arrays(arrays)
+        else:
+            self.target = RCTree.from_arrays(arrays)
+        for k, tree in enumerate(_trees(self.target)):
+            tree.rng = np.random.RandomState()
+            tree.rng.set_state(('MT19937', keys[k], int(pos[k]),
+                                int(has_gauss[k]), float(gauss[k])))
+        # Replay operations made after the snapshot
+        if os.path.exists(self._path('journal')):
+            with open(self._path('journal'), 'rb') as journal:
+                while True:
+                    try:
+                        seq, method, args = pickle.load(journal)
+                    except (EOFError, pickle.UnpicklingError):
+                        # End of journal, or record torn by a crash
+                        break
+                    if seq < self.seq:
+                        continue
+                    getattr(self.target, method)(*args)
+                    self.seq = seq + 1
+        self.checkpoint()
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def insert(self, point, index, tolerance=None):
+        """
+        Inserts a point (see RCTree.insert_point and RCForest.insert) and
+        journals the operation.
+        """
+        if isinstance(self.target, RCForest):
+            return self._apply('insert', point, index, tolerance)
+        return self._apply('insert_point', point, index, tolerance)
+
+    def forget(self, index):
+        """
+        Deletes a point (see RCTree.forget_point and RCForest.forget) and
+        journals the operation.
+        """
+        if isinstance(self.target, RCForest):
+            return self._apply('forget', index)
+        return self._apply('forget_point', index)
+
+    def insert_and_score(self, point, index, tolerance=None):
+        """
+        Inserts a point and returns its anomaly score (see
+        RCTree.insert_and_score and RCForest.insert_and_score), and journals
+        the operation.
+        """
+        return self._apply('insert_and_score', point, index, tolerance)
+
+    def replace(self, old_index, point, index, tolerance=None):
+        """
+        Deletes a point and inserts a new point in one step (see
+        RCTree.replace_point and RCForest.replace), and journals the
+        operation.
+        """
+        if isinstance(self.target, RCForest):
+            return self._apply('replace', old_index, point, index, tolerance)
+        return self._apply('replace_point', old_index, point, index,
+                           tolerance)
+
+    def insert_points(self, X, indexes, tolerance=None):
+        """
+        Inserts a batch of points (see RCTree.insert_points and
+        RCForest.insert_points) and journals the operation.
+        """
+        # Journal the batch as given to the target, even if indexes is an
+        # iterator
+        return self._apply('insert_points', np.array(X, dtype=float),
+                           list(indexes), tolerance)
+
+    def forget_points(self, indexes):
+        """
+        Deletes a batch of points (see RCTree.forget_points and
+        RCForest.forget_points) and journals the operation.
+        """
+        return self._apply('forget_points', list(indexes))
+
+    def update(self, point, index, tolerance=None):
+        """
+        Inserts a point into a forest, dropping the oldest points if it is full,
+        and journals the operation (see RCForest.update).
+        """
+        if not isinstance(self.target, RCForest):
+            raise TypeError('update is only supported for an RCForest.')
+        return self._apply('update', point, index, tolerance)
+
+    def checkpoint(self):
+        """
+        Writes a snapshot of the tree or forest and truncates the journal.
+
+        The snapshot is written to a temporary file and renamed, so a crash
+        during a checkpoint leaves the previous snapshot and journal intact.
+        """
+        arrays = self.target.to_arrays()
+        trees = _trees(self.target)
+        states = [tree.rng.get_state() for tree in trees]
+        arrays['kind'] = np.array('forest' if isinstance(self.target, RCForest)
+                                  else 'tree')
+        arrays['seq'] = np.array(self.seq)
+        arrays['rng_keys'] = np.array([state[1] for state in states],
+                                      dtype=np.uint32).reshape(len(trees), -1)
+        arrays['rng_pos'] = np.array([state[2] for state in states])
+        arrays['rng_has_gauss'] = np.array([state[3] for state in states])
+        arrays['rng_gauss'] = np.array([state[4] for state in states])
+        temp = self._path('snapshot.tmp.npz')
+        with open(temp, 'wb') as snapshot:
+            np.savez(snapshot, **arrays)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temp, self._path('snapshot.npz'))
+        # Records older than the snapshot are skipped on recovery, so a crash
+        # before the journal is truncated is harmless
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._path('journal'), 'wb')
+        self._since_checkpoint = 0
+
+    def close(self):
+        """
+        Flushes and closes the journal.
+        """
+        if self._file is not None:
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _apply(self, method, *args):
+        """
+        Applies an operation to the target and appends it to the journal.
+        """
+        if self._file is None:
+            raise RuntimeError('Journal has been closed.')
+        result = getattr(self.target, method)(*args)
+        pickle.dump((self.seq, method, args), self._file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self.seq += 1
+        self._since_checkpoint += 1
+        if (self.checkpoint_every is not None
+                and self._since_checkpoint >= self.checkpoint_every):
+            self.checkpoint()
+        return result
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+
+def _trees(target):
+    """
+    Returns the trees of an RCTree or RCForest.
+    """
+    if isinstance(target, RCForest):
+        return target.trees
+    return [target]
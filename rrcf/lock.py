@@ -0,0 +1,174 @@
+import contextlib
+import functools
+import threading
+
+
+class RWLock:
+    """
+    Read-write lock that lets many threads read a tree at once while a single
+    thread writes to it (see RCTree.enable_locking and RCForest.enable_locking).
+
+    Writers take priority: once a writer is waiting, new readers wait until it
+    is done, so a writer only waits for the reads already in progress. In turn,
+    the readers waiting when a writer is done go before the next writer, so
+    that a busy writer cannot hold them up indefinitely. Both
+    kinds of lock are reentrant, and the thread holding the write lock may also
+    read. A thread holding only the read lock cannot take the write lock.
+
+    Example:
+    --------
+    >>> lock = RWLock()
+    >>> with lock.read():
+            ...
+    >>> with lock.write():
+            ...
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting = 0
+        # Readers waiting for the lock, and the number of them let in ahead of
+        # waiting writers when the last writer was done
+        self._waiting_readers = 0
+        self._admit = 0
+        # Thread holding the write lock, and its number of nested acquisitions
+        self._owner = None
+        self._depth = 0
+        # Number of nested read acquisitions of each thread
+        self._local = threading.local()
+
+    def acquire_read(self):
+        """
+        Waits until no writer holds or waits for the lock, and acquires it
+        for reading.
+        """
+        if self._owner == threading.get_ident():
+            self._depth += 1
+            return
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            with self._cond:
+                self._waiting_readers += 1
+                try:
+                    while (self._owner is not None
+                           or (self._waiting and not self._admit)):
+                        self._cond.wait()
+                finally:
+                    self._waiting_readers -= 1
+                if self._admit:
+                    self._admit -= 1
+                self._readers += 1
+        self._local.depth = depth + 1
+
+    def release_read(self):
+        """
+        Releases a read acquisition.
+        """
+        if self._owner == threading.get_ident():
+            self._depth -= 1
+            return
+        self._local.depth -= 1
+        if not self._local.depth:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        """
+        Waits until no other thread holds the lock, and acquires it for writing.
+        """
+        me = threading.get_ident()
+        if self._owner == me:
+            self._depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError('Cannot write while holding the read lock.')
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._owner is not None or self._readers or self._admit:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._owner = me
+            self._depth = 1
+
+    def release_write(self):
+        """
+        Releases a write acquisition.
+        """
+        if self._owner != threading.get_ident():
+            raise RuntimeError('Write lock is not held by this thread.')
+        self._depth -= 1
+        if not self._depth:
+            with self._cond:
+                self._owner = None
+                self._admit = self._waiting_readers
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        """
+        Context manager holding the lock for reading.
+        """
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Context manager holding the lock for writing.
+        """
+        self.acquire_write()
+        try:
+            yield self
+        finally:
+            self.release_write()
+
+
+def synchronized(mode):
+    """
+    Decorator that holds the `lock` attribute of an object for reading or
+    writing (mode is 'read' or 'write') during calls to a method, when lock is
+    not None.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            lock = self.lock
+            if lock is None:
+                return method(self, *args, **kwargs)
+            if mode == 'read':
+                acquire, release = lock.acquire_read, lock.release_read
+            else:
+                acquire, release = lock.acquire_write, lock.release_write
+            acquire()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                release()
+        return wrapper
+    return decorator
+
+
+def reading(obj):
+    """
+    Returns a context manager holding the lock of obj for reading, if any.
+    """
+    if obj.lock is None:
+        return contextlib.nullcontext()
+    return obj.lock.read()
+
+
+def writing(obj):
+    """
+    Returns a context manager holding the lock of obj for writing, if any.
+    """
+    if obj.lock is None:
+        return contextlib.nullcontext()
+    return obj.lock.write()
@@ -0,0 +1,242 @@
+from collections.abc import Mapping
+import threading
+import numpy as np
+from rrcf.rrcf import RCTree
+
+
+class MappedRCTree:
+    """
+    Read-only view of an RCTree stored as flat arrays (see RCTree.to_arrays),
+    which is only built into a live RCTree when first modified.
+
+    Collusive displacement is computed straight from the arrays, which may be
+    memory-mapped from a forest snapshot (see RCForest.load). Accessing any
+    other attribute or method of RCTree builds the live tree from a copy of the
+    arrays, and forwards to it from then on.
+
+    Parameters:
+    -----------
+    arrays: dict
+            Flat arrays representing all nodes in the tree.
+    tree: RCTree (optional) (default=None)
+          Empty tree to load the arrays into when built. Defaults to a new
+          RCTree.
+
+    Attributes:
+    -----------
+    arrays: dict
+            Flat arrays representing all nodes in the tree.
+    materialized: bool
+                  True once the live tree has been built.
+    leaves: dict or Mapping
+            Indices of the leaves in the tree. Membership tests and len do not
+            build the live tree; looking up a Leaf does.
+
+    Example:
+    --------
+    # Create mapped tree
+    >>> X = np.random.randn(100, 2)
+    >>> tree = MappedRCTree(rrcf.RCTree(X).to_arrays())
+
+    # Compute collusive displacement without building the tree
+    >>> tree.codisp(0)
+    >>> tree.materialized
+
+    False
+    """
+
+    def __init__(self, arrays, tree=None):
+        self._tree = RCTree() if tree is None else tree
+        self.arrays = arrays
+        self.materialized = False
+        # Held while building the live tree
+        self._build_lock = threading.Lock()
+        # Position of the leaf of each index, and parent of each node
+        self._positions = None
+        self._parent = None
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on MappedRCTree
+        if name.startswith('__') or name in ('_tree', 'arrays', '_build_lock'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __repr__(self):
+        if self.materialized:
+            return repr(self._tree)
+        return "MappedRCTree(nodes={}, leaves={})".format(
+            len(self.arrays['n']), len(self.arrays['labels']))
+
+    @property
+    def stats(self):
+        return self._tree.stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._tree.stats = stats
+
+    @property
+    def lock(self):
+        return self._tree.lock
+
+    @lock.setter
+    def lock(self, lock):
+        self._tree.lock = lock
+
+    @property
+    def leaves(self):
+        if self.materialized:
+            return self._tree.leaves
+        return _MappedLeaves(self)
+
+    def materialize(self):
+        """
+        Builds the live RCTree from a copy of the arrays, if not yet built.
+
+        The live tree is built without taking its lock, so that readers holding
+        the lock can build it: until it is built, every reader scores from the
+        arrays instead.
+
+        Returns:
+        --------
+        tree: rrcf.RCTree
+        """
+        if not self.materialized:
+            with self._build_lock:
+                if not self.materialized:
+                    self._tree._load_arrays({name: np.array(array)
+                                             for name, array
+                                             in self.arrays.items()})
+                    self._positions = None
+                    self._parent = None
+                    self.materialized = True
+        return self._tree
+
+    def enable_locking(self):
+        """
+        Locks the live tree (see RCTree.enable_locking), without building it.
+        Until built, readers score from the arrays, which are never modified.
+        """
+        return self._tree.enable_locking()
+
+    def disable_locking(self):
+        """
+        Stops locking the live tree.
+        """
+        self._tree.disable_locking()
+
+    def codisp(self, leaf):
+        """
+        Compute collusive displacement at leaf (see RCTree.codisp)
+
+        Parameters:
+        -----------
+        leaf: index of leaf or Leaf instance
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement if leaf is removed.
+        """
+        if self.materialized:
+            return self._tree.codisp(leaf)
+        try:
+            pos = self._leaf_positions()[leaf]
+        except (KeyError, TypeError):
+            return self.materialize().codisp(leaf)
+        parent = self._parents()
+        left, right, n = (self.arrays[name] for name in ('left', 'right', 'n'))
+        co_displacement = 0
+        while parent[pos] >= 0:
+            u = parent[pos]
+            sibling = right[u] if left[u] == pos else left[u]
+            co_displacement = max(co_displacement, n[sibling] / n[pos])
+            pos = u
+        return co_displacement
+
+    def codisp_all(self, indexes=None):
+        """
+        Compute collusive displacement of all leaves in a single pass over the
+        arrays (see RCTree.codisp_all)
+
+        Parameters:
+        -----------
+        indexes: sequence (optional) (default=None)
+                 Indices of leaves to return the collusive displacement of.
+                 Defaults to all indices in self.leaves.
+
+        Returns:
+        --------
+        codisplacement: np.ndarray
+                        Collusive displacement of each index, in the order of
+                        indexes.
+        """
+        if self.materialized:
+            return self._tree.codisp_all(indexes)
+        positions = self._leaf_positions()
+        if indexes is None:
+            indexes = list(positions)
+        left = self.arrays['left'].tolist()
+        right = self.arrays['right'].tolist()
+        n = self.arrays['n'].tolist()
+        # Children follow their parent in preorder
+        codisp = [0.] * len(n)
+        for pos, l in enumerate(left):
+            if l >= 0:
+                r = right[pos]
+                codisp[l] = max(codisp[pos], n[r] / n[l])
+                codisp[r] = max(codisp[pos], n[l] / n[r])
+        try:
+            return np.fromiter((codisp[positions[i]] for i in indexes),
+                               dtype=float, count=len(indexes))
+        except KeyError:
+            raise KeyError('indexes must be keys to self.leaves')
+
+    def _leaf_positions(self):
+        """
+        Returns a dict mapping each index to the position of its leaf.
+        """
+        if self._positions is None:
+            leaf_positions = np.flatnonzero(np.asarray(self.arrays['left']) < 0)
+            positions = leaf_positions[self.arrays['label_row']]
+            self._positions = dict(zip(self.arrays['labels'].tolist(),
+                                       positions.tolist()))
+        return self._positions
+
+    def _parents(self):
+        """
+        Returns the position of the parent of each node (-1 for the root).
+        """
+        if self._parent is None:
+            left = np.asarray(self.arrays['left'])
+            right = np.asarray(self.arrays['right'])
+            parent = np.full(left.size, -1, dtype=np.int64)
+            branches = np.flatnonzero(left >= 0)
+            parent[left[branches]] = branches
+            parent[right[branches]] = branches
+            self._parent = parent.tolist()
+        return self._parent
+
+
+class _MappedLeaves(Mapping):
+    """
+    Indices of the leaves of a MappedRCTree that has not been built.
+    """
+
+    def __init__(self, tree):
+        self._mapped = tree
+
+    def __contains__(self, index):
+        try:
+            return index in self._mapped._leaf_positions()
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return iter(self._mapped._leaf_positions())
+
+    def __len__(self):
+        return len(self._mapped.arrays['labels'])
+
+    def __getitem__(self, index):
+        return self._mapped.materialize().leaves[index]
@@ -0,0 +1,300 @@
+import os
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from rrcf.rrcf import RCTree
+from rrcf.forest import RCForest
+
+
+class ParallelRCForest:
+    """
+    Robust random cut forest whose trees are split into shards, with each shard
+    held by a separate worker process.
+
+    Trees stay resident in their worker for the lifetime of the forest. Batches
+    of points are written once into a shared memory block that every worker
+    reads from, and workers only send back the collusive displacement of each
+    point in each of their trees.
+
+    Parameters:
+    -----------
+    num_trees: int (optional) (default=100)
+               Number of trees in the forest.
+    tree_size: int (optional) (default=None)
+               Maximum number of points held by each tree (see RCForest).
+    n_jobs: int (optional) (default=None)
+            Number of worker processes. Defaults to the number of CPUs.
+    random_state: int, RandomState instance or None (optional) (default=None)
+        If int or RandomState instance, seeds trees exactly as RCForest would;
+        If None, trees are seeded from np.random. Forked workers inherit the
+        same np.random state, so trees are always given their own seeds.
+
+    Attributes:
+    -----------
+    num_trees: int
+               Number of trees in the forest.
+    n_jobs: int
+            Number of worker processes.
+
+    Example:
+    --------
+    # Create forest with 4 workers
+    >>> forest = ParallelRCForest(num_trees=100, tree_size=256, n_jobs=4)
+
+    # Insert batches of points and compute their anomaly scores
+    >>> X = np.random.randn(1000, 3)
+    >>> for start in range(0, 1000, 100):
+            scores = forest.update(X[start:start + 100],
+                                   range(start, start + 100))
+
+    # Shut down workers
+    >>> forest.close()
+    """
+
+    def __init__(self, num_trees=100, tree_size=None, n_jobs=None,
+                 random_state=None):
+        self._shm = None
+        self._conns = []
+        self._workers = []
+        if n_jobs is None:
+            n_jobs = os.cpu_count() or 1
+        n_jobs = max(1, min(n_jobs, num_trees))
+        # Draw tree seeds in the same way as RCForest
+        if isinstance(random_state, (int, np.integer)):
+            rng = np.random.RandomState(random_state)
+        elif isinstance(random_state, np.random.RandomState):
+            rng = random_state
+        else:
+            rng = np.random
+        seeds = rng.randint(np.iinfo(np.int32).max, size=num_trees)
+        self.num_trees = num_trees
+        self.tree_size = tree_size
+        self.n_jobs = n_jobs
+        ctx = mp.get_context()
+        # Start the resource tracker before forking, so that workers share it
+        # and shared memory is only cleaned up by this process
+        resource_tracker.ensure_running()
+        for shard in np.array_split(np.arange(num_trees), n_jobs):
+            parent_conn, child_conn = ctx.Pipe()
+            shard_seeds = [seeds[i] for i in shard]
+            worker = ctx.Process(target=_worker,
+                                 args=(child_conn, shard_seeds, tree_size),
+                                 daemon=True)
+            worker.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def insert(self, points, indexes, tolerance=None):
+        """
+        Inserts a batch of points into every tree
+
+        Parameters:
+        -----------
+        points: np.ndarray (k x d)
+        indexes: sequence of length k
+                 Identifiers for new points in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+        """
+        self._call('insert', self._publish(points), list(indexes), tolerance)
+
+    def forget(self, indexes):
+        """
+        Deletes a batch of points from every tree containing them
+
+        Parameters:
+        -----------
+        indexes: sequence
+                 Indices of points in forest
+        """
+        self._call('forget', list(indexes))
+
+    def codisp(self, indexes):
+        """
+        Compute collusive displacement of a batch of points in every tree
+
+        Parameters:
+        -----------
+        indexes: sequence of length k
+                 Indices of points in forest
+
+        Returns:
+        --------
+        codisplacement: np.ndarray (k x num_trees)
+                        Collusive displacement of each point in each tree
+                        (NaN if a tree does not contain the point).
+        """
+        return np.hstack(self._call('codisp', list(indexes)))
+
+    def score(self, indexes):
+        """
+        Compute average collusive displacement of a batch of points
+
+        Parameters:
+        -----------
+        indexes: sequence of length k
+                 Indices of points in forest
+
+        Returns:
+        --------
+        scores: np.ndarray (k)
+        """
+        return np.nanmean(self.codisp(indexes), axis=1)
+
+    def update(self, points, indexes, tolerance=None):
+        """
+        Inserts a batch of points one at a time, dropping the oldest points
+        if the forest is full (see RCForest.update), and returns their
+        anomaly scores.
+
+        Parameters:
+        -----------
+        points: np.ndarray (k x d)
+        indexes: sequence of length k
+                 Identifiers for new points in forest
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        scores: np.ndarray (k)
+                Average collusive displacement of each point when inserted.
+        """
+        results = self._call('update', self._publish(points), list(indexes),
+                             tolerance)
+        return np.nanmean(np.hstack(results), axis=1)
+
+    def close(self):
+        """
+        Shuts down worker processes and releases shared memory.
+        """
+        for conn in self._conns:
+            try:
+                conn.send(('close', ()))
+                conn.close()
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.join()
+        self._conns = []
+        self._workers = []
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _publish(self, points):
+        """
+        Copies points into shared memory, returning a description of the block
+        for workers to read from.
+        """
+        points = np.asarray(points, dtype=float)
+        if points.ndim != 2:
+            raise ValueError("Points must be a 2-D array (k x d).")
+        # Grow shared memory block if batch does not fit
+        if self._shm is None or self._shm.size < points.nbytes:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(points.nbytes, 1))
+        buffer = np.ndarray(points.shape, dtype=float, buffer=self._shm.buf)
+        buffer[:] = points
+        return (self._shm.name, points.shape)
+
+    def _call(self, command, *args):
+        """
+        Sends a command to every worker and collects their results in order
+        of shards.
+        """
+        if not self._conns:
+            raise RuntimeError("Forest has been closed.")
+        for conn in self._conns:
+            conn.send((command, args))
+        results = [conn.recv() for conn in self._conns]
+        for ok, result in results:
+            if not ok:
+                raise result
+        return [result for _, result in results]
+
+
+def _attach(name):
+    """
+    Attaches to an existing shared memory block created by the forest.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 the block is registered with the resource tracker
+        # shared with the parent process, which unregisters it on unlink
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker(conn, seeds, tree_size):
+    """
+    Worker process loop holding one shard of trees.
+    """
+    forest = RCForest(num_trees=len(seeds), tree_size=tree_size)
+    forest.trees = [RCTree(random_state=np.random.RandomState(seed))
+                    for seed in seeds]
+    shm = None
+
+    def read(block):
+        nonlocal shm
+        name, shape = block
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()
+            shm = _attach(name)
+        return np.ndarray(shape, dtype=float, buffer=shm.buf)
+
+    def codisp(index):
+        return [tree.codisp(index) if index in tree.leaves else np.nan
+                for tree in forest.trees]
+
+    while True:
+        command, args = conn.recv()
+        if command == 'close':
+            break
+        try:
+            if command == 'insert':
+                block, indexes, tolerance = args
+                for point, index in zip(read(block), indexes):
+                    forest.insert(point, index, tolerance=tolerance)
+                result = None
+            elif command == 'forget':
+                indexes, = args
+                for index in indexes:
+                    forest.forget(index)
+                result = None
+            elif command == 'codisp':
+                indexes, = args
+                result = np.asarray([codisp(index) for index in indexes],
+                                    dtype=float).reshape(len(indexes), -1)
+            elif command == 'update':
+                block, indexes, tolerance = args
+                result = []
+                for point, index in zip(read(block), indexes):
+                    forest._make_room()
+                    forest.insert(point, index, tolerance=tolerance)
+                    result.append(codisp(index))
+                result = np.asarray(result, dtype=float).reshape(
+                    len(indexes), -1)
+            else:
+                raise ValueError("Unknown command {}".format(command))
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, e))
+    if shm is not None:
+        shm.close()
+    conn.close()
@@ -1,4 +1,9 @@
 import numpy as np
+from rrcf.stats import Stats, instrumented
+from rrcf.lock import RWLock, synchronized
+
+# Version of the array format written by RCTree.to_arrays
+ARRAY_FORMAT_VERSION = 1
 
 
 class RCTree:
@@ -23,6 +28,10 @@ class RCTree:
         If int, random_state is the seed used by the random number generator;
         If RandomState instance, random_state is the random number generator;
         If None, the random number generator is the RandomState instance used by np.random.
+    hash_index: bool (optional) (default=False)
+                If True, keep a hash index of leaves keyed on their points
+                (rounded to precision), so that exact duplicates are found
+                without descending the tree (see find_duplicate).
 
     Attributes:
     -----------
@@ -32,21 +41,44 @@ class RCTree:
             Dict containing pointers to all leaves in tree.
     ndim: int
           dimension of points in the tree
+    stats: Stats or None
+           Collector of statistics about operations (see enable_stats).
+    lock: RWLock or None
+          Lock held by each read and write (see enable_locking).
+    precision: int
+               Number of decimals points are rounded to when hashed.
 
     Methods:
     --------
     insert_point: inserts a new point into the tree.
+    insert_points: inserts a batch of points into the tree.
+    insert_and_score: inserts a new point and returns its collusive
+                      displacement.
+    replace_point: deletes a point and inserts a new point in one step.
     forget_point: removes a point from the tree.
+    forget_points: removes a batch of points from the tree.
     disp: compute displacement associated with the removal of a leaf.
     codisp: compute collusive displacement associated with the removal of a leaf
             (anomaly score).
+    codisp_all: compute collusive displacement of all leaves in one pass.
+    score_point: compute collusive displacement of a point without inserting it.
     map_leaves: traverses all nodes in the tree and executes a user-specified
                 function on the leaves.
     map_branches: traverses all nodes in the tree and executes a user-specified
                   function on the branches.
+    iter_leaves: generator over the leaves under a node.
+    iter_branches: generator over the branches under a node.
     query: finds nearest point in tree.
     get_bbox: find bounding box of points under a given node.
     find_duplicate: finds duplicate points in the tree.
+    to_dict / from_dict: serialize tree to and from a nested dict.
+    to_arrays / from_arrays: serialize tree to and from flat arrays.
+    save / load: write tree to and read tree from a binary .npz file.
+    enable_stats / disable_stats: start and stop collecting statistics.
+    enable_hash_index / disable_hash_index: start and stop indexing leaves
+                                            by point.
+    enable_locking / disable_locking: start and stop locking the tree for use
+                                      by one writer and many reader threads.
 
     Example:
     --------
@@ -66,7 +98,7 @@ class RCTree:
     """
 
     def __init__(self, X=None, index_labels=None, precision=9, 
-                 random_state=None):
+                 random_state=None, hash_index=False):
         # Random number generation with provided seed
         if isinstance(random_state, int):
             self.rng = np.random.RandomState(random_state)
@@ -74,11 +106,31 @@ class RCTree:
             self.rng = random_state
         else:
             self.rng = np.random
+        # Generator for scoring, so that reads never change the cuts of later
+        # inserts. It is seeded from the state of a tree's own generator,
+        # which leaves the cuts of the tree unchanged, and otherwise from a
+        # draw, so that trees sharing np.random are seeded differently.
+        if self.rng is np.random:
+            seed = np.random.randint(np.iinfo(np.int32).max)
+        else:
+            seed = self.rng.get_state()[1]
+        self._score_rng = np.random.RandomState(seed)
         # Initialize dict for leaves
         self.leaves = {}
         # Initialize tree root
         self.root = None
         self.ndim = None
+        self.stats = None
+        self.lock = None
+        # Preallocated buffers for bbox maintenance (see _scratch)
+        self._buffers = None
+        self.precision = precision
+        # Map rounded bytes of each point to leaves holding such points, and
+        # each leaf to its key
+        self._hash_index = None
+        self._hash_keys = None
+        if hash_index:
+            self._hash_index, self._hash_keys = {}, {}
         if X is not None:
             # Round data to avoid sorting errors
             X = np.around(X, decimals=precision)
@@ -93,60 +145,83 @@ class RCTree:
             if N.max() > 1:
                 n, d = U.shape
                 X = U
+                # Group index labels by the unique point they belong to
+                order = np.argsort(I.ravel(), kind='stable')
+                J = np.split(np.asarray(index_labels)[order],
+                             np.cumsum(N)[:-1])
             else:
                 n, d = X.shape
                 N = np.ones(n, dtype=int)
-                I = None
+                J = None
             # Store dimension of dataset
             self.ndim = d
-            # Set node above to None in case of bottom-up search
-            self.u = None
             # Create RRC Tree
-            S = np.ones(n, dtype=bool)
-            self._mktree(X, S, N, I, parent=self)
-            # Remove parent of root
-            self.root.u = None
-            # Count all leaves under each branch
-            self._count_all_top_down(self.root)
-            # Set bboxes of all branches
-            self._get_bbox_top_down(self.root)
+            self._build(X, np.arange(n), N, J)
 
     def __repr__(self):
-        depth = ""
         treestr = ""
-
-        def print_push(char):
-            nonlocal depth
-            branch_str = ' {}  '.format(char)
-            depth += branch_str
-
-        def print_pop():
-            nonlocal depth
-            depth = depth[:-4]
-
-        def print_tree(node):
-            nonlocal depth
-            nonlocal treestr
+        # Stack holds strings still to be written and (node, depth) pairs
+        # still to be drawn, so the tree is drawn in preorder
+        stack = [(self.root, "")]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                treestr += item
+                continue
+            node, depth = item
             if isinstance(node, Leaf):
                 treestr += '({})\n'.format(node.i)
             elif isinstance(node, Branch):
                 treestr += '{0}{1}\n'.format(chr(9472), '+')
-                treestr += '{0} {1}{2}{2}'.format(depth, chr(9500), chr(9472))
-                print_push(chr(9474))
-                print_tree(node.l)
-                print_pop()
-                treestr += '{0} {1}{2}{2}'.format(depth, chr(9492), chr(9472))
-                print_push(' ')
-                print_tree(node.r)
-                print_pop()
-
-        print_tree(self.root)
+                stack.append((node.r, depth + '    '))
+                stack.append('{0} {1}{2}{2}'.format(depth, chr(9492), chr(9472)))
+                stack.append((node.l, depth + ' {}  '.format(chr(9474))))
+                stack.append('{0} {1}{2}{2}'.format(depth, chr(9500), chr(9472)))
         return treestr
 
-    def _cut(self, X, S, parent=None, side='l'):
+    def _build(self, X, S, N, J, views=None):
+        """
+        Constructs tree from the rows S of a matrix of unique points X.
+
+        Parameters:
+        -----------
+        X: np.ndarray (m x d)
+           Matrix of unique points. Only rows in S are read, so X may be
+           shared between many trees.
+        S: np.ndarray (n)
+           Rows of X to build the tree from. Reordered in place.
+        N: np.ndarray (m)
+           Number of duplicates of each row of X.
+        J: sequence or None
+           Index labels of each row of X. If None, the label of row i is
+           self.index_labels[i].
+        views: sequence or None
+               Views (x, b) of each row of X to use as the point and bbox of
+               leaves, which may be shared between many trees. If None, views
+               are created for each leaf.
+        """
+        # Set node above to None in case of bottom-up search
+        self.u = None
+        if S.size == 1:
+            i = S[0]
+            x, b = (X[i, :], None) if views is None else views[i]
+            leaf = Leaf(i=i, x=x, n=N[i], b=b)
+            self.root = leaf
+            self._label_leaf(leaf, i, J)
+            if self._hash_index is not None:
+                self._index_leaf(leaf)
+        else:
+            self._mktree(X, S, 0, S.size, N, J, parent=self, views=views)
+            # Remove parent of root
+            self.root.u = None
+
+    def _cut(self, X, S, lo, hi, parent=None, side='l'):
+        # Only points in this node's range of S are considered
+        ixs = S[lo:hi].copy()
+        Y = X[ixs]
         # Find max and min over all d dimensions
-        xmax = X[S].max(axis=0)
-        xmin = X[S].min(axis=0)
+        xmax = Y.max(axis=0)
+        xmin = Y.min(axis=0)
         # Compute l
         l = xmax - xmin
         l /= l.sum()
@@ -154,72 +229,59 @@ class RCTree:
         q = self.rng.choice(self.ndim, p=l)
         # Determine value for split
         p = self.rng.uniform(xmin[q], xmax[q])
-        # Determine subset of points to left
-        S1 = (X[:, q] <= p) & (S)
-        # Determine subset of points to right
-        S2 = (~S1) & (S)
-        # Create new child node
-        child = Branch(q=q, p=p, u=parent)
+        # Partition range of S in place, with points to left of cut first
+        left = (Y[:, q] <= p)
+        k = lo + int(left.sum())
+        S[lo:k] = ixs[left]
+        S[k:hi] = ixs[~left]
+        # Create new child node, storing bbox of its points
+        child = Branch(q=q, p=p, u=parent, b=np.vstack([xmin, xmax]))
         # Link child node to parent
         if parent is not None:
             setattr(parent, side, child)
-        return S1, S2, child
-
-    def _mktree(self, X, S, N, I, parent=None, side='root', depth=0):
-        # Increment depth as we traverse down
-        depth += 1
-        # Create a cut according to definition 1
-        S1, S2, branch = self._cut(X, S, parent=parent, side=side)
-        # If S1 does not contain an isolated point...
-        if S1.sum() > 1:
-            # Recursively construct tree on S1
-            self._mktree(X, S1, N, I, parent=branch, side='l', depth=depth)
-        # Otherwise...
-        else:
-            # Create a leaf node from isolated point
-            i = np.flatnonzero(S1).item()
-            leaf = Leaf(i=i, d=depth, u=branch, x=X[i, :], n=N[i])
-            # Link leaf node to parent
-            branch.l = leaf
-            # If duplicates exist...
-            if I is not None:
-                # Add a key in the leaves dict pointing to leaf for all duplicate indices
-                J = np.flatnonzero(I == i)
-                # Get index label
-                J = self.index_labels[J]
-                for j in J:
-                    self.leaves[j] = leaf
+        return k, child
+
+    def _mktree(self, X, S, lo, hi, N, J, parent=None, side='root',
+                views=None):
+        # Each task is a range of S with the node above it. Tasks are taken
+        # from a stack, so that left subtrees are built before right subtrees.
+        stack = [(lo, hi, parent, side)]
+        while stack:
+            lo, hi, parent, side = stack.pop()
+            # If subset does not contain an isolated point...
+            if hi - lo > 1:
+                # Create a cut according to definition 1
+                k, branch = self._cut(X, S, lo, hi, parent=parent, side=side)
+                # Count all leaves under branch
+                branch.n = N[S[lo:hi]].sum()
+                stack.append((k, hi, branch, 'r'))
+                stack.append((lo, k, branch, 'l'))
+            # Otherwise...
             else:
-                i = self.index_labels[i]
-                self.leaves[i] = leaf
-        # If S2 does not contain an isolated point...
-        if S2.sum() > 1:
-            # Recursively construct tree on S2
-            self._mktree(X, S2, N, I, parent=branch, side='r', depth=depth)
-        # Otherwise...
+                # Create a leaf node from isolated point
+                i = S[lo]
+                x, b = (X[i, :], None) if views is None else views[i]
+                leaf = Leaf(i=i, u=parent, x=x, n=N[i], b=b)
+                # Link leaf node to parent
+                setattr(parent, side, leaf)
+                self._label_leaf(leaf, i, J)
+                if self._hash_index is not None:
+                    self._index_leaf(leaf)
+
+    def _label_leaf(self, leaf, i, J):
+        """
+        Adds a key in the leaves dict pointing to leaf for all index labels
+        of row i.
+        """
+        if J is None:
+            self.leaves[self.index_labels[i]] = leaf
         else:
-            # Create a leaf node from isolated point
-            i = np.flatnonzero(S2).item()
-            leaf = Leaf(i=i, d=depth, u=branch, x=X[i, :], n=N[i])
-            # Link leaf node to parent
-            branch.r = leaf
-            # If duplicates exist...
-            if I is not None:
-                # Add a key in the leaves dict pointing to leaf for all duplicate indices
-                J = np.flatnonzero(I == i)
-                # Get index label
-                J = self.index_labels[J]
-                for j in J:
-                    self.leaves[j] = leaf
-            else:
-                i = self.index_labels[i]
-                self.leaves[i] = leaf
-        # Decrement depth as we traverse back up
-        depth -= 1
+            for j in J[i]:
+                self.leaves[j] = leaf
 
     def map_leaves(self, node, op=(lambda x: None), *args, **kwargs):
         """
-        Traverse tree recursively, calling operation given by op on leaves
+        Traverse tree, calling operation given by op on leaves
 
         Parameters:
         -----------
@@ -250,17 +312,12 @@ class RCTree:
         Leaf(1)
         Leaf(8)
         """
-        if isinstance(node, Branch):
-            if node.l:
-                self.map_leaves(node.l, op=op, *args, **kwargs)
-            if node.r:
-                self.map_leaves(node.r, op=op, *args, **kwargs)
-        else:
-            op(node, *args, **kwargs)
+        for leaf in self.iter_leaves(node):
+            op(leaf, *args, **kwargs)
 
     def map_branches(self, node, op=(lambda x: None), *args, **kwargs):
         """
-        Traverse tree recursively, calling operation given by op on branches
+        Traverse tree, calling operation given by op on branches
 
         Parameters:
         -----------
@@ -293,13 +350,78 @@ class RCTree:
         Branch(q=0, p=0.62),
         Branch(q=1, p=0.86)]
         """
-        if isinstance(node, Branch):
-            if node.l:
-                self.map_branches(node.l, op=op, *args, **kwargs)
-            if node.r:
-                self.map_branches(node.r, op=op, *args, **kwargs)
-            op(node, *args, **kwargs)
+        for branch in self.iter_branches(node):
+            op(branch, *args, **kwargs)
+
+    def iter_leaves(self, node=None):
+        """
+        Generator that yields all leaves under a node, from left to right
 
+        Parameters:
+        -----------
+        node: node in RCTree
+              Defaults to root of tree.
+
+        Example:
+        --------
+        # Collect index of every leaf
+        >>> X = np.random.randn(10, 2)
+        >>> tree = RCTree(X)
+        >>> [leaf.i for leaf in tree.iter_leaves()]
+
+        [5, 9, 4, 0, 6, 2, 3, 7, 1, 8]
+        """
+        if node is None:
+            node = self.root
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Branch):
+                if node.r:
+                    stack.append(node.r)
+                if node.l:
+                    stack.append(node.l)
+            elif node is not None:
+                yield node
+
+    def iter_branches(self, node=None):
+        """
+        Generator that yields all branches under a node in postorder (every
+        branch is yielded after the branches below it)
+
+        Parameters:
+        -----------
+        node: node in RCTree
+              Defaults to root of tree.
+
+        Example:
+        --------
+        # Find largest number of leaves under a branch below the root
+        >>> X = np.random.randn(10, 2)
+        >>> tree = RCTree(X)
+        >>> max(branch.n for branch in tree.iter_branches(tree.root.l))
+
+        6
+        """
+        if node is None:
+            node = self.root
+        # Each branch is pushed twice: once to expand it, once to yield it
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not isinstance(node, Branch):
+                continue
+            if expanded:
+                yield node
+            else:
+                stack.append((node, True))
+                if node.r:
+                    stack.append((node.r, False))
+                if node.l:
+                    stack.append((node.l, False))
+
+    @synchronized('write')
+    @instrumented('forget_point')
     def forget_point(self, index):
         """
         Delete leaf from tree
@@ -326,22 +448,34 @@ class RCTree:
         # Forget point
         >>> tree.forget_point(0)
         """
+        return self._forget(index)[0]
+
+    def _forget(self, index):
+        """
+        Deletes a leaf (see forget_point), returning it along with the Branch
+        removed from the tree, or None if no branch was removed.
+        """
         try:
             # Get leaf from leaves dict
             leaf = self.leaves[index]
         except KeyError:
             raise KeyError('Leaf must be a key to self.leaves')
+        if self.stats is not None:
+            # Counts are updated from the leaf to the root
+            self.stats.nodes_visited += leaf.d + 1
+        if leaf.n == 1 and self._hash_index is not None:
+            self._unindex_leaf(leaf)
         # If duplicate points exist...
         if leaf.n > 1:
             # Simply decrement the number of points in the leaf and for all branches above
             self._update_leaf_count_upwards(leaf, inc=-1)
-            return self.leaves.pop(index)
+            return self.leaves.pop(index), None
         # Weird cases here:
         # If leaf is the root...
         if leaf is self.root:
             self.root = None
             self.ndim = None
-            return self.leaves.pop(index)
+            return self.leaves.pop(index), None
         # Find parent
         parent = leaf.u
         # Find sibling
@@ -351,18 +485,12 @@ class RCTree:
             sibling = parent.l
         # If parent is the root...
         if parent is self.root:
-            # Delete parent
-            del parent
             # Set sibling as new root
             sibling.u = None
             self.root = sibling
-            # Update depths
-            if isinstance(sibling, Leaf):
-                sibling.d = 0
-            else:
-                self.map_leaves(sibling, op=self._increment_depth, inc=-1)
-            return self.leaves.pop(index)
+            return self.leaves.pop(index), parent
         # Find grandparent
+        removed = parent
         grandparent = parent.u
         # Set parent of sibling to grandparent
         sibling.u = grandparent
@@ -371,15 +499,125 @@ class RCTree:
             grandparent.l = sibling
         else:
             grandparent.r = sibling
-        # Update depths
         parent = grandparent
-        self.map_leaves(sibling, op=self._increment_depth, inc=-1)
         # Update leaf counts under each branch
         self._update_leaf_count_upwards(parent, inc=-1)
         # Update bounding boxes
         point = leaf.x
-        self._relax_bbox_upwards(parent, point)
-        return self.leaves.pop(index)
+        relaxed = self._relax_bbox_upwards(parent, point)
+        if self.stats is not None:
+            self.stats.bbox_updates += relaxed
+        return self.leaves.pop(index), removed
+
+    @synchronized('write')
+    @instrumented('forget_points')
+    def forget_points(self, indexes):
+        """
+        Delete a batch of leaves from tree, giving the same tree as calling
+        forget_point on each index in turn
+
+        All leaves are spliced out of the tree first. The count of each
+        branch above a deleted leaf, and the bbox of each branch that may have
+        shrunk, are then recomputed once, from the bottom up.
+
+        Parameters:
+        -----------
+        indexes: sequence
+                 Indices of leaves in tree
+
+        Returns:
+        --------
+        leaves: list
+                Deleted leaf of each index
+
+        Example:
+        --------
+        # Create RCTree
+        >>> tree = RCTree(np.random.randn(100, 2))
+
+        # Forget the first half of the points
+        >>> tree.forget_points(range(50))
+        """
+        indexes = list(indexes)
+        if len(set(indexes)) != len(indexes) or any(
+                index not in self.leaves for index in indexes):
+            raise KeyError('Leaves must be keys to self.leaves')
+        leaves = []
+        # Branches whose count, and whose bbox, must be recomputed. For large
+        # batches, it is faster to recompute the bbox of every marked branch
+        # than to find which bboxes may have shrunk.
+        counts = set()
+        bboxes = set()
+        relax_all = 40 * len(indexes) >= len(self.leaves)
+        scratch = self._scratch(self.ndim)
+        on_lo, on_hi = scratch[2], scratch[3]
+
+        def mark(node):
+            # Mark node and its ancestors, stopping at a marked ancestor
+            while node is not None and node not in counts:
+                counts.add(node)
+                node = node.u
+
+        for index in indexes:
+            leaf = self.leaves.pop(index)
+            leaves.append(leaf)
+            if leaf.n > 1:
+                leaf.n -= 1
+                mark(leaf.u)
+                continue
+            if self._hash_index is not None:
+                self._unindex_leaf(leaf)
+            parent = leaf.u
+            if parent is None:
+                self.root = None
+                self.ndim = None
+                continue
+            sibling = parent.r if leaf is parent.l else parent.l
+            grandparent = parent.u
+            sibling.u = grandparent
+            if grandparent is None:
+                self.root = sibling
+                continue
+            if parent is grandparent.l:
+                grandparent.l = sibling
+            else:
+                grandparent.r = sibling
+            mark(grandparent)
+            if relax_all:
+                continue
+            # Only bboxes with the point on their boundary may shrink, and the
+            # bboxes of ancestors contain those of their descendants
+            point = leaf.x
+            node = grandparent
+            while node is not None:
+                b = node.b
+                np.equal(b[0], point, out=on_lo)
+                np.equal(b[-1], point, out=on_hi)
+                if not (on_lo.any() or on_hi.any()):
+                    break
+                bboxes.add(node)
+                node = node.u
+        # Recompute marked branches still in the tree, children first
+        updated = 0
+        if self.root is not None and self.root in counts:
+            stack = [(self.root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    node.n = node.l.n + node.r.n
+                    if relax_all or node in bboxes:
+                        self._lr_branch_bbox(node, out=node.b)
+                        updated += 1
+                    continue
+                stack.append((node, True))
+                if node.l in counts:
+                    stack.append((node.l, False))
+                if node.r in counts:
+                    stack.append((node.r, False))
+        if self.stats is not None:
+            self.stats.nodes_visited += len(counts)
+            self.stats.bbox_updates += updated
+        return leaves
 
     def _update_leaf_count_upwards(self, node, inc=1):
         """
@@ -390,6 +628,8 @@ class RCTree:
             node.n += inc
             node = node.u
 
+    @synchronized('write')
+    @instrumented('insert_point')
     def insert_point(self, point, index, tolerance=None):
         """
         Inserts a point into the tree, creating a new leaf
@@ -416,15 +656,53 @@ class RCTree:
         >>> x = np.random.randn(2)
         >>> tree.insert_point(x, index=0)
         """
+        return self._insert(point, index, tolerance)
+
+    @synchronized('write')
+    @instrumented('insert_and_score')
+    def insert_and_score(self, point, index, tolerance=None):
+        """
+        Inserts a point into the tree and returns its collusive displacement,
+        computed from the counts met while inserting rather than by a separate
+        walk from the new leaf to the root (see codisp)
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new leaf in tree
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement of the new leaf.
+
+        Example:
+        --------
+        # Create RCTree
+        >>> tree = RCTree(np.random.randn(100, 2))
+
+        # Insert a point and compute its anomaly score
+        >>> tree.insert_and_score(np.array([4., 4.]), index=100)
+
+        33.0
+        """
+        return self._insert(point, index, tolerance, score=True)[1]
+
+    def _insert(self, point, index, tolerance=None, score=False, spare=None):
+        """
+        Validates and inserts a point (see insert_point). If score is True,
+        returns the leaf and its collusive displacement. spare is an optional
+        Branch removed from the tree, to reuse for the new branch.
+        """
         if not isinstance(point, np.ndarray):
             point = np.asarray(point)
         point = point.ravel()
         if self.root is None:
-            leaf = Leaf(x=point, i=index, d=0)
-            self.root = leaf
-            self.ndim = point.size
-            self.leaves[index] = leaf
-            return leaf
+            leaf = self._insert_root(point, index)
+            return (leaf, 0) if score else leaf
         # If leaves already exist in tree, check dimensions of point
         try:
             assert (point.size == self.ndim)
@@ -437,66 +715,272 @@ class RCTree:
         except KeyError:
             raise KeyError("Index already exists in leaves dict.")
         # Check for duplicate points
-        duplicate = self.find_duplicate(point, tolerance=tolerance)
+        if tolerance is None and self._hash_index is not None:
+            key = self._hash_key(point)
+            duplicate = self._find_hashed(point, key)
+        else:
+            key = None
+            duplicate = self.find_duplicate(point, tolerance=tolerance)
         if duplicate:
+            return self._insert_duplicate(duplicate, index, score=score)
+        # If tree has points and point is not a duplicate, continue with main algorithm...
+        return self._insert_leaf(point, index, key=key, score=score,
+                                 spare=spare)
+
+    @synchronized('write')
+    @instrumented('replace_point')
+    def replace_point(self, old_index, point, index, tolerance=None):
+        """
+        Deletes a leaf and inserts a new point in one step, giving the same
+        tree as forget_point followed by insert_point (as when sliding a
+        window over a stream)
+
+        Both indices and the point are validated before the tree is modified,
+        and the branch freed by the deletion is reused for the new point.
+
+        Parameters:
+        -----------
+        old_index: (Hashable type)
+                   Index of leaf to delete
+        point: np.ndarray (1 x d)
+        index: (Hashable type)
+               Identifier for new leaf in tree (may be old_index)
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        leaf: Leaf
+              New leaf in tree
+
+        Example:
+        --------
+        # Create RCTree
+        >>> tree = RCTree(np.random.randn(100, 2))
+
+        # Replace the oldest point with a new point
+        >>> tree.replace_point(0, np.random.randn(2), index=100)
+        """
+        if old_index not in self.leaves:
+            raise KeyError('Leaf must be a key to self.leaves')
+        if index != old_index and index in self.leaves:
+            raise KeyError("Index already exists in leaves dict.")
+        point = np.asarray(point).ravel()
+        if len(self.leaves) > 1 and point.size != self.ndim:
+            raise ValueError(
+                "Point must be same dimension as existing points in tree.")
+        _, spare = self._forget(old_index)
+        return self._insert(point, index, tolerance=tolerance, spare=spare)
+
+    @synchronized('write')
+    @instrumented('insert_points')
+    def insert_points(self, X, indexes, tolerance=None):
+        """
+        Inserts a batch of points into the tree, giving the same tree as
+        calling insert_point on each point in turn with the same random state
+
+        Points and indices are validated once for the batch, and random numbers
+        are drawn in blocks rather than once per cut. If an error is raised,
+        the points before the one that caused it remain inserted.
+
+        Parameters:
+        -----------
+        X: np.ndarray (k x d)
+           Points to insert.
+        indexes: sequence of length k
+                 Identifiers for new leaves in tree
+        tolerance: float
+                   Tolerance for determining duplicate points
+
+        Returns:
+        --------
+        leaves: list
+                Leaf of each point in tree
+
+        Example:
+        --------
+        # Create RCTree
+        >>> tree = RCTree(np.random.randn(100, 2))
+
+        # Insert a batch of points
+        >>> tree.insert_points(np.random.randn(10, 2), indexes=range(100, 110))
+        """
+        X = np.asarray(X, dtype=float)
+        X = X.reshape(X.shape[0], -1)
+        indexes = list(indexes)
+        if len(indexes) != X.shape[0]:
+            raise ValueError('Number of indexes must match number of points.')
+        if self.ndim is not None and X.shape[1] != self.ndim:
+            raise ValueError(
+                "Point must be same dimension as existing points in tree.")
+        if not np.isfinite(X).all():
+            raise ValueError('Points must be finite.')
+        if len(set(indexes)) != len(indexes) or any(
+                index in self.leaves for index in indexes):
+            raise KeyError("Index already exists in leaves dict.")
+        return self._insert_many(X, indexes, tolerance=tolerance)
+
+    def _insert_many(self, X, indexes, tolerance=None, views=None,
+                     find_duplicate=None):
+        """
+        Inserts a batch of validated points (see insert_points). views is an
+        optional list of (x, b) views of each point to share with other leaves
+        (see _build), and find_duplicate an optional function returning the
+        duplicate leaf of the j-th point, or None.
+        """
+        # Cuts are drawn about twice per level of the tree
+        depth = 2 * int(np.log2(len(self.leaves) + len(indexes) + 1)) + 1
+        rng = _BlockUniform(self.rng, depth * len(indexes))
+        leaves = []
+        try:
+            for j, point in enumerate(X):
+                index = indexes[j]
+                if views is None:
+                    x, b = point, None
+                else:
+                    x, b = views[j]
+                if self.root is None:
+                    leaves.append(self._insert_root(x, index, b=b))
+                    continue
+                key = None
+                if find_duplicate is not None:
+                    duplicate = find_duplicate(j)
+                elif tolerance is None and self._hash_index is not None:
+                    key = self._hash_key(point)
+                    duplicate = self._find_hashed(point, key)
+                else:
+                    duplicate = self.find_duplicate(point, tolerance=tolerance)
+                if duplicate:
+                    leaves.append(self._insert_duplicate(duplicate, index))
+                else:
+                    leaves.append(self._insert_leaf(x, index, b=b, key=key,
+                                                    rng=rng))
+        finally:
+            rng.finish()
+        return leaves
+
+    def _insert_root(self, point, index, b=None):
+        """
+        Inserts a point into an empty tree, making its leaf the root. b is an
+        optional (1 x d) view of point to share with other leaves.
+        """
+        leaf = Leaf(x=point, i=index, b=b)
+        self.root = leaf
+        self.ndim = point.size
+        self.leaves[index] = leaf
+        if self._hash_index is not None:
+            self._index_leaf(leaf)
+        return leaf
+
+    def _insert_duplicate(self, duplicate, index, score=False):
+        """
+        Adds index to an existing leaf holding a duplicate of the inserted point.
+        If score is True, returns the leaf and its collusive displacement,
+        computed while updating counts.
+        """
+        self.leaves[index] = duplicate
+        if self.stats is not None:
+            self.stats.nodes_visited += duplicate.d + 1
+            self.stats.duplicate_hits += 1
+        if not score:
             self._update_leaf_count_upwards(duplicate, inc=1)
-            self.leaves[index] = duplicate
             return duplicate
-        # If tree has points and point is not a duplicate, continue with main algorithm...
+        co_displacement = 0
+        node = duplicate
+        node.n += 1
+        parent = node.u
+        while parent is not None:
+            parent.n += 1
+            sibling = parent.r if node is parent.l else parent.l
+            co_displacement = max(co_displacement, sibling.n / node.n)
+            node = parent
+            parent = node.u
+        return duplicate, co_displacement
+
+    def _insert_leaf(self, point, index, b=None, key=None, rng=None,
+                     score=False, spare=None):
+        """
+        Inserts a new, non-duplicate point into a non-empty tree. The point is
+        assumed to have been validated by the caller. b is an optional (1 x d)
+        view of point to share with other leaves, key is the hash key of
+        point, if already computed, and rng is used to draw cuts instead of
+        self.rng if provided. If score is True, returns the new leaf and its
+        collusive displacement, computed from the counts met while descending.
+        spare is an optional Branch removed from the tree, whose object and
+        bbox array are reused for the new branch.
+        """
         node = self.root
         parent = node.u
-        maxdepth = max([leaf.d for leaf in self.leaves.values()])
-        depth = 0
         branch = None
-        for _ in range(maxdepth + 1):
-            bbox = node.b
-            cut_dimension, cut = self._insert_point_cut(point, bbox)
-            if cut <= bbox[0, cut_dimension]:
-                leaf = Leaf(x=point, i=index, d=depth)
-                branch = Branch(q=cut_dimension, p=cut, l=leaf, r=node,
-                                n=(leaf.n + node.n))
-                break
-            elif cut >= bbox[-1, cut_dimension]:
-                leaf = Leaf(x=point, i=index, d=depth)
-                branch = Branch(q=cut_dimension, p=cut, l=node, r=leaf,
-                                n=(leaf.n + node.n))
-                break
-            else:
-                depth += 1
-                if point[node.q] <= node.p:
-                    parent = node
-                    node = node.l
-                    side = 'l'
+        scratch = self._scratch(point.size)
+        co_displacement = 0
+        # Descend until a cut separates the point from a subtree. A cut always
+        # separates the point from a leaf, so the loop terminates. The count
+        # of each branch the point descends into is incremented on the way.
+        try:
+            while branch is None:
+                bbox = node.b
+                cut_dimension, cut = self._insert_point_cut(
+                    point, bbox, rng=rng, scratch=scratch)
+                if cut <= bbox[0, cut_dimension]:
+                    leaf = Leaf(x=point, i=index, b=b)
+                    branch = _make_branch(spare, cut_dimension, cut, leaf, node)
+                    break
+                elif cut >= bbox[-1, cut_dimension]:
+                    leaf = Leaf(x=point, i=index, b=b)
+                    branch = _make_branch(spare, cut_dimension, cut, node, leaf)
+                    break
                 else:
                     parent = node
-                    node = node.r
-                    side = 'r'
-        try:
-            assert branch is not None
-        except:
-            raise AssertionError('Error with program logic: a cut was not found.')
-        # Set parent of new leaf and old branch
-        node.u = branch
-        leaf.u = branch
-        # Set parent of new branch
+                    parent.n += 1
+                    if point[node.q] <= node.p:
+                        node, sibling = node.l, node.r
+                        side = 'l'
+                    else:
+                        node, sibling = node.r, node.l
+                        side = 'r'
+                    if score:
+                        # The subtree holding the point will gain one leaf
+                        co_displacement = max(co_displacement,
+                                              sibling.n / (node.n + 1))
+        except ValueError:
+            # Undo count increments if no cut could be drawn
+            self._update_leaf_count_upwards(parent, inc=-1)
+            raise
+        # Complete new branch before linking it into the tree, so that
+        # concurrent readers never see a branch without a bbox
         branch.u = parent
+        leaf.u = branch
+        if spare is None or spare.b.shape != (2, point.size):
+            branch.b = self._lr_branch_bbox(branch,
+                                            out=np.empty((2, point.size)))
+        else:
+            self._lr_branch_bbox(branch, out=branch.b)
+        # Set parent of old branch
+        node.u = branch
         if parent is not None:
             # Set child of parent to new branch
             setattr(parent, side, branch)
         else:
             # If a new root was created, assign the attribute
             self.root = branch
-        # Increment depths below branch
-        self.map_leaves(branch, op=self._increment_depth, inc=1)
-        # Increment leaf count above branch
-        self._update_leaf_count_upwards(parent, inc=1)
         # Update bounding boxes
-        self._tighten_bbox_upwards(branch)
+        tightened = self._tighten_bbox_upwards(branch)
+        if self.stats is not None:
+            # Nodes visited while descending to the new branch
+            self.stats.nodes_visited += leaf.d
+            self.stats.bbox_updates += tightened + 1
         # Add leaf to leaves dict
         self.leaves[index] = leaf
+        if self._hash_index is not None:
+            self._index_leaf(leaf, key)
+        if score:
+            # The new leaf is the sibling of node
+            return leaf, max(co_displacement, node.n)
         # Return inserted leaf for convenience
         return leaf
 
+    @synchronized('read')
     def query(self, point, node=None):
         """
         Search for leaf nearest to point
@@ -535,6 +1019,7 @@ class RCTree:
             node = self.root
         return self._query(point, node)
 
+    @synchronized('read')
     def disp(self, leaf):
         """
         Compute displacement at leaf
@@ -580,6 +1065,7 @@ class RCTree:
         displacement = sibling.n
         return displacement
 
+    @synchronized('read')
     def codisp(self, leaf):
         """
         Compute collusive displacement at leaf
@@ -617,7 +1103,7 @@ class RCTree:
             return 0
         node = leaf
         results = []
-        for _ in range(node.d):
+        while True:
             parent = node.u
             if parent is None:
                 break
@@ -634,6 +1120,7 @@ class RCTree:
         return co_displacement
 
 
+    @synchronized('read')
     def codisp_with_cut_dimension(self, leaf):
         """
         Compute collusive displacement at leaf and the dimension of the cut.
@@ -676,7 +1163,7 @@ class RCTree:
         results = []
         cut_dimensions = []
 
-        for _ in range(node.d):
+        while True:
             parent = node.u
             if parent is None:
                 break
@@ -694,9 +1181,151 @@ class RCTree:
         
         return results[argmax], cut_dimensions[argmax]
 
+    @synchronized('read')
+    def codisp_all(self, indexes=None):
+        """
+        Compute collusive displacement of all leaves in a single pass over the
+        tree, carrying the largest displacement ratio from each branch down to
+        its children.
+
+        Parameters:
+        -----------
+        indexes: sequence (optional) (default=None)
+                 Indices of leaves to return the collusive displacement of.
+                 Defaults to all indices in self.leaves.
+
+        Returns:
+        --------
+        codisplacement: np.ndarray
+                        Collusive displacement of each index, in the order of
+                        indexes.
+
+        Example:
+        --------
+        # Create RCTree
+        >>> X = np.random.randn(100, 2)
+        >>> tree = rrcf.RCTree(X)
+
+        # Compute collusive displacement of every point
+        >>> codisp = tree.codisp_all()
+        >>> codisp.argmax()
+
+        47
+        """
+        if indexes is None:
+            indexes = list(self.leaves)
+        codisp = {}
+        stack = [(self.root, 0)]
+        while stack:
+            node, co_displacement = stack.pop()
+            if isinstance(node, Branch):
+                l, r = node.l, node.r
+                stack.append((r, max(co_displacement, l.n / r.n)))
+                stack.append((l, max(co_displacement, r.n / l.n)))
+            elif node is not None:
+                codisp[node] = co_displacement
+        try:
+            return np.fromiter((codisp[self.leaves[i]] for i in indexes),
+                               dtype=float, count=len(indexes))
+        except KeyError:
+            raise KeyError('indexes must be keys to self.leaves')
+
+    @synchronized('read')
+    def score_point(self, point, tolerance=None, random_state=None):
+        """
+        Compute the collusive displacement that a point would have if it were
+        inserted into the tree, without modifying the tree.
+
+        The insertion of the point is simulated by drawing random cuts in the
+        same way as insert_point, from a separate generator, while accumulating
+        the displacement of the would-be leaf along the path. No nodes are created and no counts or bboxes are
+        changed, so scoring never interferes with the tree's structure.
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+               Point to score.
+        tolerance: float
+                   Tolerance for determining duplicate points
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Random number generator used to draw simulated cuts.
+                      Defaults to a generator kept for scoring, seeded when the
+                      tree is created, so that scoring never changes the cuts
+                      drawn by later inserts.
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement the point would have.
+
+        Example:
+        --------
+        # Create RCTree
+        >>> X = np.random.randn(100, 2)
+        >>> tree = rrcf.RCTree(X)
+
+        # Score an outlier without inserting it
+        >>> tree.score_point([4, 4])
+
+        30.0
+        """
+        if not isinstance(point, np.ndarray):
+            point = np.asarray(point)
+        point = point.ravel()
+        if self.root is None:
+            return 0
+        duplicate = self.find_duplicate(point, tolerance=tolerance)
+        if isinstance(random_state, int):
+            random_state = np.random.RandomState(random_state)
+        return self._score_point(point, duplicate, rng=random_state)
+
+    def _score_point(self, point, duplicate, rng=None):
+        """
+        Simulates insertion of a point into a non-empty tree, returning its
+        would-be collusive displacement. If duplicate is a leaf, the point
+        is assumed to be a duplicate of that leaf. Cuts are drawn from rng,
+        which defaults to the scoring generator.
+        """
+        if rng is None:
+            rng = self._score_rng
+        co_displacement = 0
+        if duplicate is not None:
+            # The count of the duplicate leaf and all nodes above it would
+            # increase by one
+            node = duplicate
+            parent = node.u
+            while parent is not None:
+                if node is parent.l:
+                    sibling = parent.r
+                else:
+                    sibling = parent.l
+                co_displacement = max(co_displacement,
+                                      sibling.n / (node.n + 1))
+                node = parent
+                parent = node.u
+            return co_displacement
+        node = self.root
+        # Buffers are not shared with the tree, as readers may run in parallel
+        scratch = (np.empty(point.size), np.empty(point.size))
+        while True:
+            bbox = node.b
+            cut_dimension, cut = self._insert_point_cut(point, bbox, rng=rng,
+                                                        scratch=scratch)
+            if (cut <= bbox[0, cut_dimension]) or (cut >= bbox[-1, cut_dimension]):
+                # The new leaf would be the sibling of node
+                return max(co_displacement, node.n)
+            if point[node.q] <= node.p:
+                node, sibling = node.l, node.r
+            else:
+                node, sibling = node.r, node.l
+            # The count of every node on the path would increase by one
+            co_displacement = max(co_displacement, sibling.n / (node.n + 1))
+
+    @synchronized('read')
     def get_bbox(self, branch=None):
         """
-        Compute bounding box of all points underneath a given branch.
+        Returns bounding box of all points underneath a given branch. The
+        stored bbox of the branch is returned, so it must not be modified.
 
         Parameters:
         -----------
@@ -720,17 +1349,21 @@ class RCTree:
         """
         if branch is None:
             branch = self.root
-        mins = np.full(self.ndim, np.inf)
-        maxes = np.full(self.ndim, -np.inf)
-        self.map_leaves(branch, op=self._get_bbox, mins=mins, maxes=maxes)
-        bbox = np.vstack([mins, maxes])
-        return bbox
+        if isinstance(branch, Leaf):
+            return np.vstack([branch.x, branch.x])
+        # Bboxes of branches are kept up to date on insert and delete
+        return branch.b
 
+    @synchronized('read')
     def find_duplicate(self, point, tolerance=None):
         """
         If point is a duplicate of existing point in the tree, return the leaf
         containing the point, else return None.
 
+        If the tree has a hash index (see enable_hash_index) and no tolerance
+        is given, the leaf is looked up in the index rather than found by
+        descending the tree.
+
         Parameters:
         -----------
         point: np.ndarray (1 x d)
@@ -762,7 +1395,14 @@ class RCTree:
 
         Leaf(10)
         """
+        if tolerance is None and self._hash_index is not None:
+            if not isinstance(point, np.ndarray):
+                point = np.asarray(point)
+            point = point.ravel()
+            return self._find_hashed(point, self._hash_key(point))
         nearest = self.query(point)
+        if self.stats is not None:
+            self.stats.nodes_visited += nearest.d + 1
         if tolerance is None:
             if (nearest.x == point).all():
                 return nearest
@@ -771,6 +1411,7 @@ class RCTree:
                 return nearest
         return None
 
+    @synchronized('read')
     def to_dict(self):
         """
         Serializes RCTree to a nested dict that can be written to disk or sent
@@ -812,34 +1453,38 @@ class RCTree:
 
     def _serialize(self, node, obj, duplicates):
         """
-        Recursively serializes tree into a nested dict.
-        """
-        if isinstance(node, Branch):
-            obj['type'] = 'Branch'
-            obj['q'] = int(node.q)
-            obj['p'] = float(node.p)
-            obj['n'] = int(node.n)
-            obj['b'] = node.b.tolist()
-            obj['l'] = {}
-            obj['r'] = {}
-            if node.l:
-                self._serialize(node.l, obj['l'], duplicates)
-            if node.r:
-                self._serialize(node.r, obj['r'], duplicates)
-        elif isinstance(node, Leaf):
-            if isinstance(node.i, np.int64):
-                i = int(node.i)
+        Serializes tree into a nested dict.
+        """
+        stack = [(node, obj)]
+        while stack:
+            node, obj = stack.pop()
+            if isinstance(node, Branch):
+                obj['type'] = 'Branch'
+                obj['q'] = int(node.q)
+                obj['p'] = float(node.p)
+                obj['n'] = int(node.n)
+                obj['b'] = node.b.tolist()
+                obj['l'] = {}
+                obj['r'] = {}
+                if node.r:
+                    stack.append((node.r, obj['r']))
+                if node.l:
+                    stack.append((node.l, obj['l']))
+            elif isinstance(node, Leaf):
+                if isinstance(node.i, np.int64):
+                    i = int(node.i)
+                else:
+                    i = node.i
+                obj['type'] = 'Leaf'
+                obj['i'] = i
+                obj['x'] = node.x.tolist()
+                obj['d'] = int(node.d)
+                obj['n'] = int(node.n)
+                obj['ixs'] = duplicates[node]
             else:
-                i = node.i
-            obj['type'] = 'Leaf'
-            obj['i'] = i
-            obj['x'] = node.x.tolist()
-            obj['d'] = int(node.d)
-            obj['n'] = int(node.n)
-            obj['ixs'] = duplicates[node]
-        else:
-            raise TypeError('`node` must be Branch or Leaf instance')
+                raise TypeError('`node` must be Branch or Leaf instance')
 
+    @synchronized('write')
     def load_dict(self, obj):
         """
         Deserializes a nested dict representing an RCTree and loads into the RCTree
@@ -892,32 +1537,36 @@ class RCTree:
         self.leaves = leaves
         # Set number of dimensions based on first leaf
         self.ndim = len(next(iter(leaves.values())).x)
+        if self._hash_index is not None:
+            self.enable_hash_index()
 
     def _deserialize(self, obj, node, duplicates, side='l'):
         """
-        Recursively deserializes tree from a nested dict.
-        """
-        if obj['type'] == 'Branch':
-            q = obj['q']
-            p = obj['p']
-            n = np.int64(obj['n'])
-            b = np.asarray(obj['b'])
-            branch = Branch(q=q, p=p, n=n, b=b, u=node)
-            setattr(node, side, branch)
-            if 'l' in obj:
-                self._deserialize(obj['l'], branch, duplicates, side='l')
-            if 'r' in obj:
-                self._deserialize(obj['r'], branch, duplicates, side='r')
-        elif obj['type'] == 'Leaf':
-            i = obj['i']
-            x = np.asarray(obj['x'])
-            d = obj['d']
-            n = np.int64(obj['n'])
-            leaf = Leaf(i=i, x=x, d=d, n=n, u=node)
-            setattr(node, side, leaf)
-            duplicates[leaf] = obj['ixs']
-        else:
-            raise TypeError('`type` must be Branch or Leaf')
+        Deserializes tree from a nested dict.
+        """
+        stack = [(obj, node, side)]
+        while stack:
+            obj, node, side = stack.pop()
+            if obj['type'] == 'Branch':
+                q = obj['q']
+                p = obj['p']
+                n = np.int64(obj['n'])
+                b = np.asarray(obj['b'])
+                branch = Branch(q=q, p=p, n=n, b=b, u=node)
+                setattr(node, side, branch)
+                if 'r' in obj:
+                    stack.append((obj['r'], branch, 'r'))
+                if 'l' in obj:
+                    stack.append((obj['l'], branch, 'l'))
+            elif obj['type'] == 'Leaf':
+                i = obj['i']
+                x = np.asarray(obj['x'])
+                n = np.int64(obj['n'])
+                leaf = Leaf(i=i, x=x, n=n, u=node)
+                setattr(node, side, leaf)
+                duplicates[leaf] = obj['ixs']
+            else:
+                raise TypeError('`type` must be Branch or Leaf')
 
     @classmethod
     def from_dict(cls, obj):
@@ -960,37 +1609,369 @@ class RCTree:
         newinstance.load_dict(obj)
         return newinstance
 
-    def _lr_branch_bbox(self, node):
+    @synchronized('read')
+    def to_arrays(self):
+        """
+        Serializes RCTree to a dict of flat arrays, which can be written to disk
+        with np.savez (see save) much faster than a nested dict.
+
+        Nodes are stored in preorder. Branch bboxes and leaf points are
+        stored as two contiguous matrices, and every index label is stored
+        alongside the leaf it points to.
+
+        Returns:
+        --------
+        arrays: dict
+                version: format version
+                left, right: position of children of each node (-1 for leaves)
+                q, p: cut dimension and value of each node (0 for leaves)
+                n: number of points under each node
+                row: row of each node in x (leaves) or b (branches)
+                x: np.ndarray (leaves x d) points of leaves
+                i: index of each leaf (Leaf.i)
+                b: np.ndarray (branches x 2 x d) bboxes of branches
+                labels: all indices in self.leaves
+                label_row: row in x of the leaf of each index
+
+        Example:
+        --------
+        # Create RCTree
+        >>> X = np.random.randn(4, 3)
+        >>> tree = rrcf.RCTree(X)
+
+        # Write tree to arrays
+        >>> arrays = tree.to_arrays()
+        >>> arrays['x'].shape
+
+        (4, 3)
+        """
+        ndim = self.ndim or 0
+        # List nodes in preorder
+        nodes = []
+        stack = [] if self.root is None else [self.root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if isinstance(node, Branch):
+                stack.append(node.r)
+                stack.append(node.l)
+        position = {node: pos for pos, node in enumerate(nodes)}
+        num_nodes = len(nodes)
+        left = np.full(num_nodes, -1, dtype=np.int64)
+        right = np.full(num_nodes, -1, dtype=np.int64)
+        q = np.zeros(num_nodes, dtype=np.int64)
+        p = np.zeros(num_nodes, dtype=float)
+        n = np.zeros(num_nodes, dtype=np.int64)
+        row = np.zeros(num_nodes, dtype=np.int64)
+        leaves = []
+        branches = []
+        for pos, node in enumerate(nodes):
+            n[pos] = node.n
+            if isinstance(node, Branch):
+                left[pos] = position[node.l]
+                right[pos] = position[node.r]
+                q[pos] = node.q
+                p[pos] = node.p
+                row[pos] = len(branches)
+                branches.append(node.b)
+            else:
+                row[pos] = len(leaves)
+                leaves.append(node)
+        x = np.empty((len(leaves), ndim), dtype=float)
+        for k, leaf in enumerate(leaves):
+            x[k] = leaf.x
+        b = np.empty((len(branches), 2, ndim), dtype=float)
+        for k, bbox in enumerate(branches):
+            b[k] = bbox
+        labels = list(self.leaves)
+        label_row = np.fromiter((row[position[self.leaves[label]]]
+                                 for label in labels),
+                                dtype=np.int64, count=len(labels))
+        return {'version': np.array(ARRAY_FORMAT_VERSION), 'left': left,
+                'right': right, 'q': q, 'p': p, 'n': n, 'row': row, 'x': x,
+                'i': _label_array([leaf.i for leaf in leaves]), 'b': b,
+                'labels': _label_array(labels), 'label_row': label_row}
+
+    @synchronized('write')
+    def load_arrays(self, arrays):
+        """
+        Deserializes a dict of flat arrays representing an RCTree (see
+        to_arrays) and loads it into the RCTree instance. Note that this will
+        delete all data in the current RCTree and replace it with the loaded
+        data.
+
+        Leaf points and branch bboxes are views into arrays['x'] and
+        arrays['b'].
+
+        Parameters:
+        -----------
+        arrays: dict or np.lib.npyio.NpzFile
+                Flat arrays representing all nodes in the RCTree.
+        """
+        self._load_arrays(arrays)
+
+    def _load_arrays(self, arrays):
+        """
+        Loads flat arrays into the RCTree (see load_arrays), without locking.
+        """
+        version = int(arrays['version'])
+        if version > ARRAY_FORMAT_VERSION:
+            raise ValueError('Unsupported array format version {}'.format(version))
+        left = arrays['left'].tolist()
+        right = arrays['right'].tolist()
+        q = arrays['q'].tolist()
+        p = arrays['p'].tolist()
+        n = arrays['n'].tolist()
+        row = arrays['row'].tolist()
+        x = arrays['x']
+        i = arrays['i'].tolist()
+        b = arrays['b']
+        # Children always follow their parent in preorder, so nodes are
+        # created from last to first
+        nodes = [None] * len(left)
+        leaves = [None] * x.shape[0]
+        for pos in range(len(left) - 1, -1, -1):
+            if left[pos] < 0:
+                k = row[pos]
+                node = Leaf(i=i[k], x=x[k], n=n[pos])
+                leaves[k] = node
+            else:
+                l = nodes[left[pos]]
+                r = nodes[right[pos]]
+                node = Branch(q=q[pos], p=p[pos], l=l, r=r, n=n[pos],
+                              b=b[row[pos]])
+                l.u = node
+                r.u = node
+            nodes[pos] = node
+        self.root = nodes[0] if nodes else None
+        self.leaves = {label: leaves[k] for label, k in
+                       zip(arrays['labels'].tolist(),
+                           arrays['label_row'].tolist())}
+        self.ndim = x.shape[1] if nodes else None
+        if self._hash_index is not None:
+            self.enable_hash_index()
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Deserializes a dict of flat arrays representing an RCTree (see
+        to_arrays) and creates a new RCTree instance from the loaded data.
+
+        Parameters:
+        -----------
+        arrays: dict or np.lib.npyio.NpzFile
+                Flat arrays representing all nodes in the RCTree.
+
+        Returns:
+        --------
+        newinstance: rrcf.RCTree
+                     A new RCTree instance based on the loaded data.
         """
-        Compute bbox of node based on bboxes of node's children.
+        newinstance = cls()
+        newinstance.load_arrays(arrays)
+        return newinstance
+
+    def save(self, file):
         """
-        bbox = np.vstack([np.minimum(node.l.b[0, :], node.r.b[0, :]),
-                          np.maximum(node.l.b[-1, :], node.r.b[-1, :])])
-        return bbox
+        Writes RCTree to a binary .npz file (see to_arrays).
+
+        Parameters:
+        -----------
+        file: str, pathlib.Path or file-like object
+              File to write to.
+
+        Example:
+        --------
+        # Write tree to file and read it back
+        >>> X = np.random.randn(100, 3)
+        >>> tree = rrcf.RCTree(X)
+        >>> tree.save('tree.npz')
+        >>> tree = rrcf.RCTree.load('tree.npz')
+        """
+        np.savez(file, **self.to_arrays())
+
+    @classmethod
+    def load(cls, file, allow_pickle=False):
+        """
+        Reads an RCTree from a binary .npz file written by save.
+
+        Parameters:
+        -----------
+        file: str, pathlib.Path or file-like object
+              File to read from.
+        allow_pickle: bool (optional) (default=False)
+                      Must be True to load index labels that are not all
+                      integers, floats or strings. Only enable for trusted
+                      files.
+
+        Returns:
+        --------
+        newinstance: rrcf.RCTree
+        """
+        with np.load(file, allow_pickle=allow_pickle) as arrays:
+            return cls.from_arrays(arrays)
+
+    def enable_stats(self, callback=None):
+        """
+        Starts collecting statistics about insert_point and forget_point.
+
+        Parameters:
+        -----------
+        callback: callable (optional) (default=None)
+                  Called with a dict describing each operation (see Stats).
+
+        Returns:
+        --------
+        stats: rrcf.Stats
+               Collector of statistics (also stored as self.stats).
+        """
+        self.stats = Stats(callback=callback)
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stops collecting statistics.
+        """
+        self.stats = None
+
+    def enable_locking(self):
+        """
+        Makes the tree safe to use from a single writer thread and many reader
+        threads. Inserts, deletes and loads hold a read-write lock for writing,
+        while queries, scores and serialization hold it for reading, so that
+        readers always see a consistent tree. A waiting writer only waits for
+        reads already in progress (see RWLock).
+
+        Returns:
+        --------
+        lock: rrcf.RWLock
+              Lock of the tree (also stored as self.lock). Hold it for reading
+              to make several calls against the same version of the tree.
+
+        Example:
+        --------
+        # Score points from other threads while inserting
+        >>> tree = rrcf.RCTree(np.random.randn(100, 2))
+        >>> lock = tree.enable_locking()
+        >>> thread = threading.Thread(target=tree.codisp_all)
+        >>> thread.start()
+        >>> tree.insert_point(np.random.randn(2), index=100)
+        """
+        if self.lock is None:
+            self.lock = RWLock()
+        return self.lock
+
+    def disable_locking(self):
+        """
+        Stops locking the tree.
+        """
+        self.lock = None
+
+    def enable_hash_index(self):
+        """
+        Builds a hash index of leaves keyed on their points, rounded to
+        self.precision, which is kept up to date on insert and delete. Exact
+        duplicates are then found in constant time (see find_duplicate).
+
+        Example:
+        --------
+        # Create RCTree with hash index
+        >>> X = np.random.randn(100, 2)
+        >>> tree = rrcf.RCTree(X, hash_index=True)
+
+        # Duplicates are found without descending the tree
+        >>> tree.find_duplicate(tree.leaves[0].x)
+
+        Leaf(0)
+        """
+        self._hash_index, self._hash_keys = {}, {}
+        for leaf in self.iter_leaves():
+            self._index_leaf(leaf)
+
+    def disable_hash_index(self):
+        """
+        Removes the hash index of leaves.
+        """
+        self._hash_index = None
+        self._hash_keys = None
+
+    def _hash_key(self, point):
+        """
+        Returns the key of a point in the hash index.
+        """
+        key = np.asarray(point, dtype=float).round(self.precision)
+        # Treat -0.0 and 0.0 as the same point
+        key += 0.0
+        return key.tobytes()
+
+    def _find_hashed(self, point, key):
+        """
+        Returns the leaf holding an exact duplicate of point, using the hash
+        index, or None.
+        """
+        for leaf in self._hash_index.get(key, ()):
+            if (leaf.x == point).all():
+                return leaf
+        return None
+
+    def _index_leaf(self, leaf, key=None):
+        """
+        Adds leaf to the hash index.
+        """
+        if key is None:
+            key = self._hash_key(leaf.x)
+        self._hash_index.setdefault(key, []).append(leaf)
+        self._hash_keys[leaf] = key
+
+    def _unindex_leaf(self, leaf):
+        """
+        Removes leaf from the hash index.
+        """
+        key = self._hash_keys.pop(leaf)
+        bucket = self._hash_index[key]
+        if len(bucket) == 1:
+            del self._hash_index[key]
+        else:
+            bucket.remove(leaf)
+
+    def _lr_branch_bbox(self, node, out=None):
+        """
+        Compute bbox of node based on bboxes of node's children, writing it to
+        out (2 x d) if provided.
+        """
+        l, r = node.l.b, node.r.b
+        if out is None:
+            out = np.empty((2, l.shape[1]))
+        np.minimum(l[0], r[0], out=out[0])
+        np.maximum(l[-1], r[-1], out=out[1])
+        return out
+
+    def _scratch(self, ndim):
+        """
+        Returns preallocated buffers (two float and two bool arrays of size
+        ndim) used to maintain bboxes without allocating.
+        """
+        buffers = self._buffers
+        if buffers is None or buffers[0].size != ndim:
+            buffers = (np.empty(ndim), np.empty(ndim),
+                       np.empty(ndim, dtype=bool), np.empty(ndim, dtype=bool))
+            self._buffers = buffers
+        return buffers
 
     def _get_bbox_top_down(self, node):
         """
-        Recursively compute bboxes of all branches from root to leaves.
+        Compute bboxes of all branches under node, from the leaves up.
         """
-        if isinstance(node, Branch):
-            if node.l:
-                self._get_bbox_top_down(node.l)
-            if node.r:
-                self._get_bbox_top_down(node.r)
-            bbox = self._lr_branch_bbox(node)
-            node.b = bbox
+        for branch in self.iter_branches(node):
+            branch.b = self._lr_branch_bbox(branch)
 
     def _count_all_top_down(self, node):
         """
-        Recursively compute number of leaves below each branch from
-        root to leaves.
+        Compute number of leaves below each branch under node, from the
+        leaves up.
         """
-        if isinstance(node, Branch):
-            if node.l:
-                self._count_all_top_down(node.l)
-            if node.r:
-                self._count_all_top_down(node.r)
-            node.n = node.l.n + node.r.n
+        for branch in self.iter_branches(node):
+            branch.n = branch.l.n + branch.r.n
 
     def _count_leaves(self, node):
         """
@@ -1003,21 +1984,14 @@ class RCTree:
 
     def _query(self, point, node):
         """
-        Recursively search for the nearest leaf to a given point.
+        Search for the nearest leaf to a given point.
         """
-        if isinstance(node, Leaf):
-            return node
-        else:
+        while isinstance(node, Branch):
             if point[node.q] <= node.p:
-                return self._query(point, node.l)
+                node = node.l
             else:
-                return self._query(point, node.r)
-
-    def _increment_depth(self, x, inc=1):
-        """
-        Primitive function for incrementing the depth attribute of a leaf.
-        """
-        x.d += (inc)
+                node = node.r
+        return node
 
     def _accumulate(self, x, accumulator):
         """
@@ -1043,39 +2017,46 @@ class RCTree:
     def _tighten_bbox_upwards(self, node):
         """
         Called when new point is inserted. Expands bbox of all nodes above new point
-        if point is outside the existing bbox.
+        if point is outside the existing bbox. The bbox of node itself must
+        already be set. Returns the number of bboxes expanded.
         """
-        bbox = self._lr_branch_bbox(node)
-        node.b = bbox
+        bbox = node.b
+        lo, hi = bbox[0], bbox[-1]
+        _, _, lt, gt = self._scratch(bbox.shape[1])
         node = node.u
+        updated = 0
         while node:
-            lt = (bbox[0, :] < node.b[0, :])
-            gt = (bbox[-1, :] > node.b[-1, :])
-            lt_any = lt.any()
-            gt_any = gt.any()
-            if lt_any or gt_any:
-                if lt_any:
-                    node.b[0, :][lt] = bbox[0, :][lt]
-                if gt_any:
-                    node.b[-1, :][gt] = bbox[-1, :][gt]
-            else:
+            b = node.b
+            np.less(lo, b[0], out=lt)
+            np.greater(hi, b[-1], out=gt)
+            if not (lt.any() or gt.any()):
                 break
+            np.minimum(b[0], lo, out=b[0])
+            np.maximum(b[-1], hi, out=b[-1])
+            updated += 1
             node = node.u
+        return updated
 
     def _relax_bbox_upwards(self, node, point):
         """
         Called when point is deleted. Contracts bbox of all nodes above deleted point
-        if the deleted point defined the boundary of the bbox.
+        if the deleted point defined the boundary of the bbox. Returns the number
+        of bboxes contracted.
         """
+        _, _, on_lo, on_hi = self._scratch(point.size)
+        updated = 0
         while node:
-            bbox = self._lr_branch_bbox(node)
-            if not ((node.b[0, :] == point) | (node.b[-1, :] == point)).any():
+            b = node.b
+            np.equal(b[0], point, out=on_lo)
+            np.equal(b[-1], point, out=on_hi)
+            if not (on_lo.any() or on_hi.any()):
                 break
-            node.b[0, :] = bbox[0, :]
-            node.b[-1, :] = bbox[-1, :]
+            self._lr_branch_bbox(node, out=b)
+            updated += 1
             node = node.u
+        return updated
 
-    def _insert_point_cut(self, point, bbox):
+    def _insert_point_cut(self, point, bbox, rng=None, scratch=None):
         """
         Generates the cut dimension and cut value based on the InsertPoint algorithm.
 
@@ -1085,6 +2066,11 @@ class RCTree:
                New point to be inserted.
         bbox: np.ndarray(2 x d)
               Bounding box of point set S.
+        rng: RandomState instance (optional)
+             Random number generator to draw cut from. Defaults to self.rng.
+        scratch: tuple (optional)
+                 Buffers to compute the cut in (see _scratch). If None, buffers
+                 are allocated.
 
         Returns:
         --------
@@ -1100,26 +2086,94 @@ class RCTree:
 
         (0, 0.9758881798109296)
         """
-        # Generate the bounding box
-        bbox_hat = np.empty((2, bbox.shape[1]))
-        # Update the bounding box based on the internal point
-        bbox_hat[0, :] = np.minimum(bbox[0, :], point)
-        bbox_hat[-1, :] = np.maximum(bbox[-1, :], point)
-        b_span = bbox_hat[-1, :] - bbox_hat[0, :]
-        b_range = b_span.sum()
-        r = self.rng.uniform(0, b_range)
-        span_sum = np.cumsum(b_span)
-        cut_dimension = np.inf
-        for j in range(len(span_sum)):
-            if span_sum[j] >= r:
-                cut_dimension = j
-                break
-        if not np.isfinite(cut_dimension):
+        if scratch is None:
+            lo, span = np.empty(bbox.shape[1]), np.empty(bbox.shape[1])
+        else:
+            lo, span = scratch[0], scratch[1]
+        # Expand the bounding box to include the point
+        np.minimum(bbox[0], point, out=lo)
+        np.maximum(bbox[-1], point, out=span)
+        np.subtract(span, lo, out=span)
+        b_range = span.sum()
+        if rng is None:
+            rng = self.rng
+        r = rng.uniform(0, b_range)
+        span_sum = span.cumsum(out=span)
+        # Find first dimension whose cumulative span reaches r
+        cut_dimension = int(span_sum.searchsorted(r))
+        if cut_dimension >= span_sum.size:
             raise ValueError("Cut dimension is not finite.")
-        cut = bbox_hat[0, cut_dimension] + span_sum[cut_dimension] - r
+        cut = lo[cut_dimension] + span_sum[cut_dimension] - r
         return cut_dimension, cut
 
 
+def _make_branch(spare, q, p, l, r):
+    """
+    Returns a Branch with children l and r, reusing spare if it is not None.
+    """
+    if spare is None:
+        return Branch(q=q, p=p, l=l, r=r, n=(l.n + r.n))
+    spare.q, spare.p, spare.l, spare.r = q, p, l, r
+    spare.n = l.n + r.n
+    return spare
+
+
+class _BlockUniform:
+    """
+    Stands in for a RandomState when drawing cuts, serving uniform numbers
+    from blocks drawn in advance. finish leaves the RandomState in the state it
+    would be in had each number been drawn with rng.uniform.
+
+    Blocks hold at most max_size numbers, so that a large batch does not
+    allocate every number it may need at once.
+    """
+    max_size = 4096
+
+    def __init__(self, rng, size):
+        self.rng = rng
+        self.size = min(max(size, 1), self.max_size)
+        self.used = 0
+        self._state = rng.get_state()
+        self._block = []
+        self._pos = 0
+
+    def uniform(self, low, high):
+        if self._pos == len(self._block):
+            self._block = self.rng.random_sample(self.size).tolist()
+            self._pos = 0
+        u = self._block[self._pos]
+        self._pos += 1
+        self.used += 1
+        # RandomState.uniform computes low + (high - low) * random_sample()
+        return low + (high - low) * u
+
+    def finish(self):
+        """
+        Rewinds the RandomState to just after the numbers used.
+        """
+        if self._block:
+            self.rng.set_state(self._state)
+            for start in range(0, self.used, self.max_size):
+                self.rng.random_sample(min(self.max_size, self.used - start))
+
+
+def _label_array(labels):
+    """
+    Converts a list of index labels to an array, keeping the type of each label.
+    Labels that are not all integers, floats or strings are stored as objects.
+    """
+    if not labels:
+        # Stored as integers, so that empty arrays load without pickle
+        return np.empty(0, dtype=np.int64)
+    for types in ((int, np.integer), (float, np.floating), (str,)):
+        if all(isinstance(label, types) and not isinstance(label, bool)
+               for label in labels):
+            return np.asarray(labels)
+    array = np.empty(len(labels), dtype=object)
+    array[:] = labels
+    return array
+
+
 class Branch:
     """
     Branch of RCTree containing two children and at most one parent.
@@ -1156,21 +2210,33 @@ class Leaf:
     Attributes:
     -----------
     i: Index of leaf (user-specified)
-    d: Depth of leaf
+    d: Depth of leaf (computed from parent pointers on access)
     u: Pointer to parent
     x: Original point (1 x d)
     n: Number of points in leaf (1 if no duplicates)
     b: Bounding box of point (1 x d)
     """
-    __slots__ = ['i', 'd', 'u', 'x', 'n', 'b']
+    __slots__ = ['i', 'u', 'x', 'n', 'b']
 
-    def __init__(self, i, d=None, u=None, x=None, n=1):
+    def __init__(self, i, d=None, u=None, x=None, n=1, b=None):
+        # Depth is not stored, so that inserting or removing a point does not
+        # require updating every leaf below it. `d` is accepted for
+        # compatibility and ignored.
         self.u = u
         self.i = i
-        self.d = d
         self.x = x
         self.n = n
-        self.b = x.reshape(1, -1)
+        # A (1 x d) view of x may be shared between leaves of many trees
+        self.b = x.reshape(1, -1) if b is None else b
+
+    @property
+    def d(self):
+        depth = 0
+        node = self.u
+        while node is not None:
+            depth += 1
+            node = node.u
+        return depth
 
     def __repr__(self):
         return "Leaf({0})".format(self.i)
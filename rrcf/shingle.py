@@ -1,5 +1,6 @@
 from collections import deque
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
 
 def shingle(sequence, size):
@@ -13,6 +14,12 @@ def shingle(sequence, size):
     size : int
            size of shingle (window)
     """
+    # Arrays are copied from a view of their shingles rather than through a
+    # deque. Each shingle is still a new array (use shingle_array for views).
+    if isinstance(sequence, np.ndarray):
+        for window in shingle_array(sequence, size):
+            yield window.copy()
+        return
     iterator = iter(sequence)
     init = (next(iterator) for _ in range(size))
     window = deque(init, maxlen=size)
@@ -22,3 +29,130 @@ def shingle(sequence, size):
     for elem in iterator:
         window.append(elem)
         yield np.asarray(window)
+
+
+def shingle_array(x, size, stride=1):
+    """
+    Returns all shingles (rolling windows) of an array as a read-only view,
+    without copying any data.
+
+    Parameters
+    ----------
+    x : np.ndarray (n) or (n x d)
+        Array to be shingled along its first axis
+    size : int
+           size of shingle (window)
+    stride : int
+             number of elements between the starts of consecutive shingles
+
+    Returns
+    -------
+    shingles : np.ndarray ((n - size) // stride + 1 x size) or
+               ((n - size) // stride + 1 x size x d)
+
+    Example
+    -------
+    >>> shingle_array(np.arange(5), 3)
+
+    array([[0, 1, 2],
+           [1, 2, 3],
+           [2, 3, 4]])
+    """
+    x = np.asarray(x)
+    if x.shape[0] < size:
+        raise IndexError('Sequence smaller than window size')
+    num_shingles = (x.shape[0] - size) // stride + 1
+    shape = (num_shingles, size) + x.shape[1:]
+    strides = (x.strides[0] * stride,) + x.strides
+    return as_strided(x, shape=shape, strides=strides, writeable=False)
+
+
+class Shingler:
+    """
+    Shingles an unbounded stream that arrives in chunks. Values at the end of
+    each chunk that belong to shingles not yet complete are carried over to
+    the next chunk.
+
+    Parameters
+    ----------
+    size : int
+           size of shingle (window)
+    stride : int
+             number of elements between the starts of consecutive shingles
+
+    Example
+    -------
+    >>> shingler = Shingler(3)
+    >>> shingler.update(np.arange(4))
+
+    array([[0, 1, 2],
+           [1, 2, 3]])
+
+    >>> shingler.update(np.arange(4, 6))
+
+    array([[2, 3, 4],
+           [3, 4, 5]])
+    """
+
+    def __init__(self, size, stride=1):
+        self.size = size
+        self.stride = stride
+        # Values carried over from previous chunks
+        self._tail = None
+        # Number of values to drop from the start of the next chunk
+        self._skip = 0
+
+    def update(self, chunk):
+        """
+        Returns the shingles completed by the next chunk of the stream as a
+        read-only view (see shingle_array).
+
+        Parameters
+        ----------
+        chunk : np.ndarray (k) or (k x d)
+                Next values in the stream
+
+        Returns
+        -------
+        shingles : np.ndarray (m x size) or (m x size x d)
+                   Shingles completed by chunk (m may be zero)
+        """
+        chunk = np.asarray(chunk)
+        if self._skip:
+            skipped = min(self._skip, chunk.shape[0])
+            chunk = chunk[skipped:]
+            self._skip -= skipped
+        if self._tail is not None and self._tail.shape[0]:
+            values = np.concatenate([self._tail, chunk])
+        else:
+            values = chunk
+        n = values.shape[0]
+        if n < self.size:
+            self._tail = values.copy()
+            return np.empty((0, self.size) + values.shape[1:],
+                            dtype=values.dtype)
+        shingles = shingle_array(values, self.size, stride=self.stride)
+        # Start of the first shingle not yet complete
+        start = shingles.shape[0] * self.stride
+        self._tail = values[start:].copy()
+        self._skip = max(start - n, 0)
+        return shingles
+
+
+def shingle_chunks(chunks, size, stride=1):
+    """
+    Generator that yields the shingles completed by each chunk of an unbounded
+    stream (see Shingler).
+
+    Parameters
+    ----------
+    chunks : iterable
+             Iterable of arrays (k) or (k x d)
+    size : int
+           size of shingle (window)
+    stride : int
+             number of elements between the starts of consecutive shingles
+    """
+    shingler = Shingler(size, stride=stride)
+    for chunk in chunks:
+        yield shingler.update(chunk)
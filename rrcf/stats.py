@@ -0,0 +1,124 @@
+import functools
+import time
+
+# Counters recorded for every operation
+COUNTERS = ('nodes_visited', 'bbox_updates', 'duplicate_hits')
+
+
+class Stats:
+    """
+    Opt-in collector of statistics about the operations made on an RCTree or
+    RCForest (see RCTree.enable_stats and RCForest.enable_stats).
+
+    For every operation, the collector records the time taken, the number of
+    nodes visited (while descending to insert or find a point, and while
+    updating counts above a leaf), the number of branch bboxes updated, and the
+    number of points found to be duplicates. Operations made by other
+    operations (such as the inserts made by a forest into each of its trees)
+    are counted as part of the outermost operation.
+
+    Parameters:
+    -----------
+    callback: callable (optional) (default=None)
+              Called with a dict describing each operation as it completes,
+              holding the name of the operation ('op'), the time taken in
+              seconds ('seconds') and the counters of the operation.
+
+    Example:
+    --------
+    # Collect statistics of a tree, printing slow inserts
+    >>> tree = rrcf.RCTree(np.random.randn(100, 2))
+    >>> def report(record):
+            if record['seconds'] > 1e-3:
+                print(record)
+    >>> stats = tree.enable_stats(callback=report)
+    >>> tree.insert_point(np.random.randn(2), index=100)
+    >>> stats.snapshot()
+
+    {'insert_point': {'calls': 1, 'seconds': 5.1e-05, 'max_seconds': 5.1e-05,
+                      'nodes_visited': 9, 'bbox_updates': 3,
+                      'duplicate_hits': 0}}
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._totals = {}
+        # Number of operations in progress, and counters of the outermost one
+        self._active = 0
+        self._start = 0.
+        self.nodes_visited = 0
+        self.bbox_updates = 0
+        self.duplicate_hits = 0
+
+    def begin(self):
+        """
+        Marks the start of an operation.
+        """
+        if not self._active:
+            self.nodes_visited = 0
+            self.bbox_updates = 0
+            self.duplicate_hits = 0
+            self._start = time.perf_counter()
+        self._active += 1
+
+    def end(self, op):
+        """
+        Marks the end of an operation, recording it if it is the outermost one.
+        """
+        self._active -= 1
+        if self._active:
+            return
+        seconds = time.perf_counter() - self._start
+        totals = self._totals.get(op)
+        if totals is None:
+            totals = dict(calls=0, seconds=0., max_seconds=0.,
+                          **{counter: 0 for counter in COUNTERS})
+            self._totals[op] = totals
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['max_seconds'] = max(totals['max_seconds'], seconds)
+        for counter in COUNTERS:
+            totals[counter] += getattr(self, counter)
+        if self.callback is not None:
+            record = {'op': op, 'seconds': seconds}
+            for counter in COUNTERS:
+                record[counter] = getattr(self, counter)
+            self.callback(record)
+
+    def snapshot(self):
+        """
+        Returns the totals of each counter, the number of calls and the total
+        and largest time taken, for each type of operation.
+
+        Returns:
+        --------
+        snapshot: dict
+                  Dict of totals, keyed by name of operation.
+        """
+        return {op: dict(totals) for op, totals in self._totals.items()}
+
+    def reset(self):
+        """
+        Clears all recorded totals.
+        """
+        self._totals = {}
+
+
+def instrumented(op):
+    """
+    Decorator that records calls to a method of an object with a `stats`
+    attribute, when stats is not None.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+            stats.begin()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.end(op)
+        return wrapper
+    return decorator
@@ -0,0 +1,200 @@
+import numpy as np
+
+
+class PointStore:
+    """
+    Growable store of points shared by the trees of a forest.
+
+    Points are written into preallocated blocks of rows. Each stored point is
+    referred to by its row, and a view of the row (with a 1 x d view used as
+    the bbox of a leaf) is created once and shared by the leaves of every tree
+    holding the point. When more rows are needed, a new block is added, so that
+    existing rows never move and views remain valid. Rows of removed points are
+    reused.
+
+    Parameters:
+    -----------
+    ndim: int
+          Dimension of points.
+    capacity: int (optional) (default=1024)
+              Number of rows allocated initially.
+
+    Attributes:
+    -----------
+    ndim: int
+          Dimension of points.
+    capacity: int
+              Number of rows allocated.
+
+    Example:
+    --------
+    # Store points
+    >>> store = PointStore(2)
+    >>> row = store.add(np.array([1., 2.]))
+    >>> store.get(row)
+
+    array([1., 2.])
+
+    # Free row for reuse
+    >>> store.remove(row)
+    """
+
+    def __init__(self, ndim, capacity=1024):
+        self.ndim = ndim
+        self.capacity = 0
+        self._blocks = []
+        # View of each row and its 1 x d reshape (None if row is free)
+        self._x = []
+        self._b = []
+        # Row of each view (by id, as views are kept for the store's lifetime)
+        self._rows = {}
+        self._live = np.zeros(0, dtype=bool)
+        # Stack of free rows
+        self._free = []
+        self._grow(capacity)
+
+    def __len__(self):
+        return self.capacity - len(self._free)
+
+    def __repr__(self):
+        return "PointStore(ndim={}, points={}, capacity={})".format(
+            self.ndim, len(self), self.capacity)
+
+    def add(self, point):
+        """
+        Copies a point into a free row
+
+        Parameters:
+        -----------
+        point: np.ndarray (d)
+
+        Returns:
+        --------
+        row: int
+             Row holding point.
+        """
+        if not self._free:
+            self._grow(max(self.capacity, 1))
+        row = self._free.pop()
+        x = self._x[row]
+        x[:] = point
+        self._live[row] = True
+        return row
+
+    def add_block(self, X):
+        """
+        Adds a matrix of points as a new block of rows, without copying it.
+
+        Parameters:
+        -----------
+        X: np.ndarray (k x d)
+           Points to store. X must not be modified afterwards.
+
+        Returns:
+        --------
+        rows: np.ndarray (k)
+              Row holding each point.
+        """
+        start = self.capacity
+        self._add_block(np.asarray(X, dtype=float), free=False)
+        return np.arange(start, self.capacity)
+
+    def remove(self, row):
+        """
+        Frees a row for reuse. Views of the row must no longer be used.
+
+        Parameters:
+        -----------
+        row: int
+        """
+        if not self._live[row]:
+            raise KeyError('Row is not in use.')
+        self._live[row] = False
+        self._free.append(row)
+
+    def get(self, row):
+        """
+        Returns a view of the point in a row.
+        """
+        return self._x[row]
+
+    def get_bbox(self, row):
+        """
+        Returns a (1 x d) view of the point in a row, for use as the bbox of a
+        leaf.
+        """
+        return self._b[row]
+
+    def row_of(self, x):
+        """
+        Returns the row of a view returned by get, or None if x is not a view
+        of a row.
+        """
+        row = self._rows.get(id(x))
+        if row is not None and self._x[row] is x:
+            return row
+        return None
+
+    def rows(self):
+        """
+        Returns the rows in use.
+        """
+        return np.flatnonzero(self._live)
+
+    def to_array(self, rows=None):
+        """
+        Returns a copy of the points in rows
+
+        Parameters:
+        -----------
+        rows: sequence (optional) (default=None)
+              Rows to copy. Defaults to all rows in use.
+
+        Returns:
+        --------
+        X: np.ndarray (k x d)
+        """
+        if rows is None:
+            rows = self.rows()
+        if len(self._blocks) == 1:
+            return self._blocks[0][rows]
+        return np.concatenate(self._blocks)[rows]
+
+    def bbox(self, rows=None):
+        """
+        Computes the bounding box of the points in rows
+
+        Parameters:
+        -----------
+        rows: sequence (optional) (default=None)
+              Rows to include. Defaults to all rows in use.
+
+        Returns:
+        --------
+        bbox: np.ndarray (2 x d)
+        """
+        X = self.to_array(rows)
+        return np.vstack([X.min(axis=0), X.max(axis=0)])
+
+    def _grow(self, size):
+        """
+        Adds a block of size free rows.
+        """
+        self._add_block(np.empty((size, self.ndim), dtype=float), free=True)
+
+    def _add_block(self, block, free):
+        """
+        Adds a block of rows, creating the views of each row.
+        """
+        start = self.capacity
+        size = block.shape[0]
+        self._blocks.append(block)
+        views = list(block)
+        self._x.extend(views)
+        self._b.extend(block[:, np.newaxis, :])
+        self._rows.update((id(x), start + k) for k, x in enumerate(views))
+        self._live = np.concatenate([self._live, np.full(size, not free)])
+        if free:
+            # Rows are handed out in increasing order
+            self._free.extend(range(start + size - 1, start - 1, -1))
+        self.capacity += size
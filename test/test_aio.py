@@ -0,0 +1,64 @@
+import asyncio
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+X[90:, :] = 1
+
+
+def test_matches_forest():
+    forest = rrcf.RCForest(num_trees=6, tree_size=32, random_state=0)
+    expected = np.asarray([forest.update(point, index)
+                           for index, point in enumerate(X)])
+
+    async def main():
+        forest = rrcf.RCForest(num_trees=6, tree_size=32, random_state=0)
+        async with rrcf.AsyncDetector(forest, max_queue=2,
+                                      max_batch=30) as detector:
+            # Batches are applied in the order they are submitted
+            futures = [await detector.submit(X[start:start + 10])
+                       for start in range(0, n, 10)]
+            return np.concatenate(await asyncio.gather(*futures))
+
+    scores = asyncio.run(main())
+    assert np.allclose(scores, expected)
+
+
+def test_submit_copies():
+    forest = rrcf.RCForest(num_trees=2, random_state=0)
+
+    async def main():
+        async with rrcf.AsyncDetector(forest) as detector:
+            batch = X[:10].copy()
+            future = await detector.submit(batch)
+            # Reusing the buffer does not change the queued batch
+            batch[:] = 0
+            await future
+
+    asyncio.run(main())
+    for tree in forest:
+        for index in range(10):
+            assert np.allclose(tree.leaves[index].x, X[index])
+
+
+def test_errors():
+    async def main():
+        forest = rrcf.RCForest(num_trees=2, random_state=0)
+        async with rrcf.AsyncDetector(forest) as detector:
+            await detector.update(X[:10])
+            first = await detector.submit(X[:1], indexes=[0])
+            second = await detector.submit(X[10:20])
+            try:
+                await first
+            except KeyError:
+                pass
+            else:
+                raise AssertionError('Duplicate index should raise KeyError')
+            # Other batches of the same micro-batch are unaffected
+            assert (await second).shape == (10,)
+        assert len(forest) == 20
+
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+Z = np.copy(X)
+Z[90:, :] = 1
+
+
+def check_consistency(tree):
+    # Recompute counts and bounding boxes of every branch from its leaves
+    leaves = {}
+    for index, leaf in tree.leaves.items():
+        leaves.setdefault(leaf, []).append(index)
+    for leaf, indexes in leaves.items():
+        assert tree.count[leaf] == len(indexes)
+    for leaf in leaves:
+        node = leaf
+        point = tree.get_point(leaf)
+        while tree.parent[node] >= 0:
+            node = tree.parent[node]
+            assert (tree.bbox[node, 0] <= point).all()
+            assert (tree.bbox[node, 1] >= point).all()
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        if tree.left[node] >= 0:
+            l, r = tree.left[node], tree.right[node]
+            assert tree.count[node] == tree.count[l] + tree.count[r]
+            assert (tree.bbox[node, 0] == np.minimum(tree.bbox[l, 0],
+                                                     tree.bbox[r, 0])).all()
+            assert (tree.bbox[node, 1] == np.maximum(tree.bbox[l, 1],
+                                                     tree.bbox[r, 1])).all()
+            stack.extend([l, r])
+
+
+def test_batch_matches_rctree():
+    tree = rrcf.RCTree(X, random_state=0)
+    array_tree = rrcf.ArrayRCTree(X, random_state=0)
+    check_consistency(array_tree)
+    assert str(tree) == str(array_tree)
+    for i in range(n):
+        assert tree.codisp(i) == array_tree.codisp(i)
+        assert tree.disp(i) == array_tree.disp(i)
+
+
+def test_batch_with_duplicates():
+    tree = rrcf.ArrayRCTree(Z)
+    check_consistency(tree)
+    assert tree.count[tree.root] == n
+    for i in range(90, 100):
+        assert tree.count[tree.leaves[i]] == 10
+    # Labels may be given as a list
+    labels = ['point{}'.format(i) for i in range(n)]
+    tree = rrcf.ArrayRCTree(Z, index_labels=labels)
+    check_consistency(tree)
+    assert tree.leaves['point90'] == tree.leaves['point99']
+    assert tree.count[tree.leaves['point90']] == 10
+
+
+def test_insert_forget_matches_rctree():
+    tree = rrcf.RCTree(random_state=0)
+    array_tree = rrcf.ArrayRCTree(random_state=0, capacity=4)
+    for index, point in enumerate(Z):
+        tree.insert_point(point, index)
+        array_tree.insert_point(point, index)
+        if index >= 32:
+            tree.forget_point(index - 32)
+            array_tree.forget_point(index - 32)
+    check_consistency(array_tree)
+    assert str(tree) == str(array_tree)
+    for index in tree.leaves:
+        assert tree.codisp(index) == array_tree.codisp(index)
+        assert (tree.codisp_with_cut_dimension(index)
+                == array_tree.codisp_with_cut_dimension(index))
+    # Rows of deleted nodes are reused
+    assert array_tree.parent.size == 128
+
+
+def test_query_and_duplicates():
+    tree = rrcf.ArrayRCTree(X)
+    leaf = tree.insert_point([4., 4., 4.], index='outlier')
+    assert tree.query([4., 4., 4.] + 1e-5 * np.ones(d)) == leaf
+    assert tree.find_duplicate([4., 4., 4.]) == leaf
+    assert tree.find_duplicate([3., 3., 3.]) is None
+    assert tree.insert_point([4., 4., 4.], index='duplicate') == leaf
+    assert tree.count[leaf] == 2
+    tree.forget_point('outlier')
+    assert tree.count[leaf] == 1
+    tree.forget_point('duplicate')
+    assert 'duplicate' not in tree.leaves
+    check_consistency(tree)
+    for i in range(n):
+        tree.forget_point(i)
+    assert tree.root == -1
@@ -0,0 +1,39 @@
+import numpy as np
+import rrcf
+
+n = 300
+t = np.arange(n)
+sin = 50 * np.sin(2 * np.pi * t / 100) + 100
+sin[150:160] = 80
+
+
+def test_matches_forest_loop():
+    num_trees = 5
+    tree_size = 64
+    shingle_size = 4
+    forest = rrcf.RCForest(num_trees=num_trees, random_state=0)
+    expected = []
+    for index, point in enumerate(rrcf.shingle(sin, size=shingle_size)):
+        if len(forest) == tree_size:
+            forest.forget(index - tree_size)
+        forest.insert(point, index)
+        expected.append(forest.score(index))
+    detector = rrcf.StreamingDetector(num_trees=num_trees, tree_size=tree_size,
+                                      shingle_size=shingle_size, random_state=0)
+    # Feed values in uneven chunks, including chunks shorter than a shingle
+    chunks = np.split(sin, [1, 3, 50, 51, 200])
+    scores = list(detector.process(chunks))
+    assert [len(s) for s in scores] == [0, 0, 47, 1, 149, 100]
+    assert np.allclose(np.concatenate(scores), expected)
+    assert len(detector.forest) == tree_size
+    assert detector.index == n - shingle_size + 1
+
+
+def test_multivariate():
+    X = np.column_stack([sin, np.cos(t)])
+    detector = rrcf.StreamingDetector(num_trees=3, tree_size=16,
+                                      shingle_size=2, random_state=0)
+    scores = detector.update(X)
+    assert scores.shape == (n - 1,)
+    assert detector.forest.ndim == 4
+    assert detector.update(X[:1]).shape == (1,)
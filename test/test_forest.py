@@ -0,0 +1,359 @@
+import threading
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+X[90:, :] = 1
+
+
+def test_insert_and_score():
+    forest = rrcf.RCForest(num_trees=10, random_state=0)
+    for index, point in enumerate(X):
+        forest.insert(point, index)
+    assert len(forest) == n
+    for tree in forest:
+        assert len(tree.leaves) == n
+        assert tree.leaves[90].n == 10
+    codisp = forest.codisp(0)
+    assert codisp.shape == (10,)
+    assert forest.score(0) == codisp.mean()
+
+
+def test_matches_loop_over_trees():
+    # Forest should give the same result as a loop over seeded trees
+    forest = rrcf.RCForest(num_trees=5, random_state=0)
+    seeds = np.random.RandomState(0).randint(np.iinfo(np.int32).max, size=5)
+    trees = [rrcf.RCTree(random_state=np.random.RandomState(seed))
+             for seed in seeds]
+    for index, point in enumerate(X):
+        forest.insert(point, index)
+        for tree in trees:
+            tree.insert_point(point, index)
+    for index in range(0, n, 7):
+        expected = np.mean([tree.codisp(index) for tree in trees])
+        assert np.isclose(forest.score(index), expected)
+    for tree, forest_tree in zip(trees, forest):
+        assert str(tree) == str(forest_tree)
+
+
+def test_insert_points():
+    # Batch insertion matches a loop over insert
+    looped = rrcf.RCForest(num_trees=5, random_state=0)
+    batched = rrcf.RCForest(num_trees=5, random_state=0)
+    for index, point in enumerate(X):
+        looped.insert(point, index)
+    batched.insert_points(X[:50], range(50))
+    batched.insert_points(X[50:], range(50, n))
+    for tree, batched_tree in zip(looped, batched):
+        assert str(tree) == str(batched_tree)
+        assert batched_tree.leaves[90] is batched_tree.leaves[99]
+    assert np.allclose(batched.score_all(), looped.score_all())
+    assert len(batched.store) == len(looped.store)
+    try:
+        batched.insert_points(X[:1], [0])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('Duplicate index should raise KeyError')
+
+
+def test_insert_and_score_matches_score():
+    forest = rrcf.RCForest(num_trees=5, random_state=0)
+    scored = rrcf.RCForest(num_trees=5, random_state=0)
+    for index, point in enumerate(X):
+        forest.insert(point, index)
+        assert np.isclose(scored.insert_and_score(point, index),
+                          forest.score(index))
+
+
+def test_forget():
+    forest = rrcf.RCForest(num_trees=10, random_state=0)
+    for index, point in enumerate(X):
+        forest.insert(point, index)
+    for index in range(85, 100):
+        forest.forget(index)
+    assert len(forest) == 85
+    assert 90 not in forest
+    for tree in forest:
+        assert len(tree.leaves) == 85
+    # Duplicate bookkeeping is cleared along with the points
+    forest.insert(X[95], 100)
+    for tree in forest:
+        assert tree.leaves[100].n == 1
+
+
+def test_forget_points():
+    looped = rrcf.RCForest(num_trees=5, random_state=0)
+    batched = rrcf.RCForest(num_trees=5, random_state=0)
+    looped.insert_points(X, range(n))
+    batched.insert_points(X, range(n))
+    forgotten = list(range(0, n, 3))
+    for index in forgotten:
+        looped.forget(index)
+    batched.forget_points(forgotten)
+    for tree, batched_tree in zip(looped, batched):
+        assert str(tree) == str(batched_tree)
+    assert len(batched) == len(looped)
+    assert len(batched.store) == len(looped.store)
+    assert np.allclose(batched.score_all(), looped.score_all())
+
+
+def test_update_fifo():
+    tree_size = 32
+    forest = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0)
+    for index, point in enumerate(X):
+        score = forest.update(point, index)
+        assert score >= 0
+        assert len(forest) <= tree_size
+    assert len(forest) == tree_size
+    assert (n - tree_size) in forest
+    assert (n - tree_size - 1) not in forest
+
+
+def test_update_reservoir():
+    tree_size = 32
+    forest = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0,
+                           sampling='reservoir')
+    for index, point in enumerate(X):
+        score = forest.update(point, index)
+        assert score >= 0
+    for tree in forest:
+        assert len(tree.leaves) == tree_size
+    # Every index in the forest is held by some tree, and vice versa
+    held = set(index for tree in forest for index in tree.leaves)
+    assert held == set(forest._keys)
+    assert len(forest) > tree_size
+    # Remaining points are scored over the trees holding them
+    for index in held:
+        assert forest.score(index) >= 0
+        forest.forget(index)
+    assert len(forest) == 0
+    for tree in forest:
+        assert not tree.leaves
+
+
+def test_reservoir_insert():
+    # Points inserted without update are sampled, so later updates replace them
+    tree_size = 32
+    forest = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0,
+                           sampling='reservoir')
+    for index, point in enumerate(X[:tree_size]):
+        forest.insert(point, index)
+    for index, point in enumerate(X[tree_size:], tree_size):
+        forest.update(point, index)
+    for tree in forest:
+        assert len(tree.leaves) == tree_size
+        assert max(tree.leaves) >= tree_size
+    # Batches and constructed forests keep tree_size points per tree
+    forest = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0,
+                           sampling='reservoir')
+    forest.insert_points(X[:2 * tree_size], range(2 * tree_size))
+    assert all(len(tree.leaves) == tree_size for tree in forest)
+    assert set(forest._keys) == set(index for tree in forest
+                                    for index in tree.leaves)
+    # Replacing a point under the same index gives it a single new priority
+    index = next(iter(forest._keys))
+    forest.replace(index, X[70], index)
+    assert all(len(tree.leaves) <= tree_size for tree in forest)
+    assert all([entry[2] for entry in heap].count(index) <= 1
+               for heap in forest._heaps)
+    forest = rrcf.RCForest.from_batch(X, num_trees=10, tree_size=tree_size,
+                                      random_state=0, sampling='reservoir')
+    assert forest._time == n
+    for tree, heap in zip(forest, forest._heaps):
+        assert sorted(entry[2] for entry in heap) == sorted(tree.leaves)
+    for index, point in enumerate(X, n):
+        forest.update(point, index)
+    for tree in forest:
+        assert len(tree.leaves) == tree_size
+        assert max(tree.leaves) >= n
+
+
+def test_update_decay():
+    # With a high decay rate, trees mostly hold recent points
+    tree_size = 16
+    forest = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0,
+                           sampling='reservoir', decay=0.5)
+    uniform = rrcf.RCForest(num_trees=10, tree_size=tree_size, random_state=0,
+                            sampling='reservoir')
+    for index, point in enumerate(X):
+        forest.update(point, index)
+        uniform.update(point, index)
+    recent = np.mean([np.mean(list(tree.leaves)) for tree in forest])
+    old = np.mean([np.mean(list(tree.leaves)) for tree in uniform])
+    assert recent > n - 3 * tree_size
+    assert recent > old
+
+
+def test_replace():
+    looped = rrcf.RCForest(num_trees=5, random_state=0)
+    replaced = rrcf.RCForest(num_trees=5, random_state=0)
+    looped.insert_points(X[:20], range(20))
+    replaced.insert_points(X[:20], range(20))
+    for index in range(20, n):
+        looped.forget(index - 20)
+        looped.insert(X[index], index)
+        score = replaced.replace(index - 20, X[index], index)
+        assert np.isclose(score, looped.score(index))
+    for tree, replaced_tree in zip(looped, replaced):
+        assert str(tree) == str(replaced_tree)
+    assert len(replaced) == 20
+    assert len(replaced.store) == len(looped.store)
+
+
+def test_from_batch():
+    forest = rrcf.RCForest.from_batch(X, num_trees=20, tree_size=32,
+                                      random_state=0)
+    for tree in forest:
+        assert tree.root.n == 32
+        assert len(tree.leaves) == 32
+        for index, leaf in tree.leaves.items():
+            assert (leaf.x == np.around(X[index], 9)).all()
+    for index in range(n):
+        if index in forest:
+            assert forest.score(index) > 0
+    # Points in the shared matrix are recognized as duplicates on insert
+    forest.insert(X[95], 'duplicate')
+    for tree in forest:
+        if 95 in tree.leaves:
+            assert tree.leaves['duplicate'] is tree.leaves[95]
+
+
+def test_score_all():
+    forest = rrcf.RCForest.from_batch(X, num_trees=20, tree_size=32,
+                                      random_state=0)
+    scores = forest.score_all()
+    assert scores.shape == (len(forest),)
+    for index, score in zip(list(forest._keys), scores):
+        assert np.isclose(score, forest.score(index))
+
+
+def test_score_points():
+    forest = rrcf.RCForest(num_trees=10, random_state=0)
+    for index, point in enumerate(X):
+        forest.insert(point, index)
+    points = np.asarray([[4., 4., 4.], [1., 1., 1.]])
+    scores = forest.score_points(points, random_state=0)
+    assert len(forest) == n
+    assert scores[0] > scores[1]
+    # Duplicates are scored without drawing random cuts
+    assert forest.score_point(points[1]) == scores[1]
+    for tree in forest:
+        assert tree.root.n == n
+
+
+def test_save_load(tmp_path):
+    forest = rrcf.RCForest(num_trees=10, tree_size=50, random_state=0)
+    for index, point in enumerate(X):
+        forest.update(point, index)
+    forest.save(tmp_path / 'forest.npz')
+    loaded = rrcf.RCForest.load(tmp_path / 'forest.npz', random_state=0)
+    assert loaded.tree_size == 50
+    assert len(loaded) == len(forest)
+    for tree, loaded_tree in zip(forest, loaded):
+        assert loaded_tree.to_dict() == tree.to_dict()
+    assert np.allclose(loaded.score_all(), forest.score_all())
+    # Loaded forest keeps evicting in FIFO order and detecting duplicates
+    loaded.update(X[99], 100)
+    assert 50 not in loaded
+    assert all(tree.leaves[100] is tree.leaves[99] for tree in loaded)
+    # Empty forest
+    rrcf.RCForest(num_trees=3).save(tmp_path / 'empty.npz')
+    empty = rrcf.RCForest.load(tmp_path / 'empty.npz')
+    assert len(empty) == 0 and empty.num_trees == 3
+    empty.insert(X[0], 0)
+
+
+def test_save_load_reservoir(tmp_path):
+    forest = rrcf.RCForest(num_trees=10, tree_size=30, random_state=0,
+                           sampling='reservoir', decay=0.01)
+    for index, point in enumerate(X[:60]):
+        forest.update(point, index)
+    forest.save(tmp_path / 'forest.npz')
+    loaded = rrcf.RCForest.load(tmp_path / 'forest.npz', random_state=0)
+    assert loaded.sampling == 'reservoir' and loaded.decay == 0.01
+    assert loaded._time == forest._time
+    assert loaded._heaps == forest._heaps
+    # Sampling state is restored, so later updates keep the same points
+    for index, point in enumerate(X[60:], start=60):
+        loaded.update(point, index)
+        forest.update(point, index)
+    for tree, loaded_tree in zip(forest, loaded):
+        assert set(loaded_tree.leaves) == set(tree.leaves)
+
+
+def test_load_mmap(tmp_path):
+    forest = rrcf.RCForest.from_batch(X, num_trees=10, tree_size=50,
+                                      random_state=0)
+    forest.save(tmp_path / 'forest', mmap=True)
+    loaded = rrcf.RCForest.load(tmp_path / 'forest', mmap=True)
+    assert isinstance(loaded.trees[0].arrays['x'], np.memmap)
+    # Loading does not look up the leaves of any tree
+    assert all(tree._positions is None for tree in loaded)
+    assert loaded._holders == forest._holders
+    # Scoring reads from the mapped arrays without building trees
+    assert np.allclose(loaded.score_all(), forest.score_all())
+    index = next(iter(forest._keys))
+    assert np.allclose(loaded.codisp(index), forest.codisp(index))
+    assert not any(tree.materialized for tree in loaded)
+    # Trees are built when modified
+    touched = [index in tree.leaves for tree in loaded]
+    loaded.forget(index)
+    forest.forget(index)
+    assert [tree.materialized for tree in loaded] == touched
+    for tree, loaded_tree in zip(forest, loaded):
+        assert loaded_tree.to_dict() == tree.to_dict()
+
+
+def test_load_mmap_locking(tmp_path):
+    forest = rrcf.RCForest.from_batch(X, num_trees=10, tree_size=50,
+                                      random_state=0)
+    forest.save(tmp_path / 'forest', mmap=True)
+    loaded = rrcf.RCForest.load(tmp_path / 'forest', mmap=True)
+    loaded.enable_locking()
+    # Readers build trees while holding their lock
+    assert np.isfinite(loaded.score_point(X[0]))
+    assert all(tree.materialized for tree in loaded)
+    index = next(iter(forest._keys))
+    loaded.forget(index)
+    assert index not in loaded
+
+
+def test_stats():
+    forest = rrcf.RCForest(num_trees=10, tree_size=50, random_state=0)
+    stats = forest.enable_stats()
+    for index, point in enumerate(X):
+        forest.update(point, index)
+    snapshot = stats.snapshot()
+    # Inserts and forgets made by update are counted as part of update
+    assert list(snapshot) == ['update']
+    assert snapshot['update']['calls'] == n
+    # Each of the last 10 points is a duplicate in every tree
+    assert snapshot['update']['duplicate_hits'] == 9 * 10
+
+
+def test_locking():
+    forest = rrcf.RCForest(num_trees=4, tree_size=32, random_state=0)
+    forest.enable_locking()
+    for index, point in enumerate(X[:50]):
+        forest.update(point, index)
+    writer = threading.Thread(target=lambda: [
+        forest.update(point, index) for index, point in enumerate(X[50:], 50)])
+    writer.start()
+    # Score on demand while the writer updates the forest
+    while writer.is_alive():
+        assert forest.score_points(X[:5]).shape == (5,)
+        assert not np.isnan(forest.score_all()).any()
+        # Indices read under the lock are still in the forest when scored
+        with forest.lock.read():
+            indexes = list(forest._keys)[-5:]
+            scores = forest.score_all(indexes)
+        assert scores.shape == (5,) and not np.isnan(scores).any()
+    writer.join()
+    assert len(forest) == 32
+    forest.disable_locking()
+    assert forest.lock is None
+    assert all(tree.lock is None for tree in forest)
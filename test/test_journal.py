@@ -0,0 +1,74 @@
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+X[90:, :] = 1
+
+
+def test_recover_forest(tmp_path):
+    forest = rrcf.RCForest(num_trees=10, tree_size=40, random_state=0)
+    journal = rrcf.Journal(tmp_path, forest, checkpoint_every=30)
+    for index, point in enumerate(X[:70]):
+        journal.update(point, index)
+    journal.forget(65)
+    # Recover without closing the journal, as after a crash
+    recovered = rrcf.Journal.recover(tmp_path).target
+    assert len(recovered) == len(forest)
+    for tree, recovered_tree in zip(forest, recovered):
+        assert recovered_tree.to_dict() == tree.to_dict()
+    # Random number generators are restored, so later cuts are the same
+    for index, point in enumerate(X[70:], start=70):
+        assert recovered.update(point, index) == forest.update(point, index)
+    for tree, recovered_tree in zip(forest, recovered):
+        assert recovered_tree.to_dict() == tree.to_dict()
+
+
+def test_recover_reservoir(tmp_path):
+    forest = rrcf.RCForest(num_trees=10, tree_size=30, random_state=0,
+                           sampling='reservoir')
+    journal = rrcf.Journal(tmp_path, forest, checkpoint_every=30)
+    for index, point in enumerate(X[:70]):
+        journal.update(point, index)
+    recovered = rrcf.Journal.recover(tmp_path).target
+    assert recovered.sampling == 'reservoir'
+    for index, point in enumerate(X[70:], start=70):
+        assert recovered.update(point, index) == forest.update(point, index)
+    for tree, recovered_tree in zip(forest, recovered):
+        assert recovered_tree.to_dict() == tree.to_dict()
+
+
+def test_recover_batches(tmp_path):
+    forest = rrcf.RCForest(num_trees=10, random_state=0)
+    tree = rrcf.RCTree(random_state=0)
+    for target, directory in ((forest, tmp_path / 'forest'),
+                              (tree, tmp_path / 'tree')):
+        journal = rrcf.Journal(directory, target)
+        journal.insert_points(X[:40], range(40))
+        journal.forget_points(range(10))
+        journal.insert_and_score(X[40], 40)
+        journal.replace(40, X[41], 41)
+        recovered = rrcf.Journal.recover(directory).target
+        pairs = (zip(target, recovered) if target is forest
+                 else [(target, recovered)])
+        for expected, recovered_tree in pairs:
+            assert recovered_tree.to_dict() == expected.to_dict()
+            assert set(recovered_tree.leaves) == set(range(10, 40)) | {41}
+
+
+def test_recover_tree(tmp_path):
+    tree = rrcf.RCTree()
+    with rrcf.Journal(tmp_path, tree) as journal:
+        for index, point in enumerate(X):
+            journal.insert(point, index)
+        journal.forget(0)
+    # Drop the end of the last record, as if torn by a crash
+    path = tmp_path / 'journal'
+    path.write_bytes(path.read_bytes()[:-3])
+    journal = rrcf.Journal.recover(tmp_path)
+    assert journal.seq == n
+    assert 0 in journal.target.leaves
+    journal.target.forget_point(0)
+    assert journal.target.to_dict() == tree.to_dict()
@@ -0,0 +1,55 @@
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+X[90:, :] = 1
+
+
+def test_matches_forest():
+    forest = rrcf.RCForest(num_trees=6, tree_size=32, random_state=0)
+    expected = np.asarray([forest.update(point, index)
+                           for index, point in enumerate(X)])
+    with rrcf.ParallelRCForest(num_trees=6, tree_size=32, n_jobs=2,
+                               random_state=0) as parallel_forest:
+        scores = np.concatenate([
+            parallel_forest.update(X[start:start + 25],
+                                   range(start, start + 25))
+            for start in range(0, n, 25)])
+        assert np.allclose(scores, expected)
+        codisp = parallel_forest.codisp([n - 1, n - 2])
+        assert codisp.shape == (2, 6)
+        assert np.allclose(codisp[0], forest.codisp(n - 1))
+        parallel_forest.forget([n - 1])
+        assert np.isnan(parallel_forest.codisp([n - 1])).all()
+
+
+def test_worker_errors():
+    with rrcf.ParallelRCForest(num_trees=2, n_jobs=2) as parallel_forest:
+        parallel_forest.insert(X[:10], range(10))
+        try:
+            parallel_forest.insert(X[:1], [0])
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('Duplicate index should raise KeyError')
+        assert parallel_forest.score(range(10)).shape == (10,)
+
+
+def test_seeds():
+    # Trees in different workers draw different cuts without a random_state
+    with rrcf.ParallelRCForest(num_trees=4, n_jobs=2) as parallel_forest:
+        parallel_forest.insert(X, range(n))
+        codisp = parallel_forest.codisp(range(n))
+        assert not np.allclose(codisp[:, 0], codisp[:, 2])
+        assert not np.allclose(codisp[:, 1], codisp[:, 3])
+    # Integer seeds from numpy are accepted
+    with rrcf.ParallelRCForest(num_trees=2, n_jobs=2,
+                               random_state=np.int64(0)) as seeded, \
+            rrcf.ParallelRCForest(num_trees=2, n_jobs=2,
+                                  random_state=0) as expected:
+        seeded.insert(X, range(n))
+        expected.insert(X, range(n))
+        assert np.allclose(seeded.codisp(range(n)), expected.codisp(range(n)))
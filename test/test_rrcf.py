@@ -1,5 +1,8 @@
+import sys
 import json
+import threading
 import numpy as np
+import pytest
 import rrcf
 
 np.random.seed(0)
@@ -15,6 +18,11 @@ duplicate_tree = rrcf.RCTree(Z)
 tree_seeded = rrcf.RCTree(random_state=0)
 duplicate_tree_seeded = rrcf.RCTree(random_state=np.random.RandomState(0))
 
+def leaf_bbox(tree, branch):
+    # Compute bbox of branch from its leaves
+    points = np.vstack([leaf.x for leaf in tree.iter_leaves(branch)])
+    return np.vstack([points.min(axis=0), points.max(axis=0)])
+
 deck = np.arange(n, dtype=int)
 np.random.shuffle(deck)
 indexes = deck[:5]
@@ -28,7 +36,7 @@ def test_batch():
     for branch in branches:
         leafcount = tree._count_leaves(branch)
         assert (leafcount == branch.n)
-        bbox = tree.get_bbox(branch)
+        bbox = leaf_bbox(tree, branch)
         assert (bbox == branch.b).all()
 
 def test_codisp():
@@ -63,7 +71,7 @@ def test_forget_batch():
                 print('Computed:\n', leafcount)
                 print('Stored:\n', branch.n)
                 raise
-            bbox = tree.get_bbox(branch)
+            bbox = leaf_bbox(tree, branch)
             try:
                 assert np.allclose(bbox, branch.b)
             except:
@@ -88,7 +96,7 @@ def test_insert_batch():
                 print('Computed:\n', leafcount)
                 print('Stored:\n', branch.n)
                 raise
-            bbox = tree.get_bbox(branch)
+            bbox = leaf_bbox(tree, branch)
             try:
                 assert np.allclose(bbox, branch.b)
             except:
@@ -128,6 +136,33 @@ def test_find_duplicate():
     duplicate = duplicate_tree.find_duplicate(point)
     assert duplicate is not None
 
+def test_hash_index():
+    hashed = rrcf.RCTree(Z, random_state=0, hash_index=True)
+    plain = rrcf.RCTree(Z, random_state=0)
+    assert hashed.find_duplicate(Z[95]) is hashed.leaves[90]
+    assert hashed.find_duplicate(Z[0] + 1e-3) is None
+    # Insert and forget duplicates and new points in the same way as without
+    # an index
+    for index in range(n, 2 * n):
+        point = Z[index % n] if index % 3 else np.random.randn(d)
+        for t in (hashed, plain):
+            t.insert_point(point, index)
+            t.forget_point(index - n)
+    assert hashed.to_dict() == plain.to_dict()
+    for leaf in hashed.iter_leaves():
+        assert hashed.find_duplicate(leaf.x) is leaf
+    # Points that round to the same key are told apart
+    tree = rrcf.RCTree(precision=3, hash_index=True)
+    tree.insert_point([0., 1.], 0)
+    tree.insert_point([0., 1.0001], 1)
+    assert tree.find_duplicate([0., 1.0001]) is tree.leaves[1]
+    tree.forget_point(0)
+    assert tree.find_duplicate([0., 1.0001]) is tree.leaves[1]
+    assert tree.find_duplicate([0, 1]) is None
+    tree.disable_hash_index()
+    tree.enable_hash_index()
+    assert tree.find_duplicate([-0., 1.0001]) is tree.leaves[1]
+
 def test_forget_duplicate():
     # Forget duplicate point
     leaf = duplicate_tree.forget_point(100)
@@ -139,6 +174,29 @@ def test_shingle():
     step_0 = next(shingle)
     step_1 = next(shingle)
     assert (step_0[1] == step_1[0]).all()
+    # Shingles of an array are new arrays
+    assert not np.shares_memory(step_0, X)
+    step_0[:] = 0
+    assert (step_1[0] != 0).all()
+
+def test_shingle_array():
+    shingles = rrcf.shingle_array(X, 3)
+    assert shingles.shape == (n - 2, 3, d)
+    assert np.shares_memory(shingles, X)
+    assert not shingles.flags.writeable
+    for shingle, expected in zip(shingles, rrcf.shingle(list(X), 3)):
+        assert (shingle == expected).all()
+    strided = rrcf.shingle_array(np.arange(10), 3, stride=4)
+    assert (strided == [[0, 1, 2], [4, 5, 6]]).all()
+
+def test_shingle_chunks():
+    x = np.arange(50)
+    for size, stride in ((4, 1), (3, 2), (2, 5)):
+        expected = rrcf.shingle_array(x, size, stride=stride)
+        chunks = np.split(x, [1, 2, 9, 10, 33])
+        shingles = np.concatenate(list(rrcf.shingle_chunks(chunks, size,
+                                                           stride=stride)))
+        assert (shingles == expected).all()
 
 def test_random_state():
     # The two trees should have the exact same random-cuts
@@ -182,6 +240,47 @@ def test_from_dict():
     # Ensure we didn't drop any duplicate leaves
     assert len(tree.leaves) == num_leaves
 
+def test_save_load(tmp_path):
+    # Round trip preserves tree, including duplicates and string labels
+    labels = ['p{}'.format(i) for i in range(n)]
+    for t in (tree, duplicate_tree, rrcf.RCTree(Z, index_labels=labels)):
+        loaded = rrcf.RCTree.from_arrays(t.to_arrays())
+        assert loaded.to_dict() == t.to_dict()
+        t.save(tmp_path / 'tree.npz')
+        loaded = rrcf.RCTree.load(tmp_path / 'tree.npz')
+        assert loaded.to_dict() == t.to_dict()
+        for label in t.leaves:
+            assert loaded.codisp(label) == t.codisp(label)
+    # Loaded tree can be updated
+    loaded = rrcf.RCTree.from_arrays(tree.to_arrays())
+    loaded.forget_point(0)
+    loaded.insert_point(X[0], index=0)
+    assert len(loaded.leaves) == n
+    # Empty tree
+    assert rrcf.RCTree.from_arrays(rrcf.RCTree().to_arrays()).root is None
+    rrcf.RCTree().save(tmp_path / 'empty.npz')
+    assert rrcf.RCTree.load(tmp_path / 'empty.npz').root is None
+
+def test_stats():
+    tree = rrcf.RCTree(X, random_state=0)
+    records = []
+    stats = tree.enable_stats(callback=records.append)
+    tree.insert_point(np.full(d, 10.), index=n)
+    tree.insert_point(np.full(d, 10.), index=n + 1)
+    tree.forget_point(n + 1)
+    tree.forget_point(n)
+    snapshot = stats.snapshot()
+    assert snapshot['insert_point']['calls'] == 2
+    assert snapshot['insert_point']['duplicate_hits'] == 1
+    assert snapshot['insert_point']['bbox_updates'] >= 1
+    assert snapshot['forget_point']['calls'] == 2
+    assert [record['op'] for record in records] == ['insert_point'] * 2 + \
+        ['forget_point'] * 2
+    assert records[0]['nodes_visited'] > 0
+    tree.disable_stats()
+    tree.insert_point(np.full(d, 10.), index=n)
+    assert stats.snapshot() == snapshot
+
 def test_print():
     tree = rrcf.RCTree()
     tree.insert_point([0., 0.], index=0)
@@ -189,3 +288,199 @@ def test_print():
     tree.insert_point([0., 1.], index=3)
     print(list(tree.leaves.values())[0])
     print(tree.root)
+
+def test_iter_leaves_and_branches():
+    leaves = []
+    tree.map_leaves(tree.root, op=tree._get_nodes, stack=leaves)
+    assert leaves == list(tree.iter_leaves())
+    branches = []
+    tree.map_branches(tree.root, op=tree._get_nodes, stack=branches)
+    assert branches == list(tree.iter_branches())
+    # Every branch is yielded after the branches below it
+    seen = set()
+    for branch in tree.iter_branches():
+        for child in (branch.l, branch.r):
+            if isinstance(child, rrcf.Branch):
+                assert child in seen
+        seen.add(branch)
+
+def test_deep_tree():
+    # Exponentially shrinking points produce a degenerate tree deeper than
+    # the recursion limit used below
+    deep_tree = rrcf.RCTree(random_state=0)
+    for k in range(400):
+        deep_tree.insert_point([2.0 ** -k], index=k)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(150)
+    try:
+        assert max(leaf.d for leaf in deep_tree.leaves.values()) > 150
+        assert len(list(deep_tree.iter_leaves())) == 400
+        assert deep_tree._count_leaves(deep_tree.root) == 400
+        obj = deep_tree.to_dict()
+        loaded = rrcf.RCTree.from_dict(obj)
+        assert str(loaded) == str(deep_tree)
+        assert loaded.query([0.]) is loaded.leaves[399]
+    finally:
+        sys.setrecursionlimit(limit)
+
+def test_codisp_all():
+    for t in (tree, duplicate_tree):
+        codisp = t.codisp_all()
+        expected = [t.codisp(i) for i in t.leaves]
+        assert np.allclose(codisp, expected)
+    subset = [3, 1, 2]
+    assert np.allclose(duplicate_tree.codisp_all(subset),
+                       [duplicate_tree.codisp(i) for i in subset])
+    single = rrcf.RCTree()
+    single.insert_point([0., 0.], index=0)
+    assert (single.codisp_all() == 0).all()
+
+def test_score_point():
+    # Scoring with the same random cuts as insertion gives the same result
+    for point in ([4., 4., 4.], [0., 0., 0.], [1., 1., 1.]):
+        scored = rrcf.RCTree(Z, random_state=1)
+        inserted = rrcf.RCTree(Z, random_state=1)
+        before = scored.to_dict()
+        state = np.random.RandomState(2)
+        score = scored.score_point(point, random_state=state)
+        assert scored.to_dict() == before
+        inserted.rng = np.random.RandomState(2)
+        inserted.insert_point(point, index='new')
+        assert score == inserted.codisp('new')
+    assert rrcf.RCTree().score_point([0., 0.]) == 0
+    # Scoring with the default generator leaves later inserts unchanged
+    scored = rrcf.RCTree(Z, random_state=1)
+    inserted = rrcf.RCTree(Z, random_state=1)
+    scored.score_point([4., 4., 4.])
+    scored.insert_point([3., 3., 3.], index='new')
+    inserted.insert_point([3., 3., 3.], index='new')
+    assert scored.to_dict() == inserted.to_dict()
+    # Trees sharing np.random are scored with different cuts
+    first, second = rrcf.RCTree(), rrcf.RCTree()
+    assert first._score_rng.randint(10**9) != second._score_rng.randint(10**9)
+
+def test_insert_points():
+    # Batch insertion gives the same tree and random state as a loop
+    batch = np.vstack([np.random.randn(50, d), Z[85:95]])
+    for hash_index in (False, True):
+        looped = rrcf.RCTree(Z, random_state=0, hash_index=hash_index)
+        batched = rrcf.RCTree(Z, random_state=0, hash_index=hash_index)
+        for index, point in enumerate(batch, n):
+            looped.insert_point(point, index)
+        leaves = batched.insert_points(batch, range(n, n + len(batch)))
+        assert str(batched) == str(looped)
+        assert batched.rng.randint(1000) == looped.rng.randint(1000)
+        assert leaves[-1] is batched.leaves[90]
+        for branch in batched.iter_branches():
+            assert branch.n == batched._count_leaves(branch)
+            assert np.allclose(branch.b, leaf_bbox(batched, branch))
+    empty = rrcf.RCTree(random_state=0)
+    empty.insert_points(batch, range(len(batch)))
+    assert len(empty.leaves) == len(batch)
+    with pytest.raises(KeyError):
+        empty.insert_points(batch[:2], [0, 100])
+    with pytest.raises(ValueError):
+        empty.insert_points([[np.nan] * d], [100])
+    assert 100 not in empty.leaves
+    # Blocks of random numbers are capped, and refilled as needed
+    looped = rrcf.RCTree(random_state=0)
+    batched = rrcf.RCTree(random_state=0)
+    big = np.random.randn(3000, d)
+    for index, point in enumerate(big):
+        looped.insert_point(point, index)
+    batched.insert_points(big, range(len(big)))
+    assert str(batched) == str(looped)
+    assert batched.rng.randint(1000) == looped.rng.randint(1000)
+
+def test_forget_points():
+    # Batch deletion gives the same tree as a loop, for small batches and
+    # for batches that recompute every bbox
+    for forgotten in ([3, 90, 17, 95], list(range(80, 100)) + [0, 5]):
+        looped = rrcf.RCTree(Z, random_state=0, hash_index=True)
+        batched = rrcf.RCTree(Z, random_state=0, hash_index=True)
+        for index in forgotten:
+            looped.forget_point(index)
+        leaves = batched.forget_points(forgotten)
+        assert str(batched) == str(looped)
+        assert len(leaves) == len(forgotten)
+        assert forgotten[0] not in batched.leaves
+        for branch in batched.iter_branches():
+            assert branch.n == batched._count_leaves(branch)
+            assert np.allclose(branch.b, leaf_bbox(batched, branch))
+        assert batched.find_duplicate(Z[forgotten[0]]) is None
+    with pytest.raises(KeyError):
+        batched.forget_points([1, 0])
+    assert 1 in batched.leaves
+    batched.forget_points(list(batched.leaves))
+    assert batched.root is None
+
+def test_insert_and_score():
+    # Score computed while inserting matches codisp after inserting
+    looped = rrcf.RCTree(random_state=0)
+    scored = rrcf.RCTree(random_state=0)
+    for index, point in enumerate(Z):
+        looped.insert_point(point, index)
+        assert scored.insert_and_score(point, index) == looped.codisp(index)
+    assert str(scored) == str(looped)
+
+def test_replace_point():
+    # Replacing gives the same tree as forgetting and then inserting
+    looped = rrcf.RCTree(Z[:20], random_state=0)
+    replaced = rrcf.RCTree(Z[:20], random_state=0)
+    for index in range(20, n):
+        looped.forget_point(index - 20)
+        looped.insert_point(Z[index], index)
+        leaf = replaced.replace_point(index - 20, Z[index], index)
+        assert leaf is replaced.leaves[index]
+        assert str(replaced) == str(looped)
+    for branch in replaced.iter_branches():
+        assert branch.n == replaced._count_leaves(branch)
+        assert np.allclose(branch.b, leaf_bbox(replaced, branch))
+    # The tree is unchanged if validation fails
+    with pytest.raises(KeyError):
+        replaced.replace_point(0, Z[0], n - 1)
+    with pytest.raises(ValueError):
+        replaced.replace_point(n - 1, [0., 0.], n)
+    assert n - 1 in replaced.leaves
+    single = rrcf.RCTree()
+    single.insert_point([0., 0.], index=0)
+    single.replace_point(0, [1., 1.], 0)
+    assert np.array_equal(single.root.x, [1., 1.])
+
+def test_locking():
+    locked = rrcf.RCTree(X, random_state=0)
+    lock = locked.enable_locking()
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                with lock.read():
+                    # Counts and leaves agree under a read lock
+                    assert locked.root.n == sum(
+                        leaf.n for leaf in locked.leaves.values())
+                    assert locked.codisp_all().shape == (len(locked.leaves),)
+                    locked.score_point(np.zeros(d))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for index in range(n, 3 * n):
+        locked.insert_point(np.random.randn(d), index=index)
+        locked.forget_point(index - n)
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert len(locked.leaves) == n
+    # Writers may also read, and readers may not write
+    with lock.write():
+        assert locked.codisp(2 * n) > 0
+    with lock.read():
+        with pytest.raises(RuntimeError):
+            locked.forget_point(2 * n)
+    locked.disable_locking()
+    assert locked.lock is None
@@ -0,0 +1,51 @@
+import numpy as np
+import rrcf
+
+np.random.seed(0)
+n = 100
+d = 3
+X = np.random.randn(n, d)
+X[90:, :] = 1
+
+
+def test_add_remove():
+    store = rrcf.PointStore(d, capacity=4)
+    rows = [store.add(point) for point in X[:10]]
+    assert store.capacity >= 10
+    assert len(store) == 10
+    # Views remain valid after the store grows
+    assert np.array_equal(store.get(rows[0]), X[0])
+    assert np.array_equal(store.to_array(), X[:10])
+    assert store.get_bbox(rows[1]).shape == (1, d)
+    assert store.row_of(store.get(rows[3])) == rows[3]
+    assert store.row_of(X[3]) is None
+    store.remove(rows[3])
+    assert len(store) == 9
+    # Free rows are reused
+    assert store.add(X[10]) == rows[3]
+    # Row of X[3] now holds X[10]
+    live = np.delete(X[:11], 3, axis=0)
+    assert np.array_equal(store.bbox(), np.vstack([live.min(axis=0),
+                                                   live.max(axis=0)]))
+
+
+def test_forest_store():
+    forest = rrcf.RCForest(num_trees=10, tree_size=50, random_state=0)
+    for index, point in enumerate(X):
+        forest.update(point, index)
+        # Leaves of all trees share the row of each point
+        leaves = [tree.leaves[index] for tree in forest]
+        assert all(leaf.x is leaves[0].x or leaf.n > 1 for leaf in leaves)
+    # Only rows referenced by leaves are kept
+    live = {id(leaf.x) for tree in forest for leaf in tree.leaves.values()}
+    assert len(forest.store) == len(live)
+    assert forest.store.capacity <= 64
+    for tree in forest:
+        for index, leaf in tree.leaves.items():
+            assert np.array_equal(leaf.x, X[index])
+    forest = rrcf.RCForest.from_batch(X, num_trees=10, tree_size=50,
+                                      random_state=0)
+    for tree in forest:
+        for index, leaf in tree.leaves.items():
+            assert forest.store.row_of(leaf.x) is not None
+            assert np.array_equal(leaf.x, np.around(X[index], 9))